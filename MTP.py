@@ -11,6 +11,7 @@ import numpy as np
 m = Model("supply_chain_resilience")
 
 # Example: Parameters (normally, these would come from data)
+debug = False  # Print every variable value after the solve
 num_products = 3
 num_stages = 3
 holding_costs = [0.5, 0.6, 0.7]  # Per product
@@ -41,9 +42,10 @@ for i in range(num_products):
 # Solve the model
 m.optimize()
 
-# Print the solution
-for v in m.getVars():
-    print(f'{v.varName}: {v.x}')
+# Print the solution (every variable only in debug mode)
+if debug:
+    for v in m.getVars():
+        print(f'{v.varName}: {v.x}')
 
 # Total cost
 print(f'Total Cost: {m.objVal}')
@@ -57,6 +59,7 @@ from gurobipy import Model, GRB
 m = Model("supply_chain_resilience")
 
 # Example: Parameters
+debug = False  # Print every variable value after the solve
 num_products = 3  # Number of products
 num_stages = 3    # Number of stages in the supply chain
 holding_costs = [0.5, 0.6, 0.7]  # Holding cost per product
@@ -99,9 +102,10 @@ for i in range(num_products):
 # Solve the model
 m.optimize()
 
-# Output results
-for v in m.getVars():
-    print(f'{v.varName}: {v.x}')
+# Output results (every variable only in debug mode)
+if debug:
+    for v in m.getVars():
+        print(f'{v.varName}: {v.x}')
 print(f'Total Expected Cost: {m.objVal}')
 
 
@@ -117,6 +121,7 @@ print(f'Total Expected Cost: {m.objVal}')
 from gurobipy import *
 
 # Parameters
+debug = False  # Print every variable value after the solve
 num_products = 3
 num_stages = 3
 
@@ -179,8 +184,9 @@ m.optimize()
 # Print the results
 if m.status == GRB.OPTIMAL:
     print("Optimal solution found!")
-    for var in m.getVars():
-        print(f"{var.varName}: {var.x}")
+    if debug:
+        for var in m.getVars():
+            print(f"{var.varName}: {var.x}")
     print(f"Total Cost: {m.objVal}")
 else:
     print("No optimal solution found.")
@@ -192,6 +198,7 @@ else:
 from gurobipy import *
 
 # Parameters
+debug = False  # Print every variable value after the solve
 num_products = 3
 num_stages = 3
 
@@ -258,8 +265,9 @@ m.optimize()
 # Print the results
 if m.status == GRB.OPTIMAL:
     print("Optimal solution found!")
-    for var in m.getVars():
-        print(f"{var.varName}: {var.x}")
+    if debug:
+        for var in m.getVars():
+            print(f"{var.varName}: {var.x}")
     print(f"Total Cost: {m.objVal}")
 else:
     print("No optimal solution found.")
@@ -271,6 +279,7 @@ else:
 from gurobipy import *
 
 # Parameters
+debug = False  # Print every variable value after the solve
 num_products = 3
 num_stages = 3
 num_suppliers = 2  # Main and backup supplier
@@ -343,8 +352,9 @@ m.optimize()
 # Print the results
 if m.status == GRB.OPTIMAL:
     print("Optimal solution found!")
-    for var in m.getVars():
-        print(f"{var.varName}: {var.x}")
+    if debug:
+        for var in m.getVars():
+            print(f"{var.varName}: {var.x}")
     print(f"Total Cost: {m.objVal}")
 else:
     print("No optimal solution found.")
@@ -356,6 +366,7 @@ else:
 from gurobipy import *
 
 # Parameters
+debug = False  # Print every variable value after the solve
 num_products = 3
 num_stages = 3
 num_suppliers = 2  # Main and backup supplier
@@ -431,8 +442,9 @@ m.optimize()
 # Print the results
 if m.status == GRB.OPTIMAL:
     print("Optimal solution found!")
-    for var in m.getVars():
-        print(f"{var.varName}: {var.x}")
+    if debug:
+        for var in m.getVars():
+            print(f"{var.varName}: {var.x}")
     print(f"Total Cost: {m.objVal}")
 else:
     print("No optimal solution found.")
@@ -451,6 +463,7 @@ from gurobipy import *
 import random
 
 # Parameters
+debug = False  # Print every variable value after the solve
 num_products = 3
 num_stages = 3
 num_suppliers = 2  # Main and backup supplier
@@ -533,8 +546,9 @@ m.optimize()
 # Print the results
 if m.status == GRB.OPTIMAL:
     print("Optimal solution found!")
-    for var in m.getVars():
-        print(f"{var.varName}: {var.x}")
+    if debug:
+        for var in m.getVars():
+            print(f"{var.varName}: {var.x}")
     print(f"Total Cost: {m.objVal}")
 else:
     print("No optimal solution found.")
@@ -547,6 +561,7 @@ from gurobipy import *
 import random
 
 # Parameters
+debug = False  # Print every variable value after the solve
 num_products = 3
 num_stages = 3
 num_suppliers = 2
@@ -601,7 +616,7 @@ carbon_emissions += quicksum(additional_orders[p, t, s, r, ds, dp] * carbon_emis
 # Multi-objective
 m.ModelSense = GRB.MINIMIZE
 m.setObjectiveN(total_cost, 0, priority=1)
-m.setObjectiveN(carbon_emissions, 1, priority=0).
+m.setObjectiveN(carbon_emissions, 1, priority=0)
 
 # Constraints
 # Capacity constraints for distribution centers
@@ -634,8 +649,9 @@ m.optimize()
 # Print the results
 if m.status == GRB.OPTIMAL:
     print("Optimal solution found!")
-    for var in m.getVars():
-        print(f"{var.varName}: {var.x}")
+    if debug:
+        for var in m.getVars():
+            print(f"{var.varName}: {var.x}")
     print(f"Total Cost: {m.objVal}")
     print(f"Total Carbon Emissions: {carbon_emissions.getValue()}")
 else:
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Scaling benchmark for the MTP.py formulations.
+#
+# Sweeps the instance dimensions of generate_instance over a grid and runs
+# every point in a fresh process, so peak RSS belongs to that point alone.
+# Each point records generation, model-build and solve time, peak RSS and
+# the variable/constraint counts as one JSON line in the results file.
+#
+#   python benchmark.py --formulation in18 --products 10 50 100 --demand-scenarios 3 10
+#   python benchmark.py --formulation in20 --builder loop matrix sparse --no-solve
+
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import platform
+import time
+
+from instances import generate_instance
+from matrix_builder import build_loop_model, build_matrix_model
+from sparse_lp import build_sparse_lp, gurobi_status, solve as solve_lp
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DIMENSIONS = ('num_products', 'num_stages', 'num_suppliers', 'num_retailers', 'num_distribution_centers',
+              'num_demand_scenarios', 'num_disruption_scenarios')
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if platform.system() == 'Darwin' else peak / 1024
+
+
+def run_point(formulation, sizes, builder='sparse', backend='highs', solve=True, seed=0):
+    # The loop and matrix builders produce gurobipy models, which always solve with Gurobi
+    if builder != 'sparse':
+        backend = 'gurobi'
+    row = {'formulation': formulation, 'builder': builder, 'backend': backend if solve else None, 'seed': seed}
+    row.update(sizes)
+
+    start = time.perf_counter()
+    instance = generate_instance(formulation, seed=seed, **sizes)
+    row['generate_seconds'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if builder == 'sparse':
+        model = build_sparse_lp(instance, formulation)
+        row['num_vars'], row['num_constrs'], row['num_nonzeros'] = model.num_vars, model.num_constrs, model.A.nnz
+    else:
+        model = build_loop_model(instance, formulation) if builder == 'loop' else build_matrix_model(instance, formulation)[0]
+        model.update()
+        row['num_vars'], row['num_constrs'], row['num_nonzeros'] = model.NumVars, model.NumConstrs, model.NumNZs
+    row['build_seconds'] = time.perf_counter() - start
+
+    if solve:
+        start = time.perf_counter()
+        if builder == 'sparse':
+            result = solve_lp(model, backend)
+            row['status'], row['objective'] = result['status'], result['objective']
+        else:
+            model.Params.OutputFlag = 0
+            model.optimize()
+            row['status'], row['objective'] = gurobi_status(model.Status), model.ObjVal if model.SolCount else None
+        row['solve_seconds'] = time.perf_counter() - start
+    row['peak_rss_mb'] = _peak_rss_mb()
+    return row
+
+
+def _child(queue, *args):
+    try:
+        queue.put(run_point(*args))
+    except Exception as error:  # recorded as a failed point, the sweep goes on
+        queue.put({'error': repr(error)})
+
+
+def sweep(formulation, grid, builders=('sparse',), backend='highs', solve=True, seed=0, results='benchmark_results.jsonl',
+          timeout=None, verbose=True):
+    # grid: {dimension: [values]}; unspecified dimensions keep the generator defaults
+    names = list(grid)
+    rows = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        sizes = dict(zip(names, values))
+        for builder in builders:
+            queue = mp.Queue()
+            process = mp.Process(target=_child, args=(queue, formulation, sizes, builder, backend, solve, seed))
+            process.start()
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                row = {'error': 'timeout after %s s' % timeout}
+            else:
+                row = queue.get() if not queue.empty() else {'error': 'exit code %s' % process.exitcode}
+            if 'error' in row:
+                row.update({'formulation': formulation, 'builder': builder, 'seed': seed}, **sizes)
+            row['timestamp'] = time.time()
+            rows.append(row)
+            with open(results, 'a') as f:
+                f.write(json.dumps(row) + '\n')
+            if verbose:
+                print(json.dumps(row))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scaling benchmark for the MTP.py formulations')
+    parser.add_argument('--formulation', default='in18')
+    parser.add_argument('--builder', nargs='+', default=['sparse'], choices=['loop', 'matrix', 'sparse'])
+    parser.add_argument('--backend', default='highs', choices=['highs', 'gurobi'])
+    parser.add_argument('--no-solve', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=None)
+    parser.add_argument('--results', default='benchmark_results.jsonl')
+    for name in DIMENSIONS:
+        parser.add_argument('--' + name[4:].replace('_', '-'), dest=name, type=int, nargs='+')
+    args = parser.parse_args()
+    grid = {name: getattr(args, name) for name in DIMENSIONS if getattr(args, name)}
+    sweep(args.formulation, grid, args.builder, args.backend, not args.no_solve, args.seed, args.results, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
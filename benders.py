@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Benders (L-shaped) decomposition of the two-stage MTP.py models.
+#
+# initial_orders (and the DC inventory of In[20]) are the first-stage
+# decisions; additional_orders and inventory_levels are recourse variables
+# with one copy per (demand scenario, disruption scenario). The master keeps
+# the first-stage rows plus optimality cuts, the recourse subproblems are
+# solved per scenario in a ScenarioPool and only their cut data comes back.
+#
+# Cuts are kept as sparse (row, column, value) triplets over the scenario's
+# nonzero subgradient entries. With master_backend='gurobi' the master is
+# one persistent model: each iteration appends its cut rows in place and
+# the dual simplex restarts from the previous basis. The HiGHS master
+# (scipy's linprog has no warm start) is reassembled from the triplets.
+# The cells have complete recourse (orders are unbounded); a subproblem that
+# is not solved to optimality raises RecourseError naming its scenario.
+
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from instances import INSTANCES
+from scenario_pool import ScenarioPool
+from sparse_lp import SparseLP, build_sparse_lp, solve, solve_highs
+
+FIRST_STAGE = ('DCInventory', 'InitialOrders')
+
+
+class RecourseError(RuntimeError):
+
+    def __init__(self, scenario, status):
+        super().__init__(scenario, status)
+        self.scenario, self.status = scenario, status
+
+    def __str__(self):
+        return ('Recourse subproblem of scenario %d (demand scenario %d, disruption scenario %d) not solved to '
+                'optimality at the master solution: %s' % (tuple(self.scenario) + (self.status,)))
+
+
+def split_stages(lp, first_stage=FIRST_STAGE):
+    # Master columns/rows and one recourse subproblem per scenario.
+    # Recourse groups carry (ds, dp) as their last two axes, so column j belongs
+    # to scenario j % (num_demand * num_disruption) within its group.
+    first_cols, recourse_cols, recourse_scenario = [], [], []
+    num_scenarios = num_disruption = None
+    for group, shape, start in lp.columns:
+        cols = np.arange(start, start + int(np.prod(shape)))
+        if group in first_stage:
+            first_cols.append(cols)
+        else:
+            num_scenarios, num_disruption = shape[-2] * shape[-1], shape[-1]
+            recourse_cols.append(cols)
+            recourse_scenario.append((cols - start) % num_scenarios)
+    first_cols = np.concatenate(first_cols)
+    recourse_cols = np.concatenate(recourse_cols)
+    recourse_scenario = np.concatenate(recourse_scenario)
+
+    scenario_of_col = np.full(lp.num_vars, -1)
+    scenario_of_col[recourse_cols] = recourse_scenario
+    A = lp.A.tocsr()
+    row_scenario = np.full(lp.num_constrs, -1)
+    touched = scenario_of_col[A.indices]
+    row_of_entry = np.repeat(np.arange(lp.num_constrs), np.diff(A.indptr))
+    row_scenario[row_of_entry[touched >= 0]] = touched[touched >= 0]
+
+    master_rows = np.flatnonzero(row_scenario < 0)
+    master = {
+        'A': A[master_rows][:, first_cols], 'sense': lp.sense[master_rows], 'rhs': lp.rhs[master_rows],
+        'c': lp.c[first_cols], 'lb': lp.lb[first_cols], 'ub': lp.ub[first_cols], 'cols': first_cols,
+    }
+    subproblems = []
+    for k in range(num_scenarios):
+        rows = np.flatnonzero(row_scenario == k)
+        cols = recourse_cols[recourse_scenario == k]
+        block = A[rows]
+        subproblems.append({
+            'W': block[:, cols], 'T': block[:, first_cols], 'sense': lp.sense[rows], 'h': lp.rhs[rows],
+            'q': lp.c[cols], 'lb': lp.lb[cols], 'ub': lp.ub[cols], 'cols': cols,
+            'scenario': (k,) + divmod(k, num_disruption),
+        })
+    return master, subproblems
+
+
+class RecourseSolver:
+    # One scenario's recourse LP: min q y  s.t.  W y (sense) h - T x,  lb <= y <= ub.
+    # With the gurobi backend the model is built once and only its RHS changes,
+    # so every re-solve starts from the previous basis (warm_start=False resets it).
+
+    def __init__(self, subproblem, backend='highs', warm_start=True, threads=1):
+        self.subproblem = subproblem
+        self.backend = backend
+        self.warm_start = warm_start
+        if backend == 'gurobi':
+            from gurobipy import GRB, Model
+
+            self.m = Model()
+            self.m.Params.OutputFlag = 0
+            self.m.Params.Threads = threads
+            self.y = self.m.addMVar(subproblem['q'].size, lb=subproblem['lb'], ub=subproblem['ub'], obj=subproblem['q'],
+                                    vtype=GRB.CONTINUOUS, name='y')
+            self.constrs = self.m.addMConstr(subproblem['W'], self.y, subproblem['sense'], subproblem['h'])
+            self.optimal = GRB.OPTIMAL
+
+    def cut(self, x):
+        # Q(x) and its subgradient -T' pi
+        sub = self.subproblem
+        rhs = sub['h'] - sub['T'] @ x
+        if self.backend == 'gurobi':
+            self.constrs.RHS = rhs
+            if not self.warm_start:
+                self.m.reset()
+            self.m.optimize()
+            if self.m.Status != self.optimal:
+                raise RecourseError(sub['scenario'], 'Gurobi status %d' % self.m.Status)
+            value, pi, iterations = self.m.ObjVal, self.constrs.Pi, self.m.IterCount
+        else:
+            result = solve_highs(SparseLP(sub['W'], sub['sense'], rhs, sub['q'], sub['lb'], sub['ub']))
+            if result['status'] != 'optimal':
+                raise RecourseError(sub['scenario'], result['status'])
+            value, pi, iterations = result['objective'], result['duals'], None
+        return value, -(sub['T'].T @ pi), iterations
+
+    def recourse(self, x):
+        # Recourse values at x (after cut(x) for the gurobi backend)
+        if self.backend == 'gurobi':
+            return self.y.X
+        sub = self.subproblem
+        return solve_highs(SparseLP(sub['W'], sub['sense'], sub['h'] - sub['T'] @ x, sub['q'], sub['lb'], sub['ub']))['x']
+
+
+class _Master:
+    # min c x + sum(theta)  s.t.  first-stage rows, cuts  theta_k - g' x >= rhs, over [x, theta]
+
+    def __init__(self, master, num_theta, theta_lb, backend):
+        self.master, self.num_theta, self.backend = master, num_theta, backend
+        num_first = master['c'].size
+        self.num_columns = num_first + num_theta
+        self.lb = np.concatenate([master['lb'], np.full(num_theta, theta_lb)])
+        self.ub = np.concatenate([master['ub'], np.full(num_theta, np.inf)])
+        self.c = np.concatenate([master['c'], np.ones(num_theta)])
+        self.rows, self.cols, self.values, self.rhs = [], [], [], []
+        self.num_cuts = 0
+        if backend == 'gurobi':
+            from gurobipy import GRB, Model
+
+            self.m = Model()
+            self.m.Params.OutputFlag = 0
+            self.m.Params.Method = 1     # dual simplex: the previous basis stays dual feasible as cuts are added
+            self.v = self.m.addMVar(self.num_columns, lb=self.lb, ub=self.ub, obj=self.c, vtype=GRB.CONTINUOUS)
+            A = sp.hstack([master['A'], sp.csr_matrix((master['A'].shape[0], num_theta))], format='csr')
+            self.m.addMConstr(A, self.v, master['sense'], master['rhs'])
+            self.optimal = GRB.OPTIMAL
+
+    def add_cuts(self, rows, cols, values, rhs):
+        # Cut triplets with rows numbered 0..len(rhs)-1 within this batch
+        if not len(rhs):
+            return
+        if self.backend == 'gurobi':
+            batch = sp.csr_matrix((values, (rows, cols)), shape=(len(rhs), self.num_columns))
+            self.m.addMConstr(batch, self.v, '>', np.asarray(rhs))
+        else:
+            self.rows.append(rows + self.num_cuts)
+            self.cols.append(cols)
+            self.values.append(values)
+            self.rhs.append(np.asarray(rhs))
+        self.num_cuts += len(rhs)
+
+    def solve(self):
+        # -> (objective, [x, theta])
+        if self.backend == 'gurobi':
+            self.m.optimize()
+            if self.m.Status != self.optimal:
+                raise RuntimeError('Benders master not solved to optimality (status %d)' % self.m.Status)
+            return self.m.ObjVal, self.v.X
+        master = self.master
+        A = sp.hstack([master['A'], sp.csr_matrix((master['A'].shape[0], self.num_theta))], format='csr')
+        if self.num_cuts:
+            cuts = sp.csr_matrix((np.concatenate(self.values), (np.concatenate(self.rows), np.concatenate(self.cols))),
+                                 shape=(self.num_cuts, self.num_columns))
+            A = sp.vstack([A, cuts], format='csr')
+        result = solve(SparseLP(A, np.concatenate([master['sense'], np.full(self.num_cuts, '>')]),
+                                np.concatenate([master['rhs']] + self.rhs), self.c, self.lb, self.ub), self.backend)
+        if result['status'] != 'optimal':
+            raise RuntimeError('Benders master not solved to optimality: %s' % result['status'])
+        return result['objective'], result['x']
+
+
+def solve_benders(lp, multi_cut=True, backend='highs', master_backend='highs', processes=None, warm_start=True,
+                  tolerance=1e-6, max_iterations=200, verbose=False):
+    master, subproblems = split_stages(lp)
+    num_first, num_scenarios = master['c'].size, len(subproblems)
+    num_theta = num_scenarios if multi_cut else 1
+    # Recourse costs are nonnegative on nonnegative variables, so Q >= 0 is a valid start bound
+    bounded_below = all((sub['q'] >= 0).all() and (sub['lb'] >= 0).all() for sub in subproblems)
+    theta_lb = 0.0 if bounded_below else -1e9
+
+    problem = _Master(master, num_theta, theta_lb, master_backend)
+    history = []
+    start = time.perf_counter()
+    with ScenarioPool(RecourseSolver, subproblems, processes, backend=backend, warm_start=warm_start) as pool:
+        upper, x_best = np.inf, None
+        for iteration in range(1, max_iterations + 1):
+            iteration_start = time.perf_counter()
+            # Master: first-stage rows plus all cuts so far
+            lower, solution = problem.solve()
+            x, theta = solution[:num_first], solution[num_first:]
+
+            # Recourse subproblems at x, concurrently
+            cuts = pool.map('cut', x)
+            values = np.array([value for value, _, _ in cuts])
+            candidate = master['c'] @ x + values.sum()
+            if candidate < upper:
+                upper, x_best = candidate, x
+            iterations = [it for _, _, it in cuts if it is not None]
+            history.append({'iteration': iteration, 'lower': lower, 'upper': upper,
+                            'seconds': time.perf_counter() - iteration_start,
+                            'subproblem_iterations': int(np.sum(iterations)) if iterations else None})
+            if verbose:
+                print(history[-1])
+            if upper - lower <= tolerance * max(1.0, abs(upper)):
+                break
+
+            # Optimality cuts: theta_k - g_k' x >= Q_k(x) - g_k' x, over the nonzero entries of g_k
+            if multi_cut:
+                violated = np.flatnonzero(values > theta + tolerance * max(1.0, abs(values).max()))
+                gradients = [cuts[k][1] for k in violated]
+                thetas = violated
+            else:
+                gradients = [np.sum([gradient for _, gradient, _ in cuts], axis=0)]
+                thetas = np.zeros(1, dtype=int)
+                values = np.array([values.sum()])
+                violated = np.zeros(1, dtype=int)
+            rows, cols, entries, rhs = [], [], [], []
+            for row, (k, gradient, theta_index) in enumerate(zip(violated, gradients, thetas)):
+                support = np.flatnonzero(gradient)
+                rows.append(np.full(support.size + 1, row))
+                cols.append(np.append(support, num_first + theta_index))
+                entries.append(np.append(-gradient[support], 1.0))
+                rhs.append(values[k] - gradient[support] @ x[support])
+            if rows:
+                problem.add_cuts(np.concatenate(rows), np.concatenate(cols), np.concatenate(entries), rhs)
+
+    first_stage = np.zeros(lp.num_vars)
+    first_stage[master['cols']] = x_best
+    return {
+        'objective': upper,
+        'lower_bound': lower,
+        'first_stage': {group: values for group, values in lp.unpack(first_stage).items() if group in FIRST_STAGE},
+        'iterations': len(history),
+        'num_cuts': problem.num_cuts,
+        'seconds': time.perf_counter() - start,
+        'history': history,
+    }
+
+
+if __name__ == "__main__":
+    for formulation in ('in11', 'in18', 'in20'):
+        lp = build_sparse_lp(INSTANCES[formulation](seed=0) if formulation == 'in20' else INSTANCES[formulation](), formulation)
+        extensive = solve(lp)['objective']
+        for multi_cut in (True, False):
+            for master_backend in ('highs', 'gurobi'):
+                result = solve_benders(lp, multi_cut=multi_cut, master_backend=master_backend, processes=2)
+                print(formulation, 'multi-cut' if multi_cut else 'single-cut', master_backend, 'master, Benders:',
+                      result['objective'], 'extensive form:', extensive, 'iterations:', result['iterations'],
+                      'cuts:', result['num_cuts'])
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Block-structure detection and block-wise solves.
+#
+# No constraint of In[10]/In[11]/In[17]/In[18] involves two products, so
+# their LP is block diagonal with one block per product; in In[20]/In[4]
+# the products are tied together only by the CapacityDC rows. The blocks
+# are the connected components of the row/column incidence graph of A
+# (optionally with linking row groups left out). Components are packed into
+# bins of similar size, the bins are solved concurrently in a ScenarioPool
+# and the solutions merged back into full-size x / duals / reduced costs.
+# (In[20]'s DCInventory appears only in CapacityDC, so those rows form
+# blocks of their own and In[20]/In[4] split per product as well.)
+#
+# With linking rows (e.g. a capacity shared by all products), solve_lagrangian prices them instead: the rows are
+# dualised with multipliers, the blocks solve independently under the
+# adjusted costs (each pricing round gives a Lagrangian lower bound), and
+# the multipliers are re-set from a small restricted master over all block
+# solutions so far, whose optimum is also the primal solution.
+
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+from instances import INSTANCES
+from scenario_pool import ScenarioPool
+from sparse_lp import SparseLP, build_sparse_lp, gurobi_status, solve
+
+
+def _row_mask(lp, exclude):
+    mask = np.ones(lp.num_constrs, dtype=bool)
+    for name, start, stop in lp.rows:
+        if name in exclude:
+            mask[start:stop] = False
+    return mask
+
+
+def detect_blocks(lp, exclude=()):
+    # Connected components of the bipartite row/column graph, ignoring the row groups in exclude.
+    # Returns (column labels, row labels, number of blocks); excluded rows are labelled -1.
+    keep = _row_mask(lp, exclude)
+    A = lp.A.tocsr()[keep]
+    num_rows, num_vars = A.shape
+    incidence = sp.csr_matrix((np.ones(A.nnz), A.indices, A.indptr), shape=A.shape)
+    graph = sp.bmat([[None, incidence], [incidence.T, None]], format='csr')
+    num_blocks, labels = connected_components(graph, directed=False)
+    column_labels = labels[num_rows:]
+    row_labels = np.full(lp.num_constrs, -1)
+    row_labels[keep] = labels[:num_rows]
+    return column_labels, row_labels, num_blocks
+
+
+def _row_blocks(row_labels):
+    # Number of blocks that contain at least one row
+    return len(np.unique(row_labels[row_labels >= 0]))
+
+
+def linking_groups(lp, max_fraction=0.05):
+    # Small row groups (at most max_fraction of the rows) whose removal splits the rows into more blocks.
+    # In[20]'s CapacityDC is not one of them: DCInventory appears in no other row, so it is its own block.
+    whole = _row_blocks(detect_blocks(lp)[1])
+    groups = []
+    for name, start, stop in lp.rows:
+        if stop - start <= max_fraction * lp.num_constrs and _row_blocks(detect_blocks(lp, exclude=(name,))[1]) > whole:
+            groups.append(name)
+    return groups
+
+
+def pack_blocks(column_labels, row_labels, num_blocks, num_bins, A):
+    # Greedy largest-first packing of blocks into num_bins bins by nonzeros -> [(columns, rows)]
+    nonzeros = np.bincount(column_labels, weights=np.diff(A.tocsc().indptr), minlength=num_blocks) + 1
+    load = np.zeros(num_bins)
+    bin_of_block = np.empty(num_blocks, dtype=int)
+    for block in np.argsort(-nonzeros, kind='stable'):
+        target = int(load.argmin())
+        bin_of_block[block] = target
+        load[target] += nonzeros[block]
+    column_bins = bin_of_block[column_labels]
+    row_bins = np.where(row_labels >= 0, bin_of_block[np.maximum(row_labels, 0)], -1)
+    return [(np.flatnonzero(column_bins == b), np.flatnonzero(row_bins == b)) for b in range(num_bins)
+            if (column_bins == b).any()]
+
+
+class BlockSolver:
+    # One bin of blocks as its own LP; solve(c) re-solves under different costs (Lagrangian prices).
+    # With the gurobi backend the model persists, so re-solves start from the previous basis.
+
+    def __init__(self, payload, backend='highs', threads=1):
+        self.lp = SparseLP(payload['A'], payload['sense'], payload['rhs'], payload['c'], payload['lb'], payload['ub'])
+        self.backend = backend
+        if backend == 'gurobi':
+            from sparse_lp import to_gurobi
+
+            self.m, self.x = to_gurobi(self.lp)
+            self.m.Params.OutputFlag = 0
+            self.m.Params.Threads = threads
+
+    def solve(self, c=None):
+        if self.backend == 'gurobi':
+            from gurobipy import GRB
+
+            if c is not None:
+                self.x.Obj = c
+            start = time.perf_counter()
+            self.m.optimize()
+            if self.m.Status != GRB.OPTIMAL:
+                return {'status': gurobi_status(self.m.Status), 'x': None}
+            return {'status': 'optimal', 'objective': self.m.ObjVal, 'x': self.x.X,
+                    'duals': np.array(self.m.getAttr('Pi', self.m.getConstrs())), 'reduced_costs': self.x.RC,
+                    'seconds': time.perf_counter() - start}
+        lp = self.lp if c is None else SparseLP(self.lp.A, self.lp.sense, self.lp.rhs, c, self.lp.lb, self.lp.ub)
+        if lp.num_constrs == 0:
+            # Only bounds: each variable sits at the bound its cost points to
+            x = np.where(lp.c >= 0, lp.lb, lp.ub)
+            return {'status': 'optimal' if np.isfinite(x).all() else 'unbounded', 'objective': float(lp.c @ x), 'x': x,
+                    'duals': np.zeros(0), 'reduced_costs': lp.c.copy(), 'seconds': 0.0}
+        return solve(lp, self.backend)
+
+
+def _payloads(lp, bins):
+    A = lp.A.tocsr()
+    return [{'A': A[rows][:, cols], 'sense': lp.sense[rows], 'rhs': lp.rhs[rows], 'c': lp.c[cols],
+             'lb': lp.lb[cols], 'ub': lp.ub[cols]} for cols, rows in bins]
+
+
+def solve_blocks(lp, processes=None, backend='highs', num_bins=None):
+    # Solve an LP with independent blocks bin by bin, concurrently; merged like a single solve result
+    start = time.perf_counter()
+    column_labels, row_labels, num_blocks = detect_blocks(lp)
+    num_bins = min(num_blocks, num_bins or 4 * max(1, processes or 1))
+    bins = pack_blocks(column_labels, row_labels, num_blocks, num_bins, lp.A)
+    detect_seconds = time.perf_counter() - start
+    with ScenarioPool(BlockSolver, _payloads(lp, bins), processes, backend=backend) as pool:
+        results = pool.map('solve')
+    x, duals, reduced_costs = np.zeros(lp.num_vars), np.zeros(lp.num_constrs), np.zeros(lp.num_vars)
+    for (cols, rows), result in zip(bins, results):
+        if result['status'] != 'optimal':
+            return {'backend': backend, 'status': result['status'], 'objective': None, 'x': None,
+                    'seconds': time.perf_counter() - start}
+        x[cols], duals[rows], reduced_costs[cols] = result['x'], result['duals'], result['reduced_costs']
+    return {'backend': backend, 'status': 'optimal', 'objective': float(lp.c @ x) + lp.obj_constant, 'x': x,
+            'duals': duals, 'reduced_costs': reduced_costs, 'num_blocks': num_blocks, 'num_bins': len(bins),
+            'detect_seconds': detect_seconds, 'seconds': time.perf_counter() - start}
+
+
+def _violation(residual, sense):
+    return np.where(sense == '<', np.maximum(residual, 0), np.where(sense == '>', np.maximum(-residual, 0), np.abs(residual)))
+
+
+def _restricted_master(costs, links, owners, num_bins, b, sense, penalty):
+    # min sum_k w_k cost_k + penalty * slack  s.t.  sum_k w_k link_k (sense) b (+/- slack),
+    # sum_{k of bin} w_k = 1 per bin, w >= 0. -> (weights, objective without penalty, multipliers y, slack)
+    num_columns, num_linking = len(costs), len(b)
+    links = np.array(links).T                                          # [linking row, column]
+    slack_signs = [(-1.0,) if s == '<' else (1.0,) if s == '>' else (-1.0, 1.0) for s in sense]
+    slack_rows = [i for i, signs in enumerate(slack_signs) for _ in signs]
+    slack_values = [v for signs in slack_signs for v in signs]
+    num_slacks = len(slack_rows)
+    A = sp.bmat([[sp.csr_matrix(links), sp.csr_matrix((slack_values, (slack_rows, range(num_slacks))), shape=(num_linking, num_slacks))],
+                 [sp.csr_matrix((np.ones(num_columns), (owners, range(num_columns))), shape=(num_bins, num_columns)), None]],
+                format='csr')
+    master = SparseLP(A, np.append(sense, np.full(num_bins, '=')), np.append(b, np.ones(num_bins)),
+                      np.append(costs, np.full(num_slacks, penalty)))
+    result = solve(master)
+    if result['status'] != 'optimal':
+        raise RuntimeError('Lagrangian restricted master: %s' % result['status'])
+    weights, slack = result['x'][:num_columns], result['x'][num_columns:]
+    # Gurobi-convention row duals Pi; the Lagrangian prices are y = -Pi on the linking rows
+    return weights, float(np.dot(costs, weights)), -result['duals'][:num_linking], float(slack.sum())
+
+
+def solve_lagrangian(lp, linking=None, processes=None, backend='highs', num_bins=None, max_iterations=100,
+                     tolerance=1e-6, verbose=False):
+    # Dual decomposition over the linking row groups (found automatically when None). Prices come
+    # from a restricted master over every block solution seen so far (Dantzig-Wolfe), which also
+    # yields the primal solution as a convex combination of block solutions.
+    start = time.perf_counter()
+    linking = linking_groups(lp) if linking is None else list(linking)
+    linked = ~_row_mask(lp, linking)
+    column_labels, row_labels, num_blocks = detect_blocks(lp, exclude=linking)
+    num_bins = min(num_blocks, num_bins or 4 * max(1, processes or 1))
+    bins = pack_blocks(column_labels, row_labels, num_blocks, num_bins, lp.A)
+
+    L = lp.A.tocsr()[linked]
+    b, sense = lp.rhs[linked], lp.sense[linked]
+    L_bins = [L[:, cols] for cols, _ in bins]
+    penalty = 1e4 * max(1.0, np.abs(lp.c).max(initial=0.0)) * max(1, len(bins))
+    y = np.zeros(len(b))
+    best_bound, history = -np.inf, []
+    solutions, costs, links, owners = [], [], [], []
+    with ScenarioPool(BlockSolver, _payloads(lp, bins), processes, backend=backend) as pool:
+        for iteration in range(1, max_iterations + 1):
+            c = lp.c + L.T @ y
+            results = pool.map('solve', per_scenario=[(c[cols],) for cols, _ in bins])
+            bound = -float(y @ b) + lp.obj_constant
+            for k, ((cols, _), result) in enumerate(zip(bins, results)):
+                if result['status'] != 'optimal':
+                    raise RuntimeError('Lagrangian block subproblem: %s' % result['status'])
+                x_bin = result['x']
+                bound += float(c[cols] @ x_bin)
+                solutions.append(x_bin)
+                costs.append(float(lp.c[cols] @ x_bin))
+                links.append(L_bins[k] @ x_bin)
+                owners.append(k)
+            best_bound = max(best_bound, bound)
+
+            weights, objective, y, slack = _restricted_master(np.array(costs), links, np.array(owners), len(bins), b, sense, penalty)
+            y = np.where(sense == '<', np.maximum(y, 0.0), np.where(sense == '>', np.minimum(y, 0.0), y))
+            primal = objective + lp.obj_constant if slack <= 1e-9 else np.inf
+            gap = (primal - best_bound) / max(1.0, abs(primal)) if np.isfinite(primal) else np.inf
+            history.append({'iteration': iteration, 'bound': bound, 'primal': primal, 'slack': slack, 'gap': gap})
+            if verbose:
+                print('iteration %3d  bound %.4f  primal %.4f  slack %.2e' % (iteration, bound, primal, slack))
+            if gap <= tolerance:
+                break
+
+    # Primal solution: the master's convex combination of the block solutions
+    x = np.zeros(lp.num_vars)
+    for weight, owner, x_bin in zip(weights, owners, solutions):
+        if weight > 0:
+            x[bins[owner][0]] += weight * x_bin
+    return {
+        'status': 'optimal' if gap <= tolerance else 'iteration_limit',
+        'objective': primal, 'lower_bound': best_bound, 'x': x, 'multipliers': y, 'linking': linking,
+        'violation': float(_violation(L @ x - b, sense).max(initial=0.0)), 'num_blocks': num_blocks,
+        'num_bins': len(bins), 'iterations': iteration, 'history': history, 'seconds': time.perf_counter() - start,
+    }
+
+
+def add_linking_rows(lp, name, A, sense, rhs):
+    # Copy of lp with an extra row group, e.g. a shared capacity across products
+    A = sp.csr_matrix(A)
+    rows = list(lp.rows) + [(name, lp.num_constrs, lp.num_constrs + A.shape[0])]
+    return SparseLP(sp.vstack([lp.A, A], format='csr'), np.append(lp.sense, np.broadcast_to(sense, A.shape[0])),
+                    np.append(lp.rhs, rhs), lp.c, lp.lb, lp.ub, lp.columns, rows, lp.objectives, lp.obj_constant)
+
+
+if __name__ == "__main__":
+    from instances import generate_instance
+
+    for formulation in ('in11', 'in18', 'in20', 'in4'):
+        make = INSTANCES[formulation]
+        lp = build_sparse_lp(make(seed=0) if formulation in ('in20', 'in4') else make(), formulation)
+        print(formulation, 'blocks:', detect_blocks(lp)[2], 'linking groups:', linking_groups(lp))
+
+    for formulation in ('in11', 'in18'):
+        lp = build_sparse_lp(generate_instance(formulation, num_products=1000, num_demand_scenarios=5,
+                                               num_disruption_scenarios=5, seed=0), formulation)
+        whole = solve(lp)
+        for processes in (1, 4):
+            blocks = solve_blocks(lp, processes=processes)
+            print('%s 1000 products, %d vars: monolithic %.3f s, %d blocks in %d bins over %d processes %.3f s, '
+                  'objective difference %.2e' % (formulation, lp.num_vars, whole['seconds'], blocks['num_blocks'],
+                                                 blocks['num_bins'], processes, blocks['seconds'],
+                                                 abs(blocks['objective'] - whole['objective'])))
+
+    # A main-supplier capacity shared by all products links the In[18] product blocks
+    instance = generate_instance('in18', num_products=200, seed=0)
+    lp = build_sparse_lp(instance, 'in18')
+    initial = lp.column_slice('InitialOrders')
+    num_products, num_suppliers = dict((name, shape) for name, shape, _ in lp.columns)['InitialOrders']
+    row = sp.csr_matrix((np.ones(num_products), (np.zeros(num_products, dtype=int),
+                                                 initial.start + np.arange(num_products) * num_suppliers)), shape=(1, lp.num_vars))
+    free = solve(lp)
+    capacity = 0.8 * lp.unpack(free['x'])['InitialOrders'][:, 0].sum()
+    coupled = add_linking_rows(lp, 'SupplierCapacity', row, '<', [capacity])
+    whole = solve(coupled)
+    result = solve_lagrangian(coupled, processes=1)
+    print('in18 + SupplierCapacity, linking %s: %d blocks, objective %.2f (monolithic %.2f), bound %.2f, '
+          'violation %.2e, %d iterations, %.2f s'
+          % (result['linking'], result['num_blocks'], result['objective'], whole['objective'], result['lower_bound'],
+             result['violation'], result['iterations'], result['seconds']))
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Fixed ordering charges and minimum order quantities (MOQs) for the
+# supplier cells (In[17]/In[18]/In[20]), and an anytime solve of the
+# resulting MIP.
+#
+# Two optional instance entries, laid out like order_costs[s][p]:
+#   fixed_order_costs[s][p]         charge for every order placed (initial or recourse)
+#   minimum_order_quantities[s][p]  an order is either 0 or at least this much
+# build_mip() adds them to the matrix-form model. Orders with a fixed charge
+# get an Open binary (order <= M * open, order >= MOQ * open), with the
+# charge on the binary weighted like the order cost; orders with only an
+# MOQ become semi-continuous. M is what an order can usefully cover: the
+# remaining demand of its (retailer,) scenario plus the minimum level, and
+# at least the MOQ, since any more is pure holding cost.
+#
+# solve_anytime() runs within a wall-clock budget and streams every new
+# incumbent and bound (to a callback and/or a Telemetry JSON-lines file):
+#   1. LP relaxation -> first bound;
+#   2. construction heuristics, each an open/closed pattern completed by an
+#      LP with the pattern fixed: 'rounding' opens every order the relaxation
+#      uses, 'greedy' places recourse only at each product's cheapest
+#      supplier (or none at all, buying everything up front);
+#   3. Gurobi's branch and bound from the best incumbent, with the time left
+#      and the target gap as stopping rules.
+# It stops as soon as an incumbent is within target_gap of the best bound.
+
+import time
+
+import numpy as np
+from gurobipy import GRB
+
+from formulations import STAGED, instance_arrays, scenario_weights, variable_shapes
+from instances import INSTANCES, generate_instance
+from matrix_builder import build_matrix_model
+from sparse_lp import gurobi_status
+from telemetry import Telemetry
+
+ORDER_GROUPS = ('InitialOrders', 'AdditionalOrders')
+HEURISTICS = ('rounding', 'greedy')
+
+
+def order_charges(instance, arrays, formulation):
+    # -> {group: (fixed, moq, big_m)}, flat vectors over the group's columns
+    if formulation in STAGED or formulation == 'in4':
+        raise ValueError('fixed order charges are defined for in17, in18 and in20, not %s' % formulation)
+    shapes = dict(variable_shapes(arrays, formulation))
+    order_costs = arrays['order_costs']
+    fixed = np.asarray(instance.get('fixed_order_costs', np.zeros_like(order_costs)), dtype=float).T      # [p, s]
+    moq = np.asarray(instance.get('minimum_order_quantities', np.zeros_like(order_costs)), dtype=float).T  # [p, s]
+    weight = scenario_weights(arrays)
+
+    # Remaining requirement from stage t on, need[p, t, r, ds] = sum_{t' >= t} demand + minimum
+    demand = np.nan_to_num(arrays['demand']).transpose(2, 3, 1, 0)
+    need = np.cumsum(demand[:, ::-1], axis=1)[:, ::-1] + arrays['min_inventory_levels'][:, None, None, None]
+
+    initial_m = np.maximum(need[:, 0].reshape(len(need), -1).max(axis=1)[:, None], moq)                  # [p, s]
+    additional_shape = shapes['AdditionalOrders']                                                         # [p, t, s, r, ds, dp]
+    additional_m = np.maximum(need[:, :, None, :, :, None], moq[:, None, :, None, None, None])
+    return {
+        'InitialOrders': (fixed.ravel(), moq.ravel(), initial_m.ravel()),
+        'AdditionalOrders': (
+            np.broadcast_to(fixed[:, None, :, None, None, None] * weight, additional_shape).ravel(),
+            np.broadcast_to(moq[:, None, :, None, None, None], additional_shape).ravel(),
+            np.broadcast_to(additional_m, additional_shape).ravel(),
+        ),
+    }
+
+
+def with_order_charges(instance, fixed=100.0, moq=50.0, seed=None):
+    # Copy of a supplier-cell instance with fixed charges and MOQs drawn around the given levels
+    rng = np.random.default_rng(seed)
+    shape = np.shape(instance['order_costs'])
+    return dict(instance,
+                fixed_order_costs=np.round(fixed * rng.uniform(0.5, 1.5, shape), 2).tolist(),
+                minimum_order_quantities=np.round(moq * rng.uniform(0.5, 1.5, shape)).tolist())
+
+
+def build_mip(instance, formulation='in18', arrays=None):
+    # Matrix-form model plus Open binaries / semi-continuous orders.
+    # -> (m, variables, constraints, integers); integers[group] = (columns, binaries or None, moq, big_m)
+    if arrays is None:
+        arrays = instance_arrays(instance, formulation)
+    charges = order_charges(instance, arrays, formulation)
+    m, variables, constraints = build_matrix_model(instance, formulation, arrays)
+    m.update()
+    objective = m.getObjective()
+    integers = {}
+    for group in ORDER_GROUPS:
+        fixed, moq, big_m = charges[group]
+        orders = variables[group].reshape(-1)
+        charged = np.flatnonzero(fixed > 0)
+        if charged.size:
+            opened = m.addMVar(charged.size, vtype=GRB.BINARY, name=group + 'Open')
+            x = orders[charged]
+            constraints[group + 'Capacity'] = m.addConstr(x - big_m[charged] * opened <= 0, name=group + 'Capacity')
+            floor = moq[charged] > 0
+            if floor.any():
+                constraints[group + 'MinimumOrder'] = m.addConstr(
+                    x[np.flatnonzero(floor)] - moq[charged][floor] * opened[np.flatnonzero(floor)] >= 0,
+                    name=group + 'MinimumOrder')
+            objective += fixed[charged] @ opened
+            variables[group + 'Open'] = opened
+            integers[group] = (charged, opened, moq[charged], big_m[charged])
+        # MOQ without a fixed charge: 0 or in [moq, M]
+        semicontinuous = np.flatnonzero((fixed <= 0) & (moq > 0))
+        if semicontinuous.size:
+            x = orders[semicontinuous]
+            x.VType = GRB.SEMICONT
+            x.LB = moq[semicontinuous]
+            x.UB = big_m[semicontinuous]
+            integers[group + 'Semicontinuous'] = (semicontinuous, None, moq[semicontinuous], big_m[semicontinuous])
+    m.setObjective(objective, GRB.MINIMIZE)
+    m.update()
+    return m, variables, constraints, integers
+
+
+def _order_groups(integers):
+    return [(key, key.replace('Semicontinuous', '')) for key in integers]
+
+
+def _relax(variables, integers):
+    # Integer parts continuous in place: binaries in [0, 1], semi-continuous orders in [0, M]
+    for key, group in _order_groups(integers):
+        columns, opened, moq, big_m = integers[key]
+        if opened is not None:
+            opened.VType = GRB.CONTINUOUS
+        else:
+            x = variables[group].reshape(-1)[columns]
+            x.VType, x.LB = GRB.CONTINUOUS, 0.0
+
+
+def _fix(variables, integers, pattern):
+    # Integer parts fixed to an open/closed pattern {key: bool vector}, still continuous
+    for key, group in _order_groups(integers):
+        columns, opened, moq, big_m = integers[key]
+        if opened is not None:
+            opened.LB = opened.UB = pattern[key].astype(float)
+        else:
+            x = variables[group].reshape(-1)[columns]
+            x.LB = np.where(pattern[key], moq, 0.0)
+            x.UB = np.where(pattern[key], big_m, 0.0)
+
+
+def _restore(variables, integers):
+    for key, group in _order_groups(integers):
+        columns, opened, moq, big_m = integers[key]
+        if opened is not None:
+            opened.VType, opened.LB, opened.UB = GRB.BINARY, 0.0, 1.0
+        else:
+            x = variables[group].reshape(-1)[columns]
+            x.VType, x.LB, x.UB = GRB.SEMICONT, moq, big_m
+
+
+def _orders(variables, integers):
+    return {key: variables[group].reshape(-1)[integers[key][0]].X for key, group in _order_groups(integers)}
+
+
+def complete_pattern(m, variables, integers, pattern):
+    # LP with the pattern fixed -> (objective, start) or (None, None); orders the LP leaves at 0 are closed
+    # afterwards, which only removes their fixed charges
+    _fix(variables, integers, pattern)
+    m.optimize()
+    if m.Status != GRB.OPTIMAL:
+        return None, None
+    orders = _orders(variables, integers)
+    start = {group: variable.X for group, variable in variables.items()}
+    cost = m.ObjVal
+    for key, (columns, opened, moq, big_m) in integers.items():
+        if opened is not None:
+            unused = pattern[key] & (orders[key] <= 1e-9)
+            start[key.replace('Semicontinuous', '') + 'Open'] = (pattern[key] & ~unused).astype(float)
+            cost -= float(opened.Obj[unused].sum())
+    return cost, start
+
+
+def rounding_pattern(orders):
+    # Open every order the LP relaxation places
+    return {key: values > 1e-6 for key, values in orders.items()}
+
+
+def greedy_patterns(instance, arrays, formulation, integers):
+    # Recourse only at each product's cheapest supplier (unit cost plus its fixed charge spread over
+    # an average order), or no recourse at all; initial orders stay open at every supplier
+    shapes = dict(variable_shapes(arrays, formulation))
+    num_products, num_stages, num_suppliers = shapes['AdditionalOrders'][:3]
+    fixed = np.asarray(instance.get('fixed_order_costs', np.zeros_like(arrays['order_costs'])), dtype=float)
+    average = np.nanmean(arrays['demand'], axis=(0, 1, 3))                                  # [p]
+    supplier = (arrays['order_costs'] + fixed / np.maximum(average, 1)).argmin(axis=0)    # [p]
+    cheapest = np.zeros(shapes['AdditionalOrders'], dtype=bool)
+    cheapest[np.arange(num_products), :, supplier] = True
+    cheapest = cheapest.ravel()
+    patterns = {}
+    for name, recourse in (('greedy-cheapest', cheapest), ('greedy-upfront', np.zeros_like(cheapest))):
+        patterns[name] = {key: recourse[integers[key][0]] if key.startswith('AdditionalOrders')
+                          else np.ones(len(integers[key][0]), dtype=bool) for key in integers}
+    return patterns
+
+
+def _gap(objective, bound):
+    if objective is None or bound is None:
+        return None
+    return max(objective - bound, 0.0) / max(abs(objective), 1e-10)
+
+
+def solve_anytime(instance, formulation='in18', time_limit=60.0, target_gap=0.01, heuristics=HEURISTICS,
+                  on_event=None, telemetry=None, threads=None, bound_step=1e-3):
+    # Best incumbent found within time_limit seconds, stopping early at target_gap.
+    # on_event(record) and telemetry.emit() receive every new incumbent as it is found, and the bound
+    # whenever it has moved by bound_step (relative) since the last 'bound' event and at the end.
+    started = time.perf_counter()
+    state = {'objective': None, 'bound': None, 'streamed': None, 'source': None, 'start': None}
+    events = []
+
+    def emit(event, **fields):
+        record = dict(event=event, time=time.perf_counter() - started, **fields)
+        events.append(record)
+        if on_event is not None:
+            on_event(record)
+        if telemetry is not None:
+            telemetry.emit(event, **{key: value for key, value in record.items() if key != 'event'})
+
+    def incumbent(objective, source, start=None):
+        if objective is None or (state['objective'] is not None and objective >= state['objective'] - 1e-9):
+            return
+        state.update(objective=objective, source=source, start=start)
+        emit('incumbent', source=source, objective=objective, bound=state['bound'], gap=_gap(objective, state['bound']))
+
+    def bound(value, source, final=False):
+        # The final call streams the best bound unless exactly that value has been streamed already
+        if state['bound'] is None or value > state['bound'] + 1e-9 * max(1.0, abs(value)):
+            state['bound'] = value
+        elif not final:
+            return
+        value, streamed = state['bound'], state['streamed']
+        if streamed is not None and value < streamed + (1e-9 if final else bound_step) * max(1.0, abs(value)):
+            return
+        state['streamed'] = value
+        emit('bound', source=source, bound=value, objective=state['objective'], gap=_gap(state['objective'], value))
+
+    def done():
+        gap = _gap(state['objective'], state['bound'])
+        return gap is not None and gap <= target_gap
+
+    arrays = instance_arrays(instance, formulation)
+    m, variables, constraints, integers = build_mip(instance, formulation, arrays)
+    m.Params.OutputFlag = 0
+    if threads is not None:
+        m.Params.Threads = threads
+
+    # 1. LP relaxation and 2. construction heuristics
+    _relax(variables, integers)
+    m.optimize()
+    if m.Status != GRB.OPTIMAL:
+        _restore(variables, integers)
+        return {'status': gurobi_status(m.Status), 'objective': None, 'bound': None, 'gap': None, 'solution': None, 'events': events,
+                'seconds': time.perf_counter() - started}
+    bound(m.ObjVal, 'lp')
+    relaxation = _orders(variables, integers)
+    patterns = {}
+    if 'rounding' in heuristics:
+        patterns['rounding'] = rounding_pattern(relaxation)
+    if 'greedy' in heuristics:
+        patterns.update(greedy_patterns(instance, arrays, formulation, integers))
+    for source, pattern in patterns.items():
+        if done() or time.perf_counter() - started >= time_limit:
+            break
+        cost, start = complete_pattern(m, variables, integers, pattern)
+        incumbent(cost, source, start)
+    _restore(variables, integers)
+
+    # 3. Branch and bound from the best incumbent
+    status = 'target gap' if done() else None
+    remaining = time_limit - (time.perf_counter() - started)
+    if status is None and remaining <= 0:
+        status = 'time limit'
+    if status is None:
+        if state['start'] is not None:
+            for group, variable in variables.items():
+                variable.Start = state['start'][group]
+        m.Params.TimeLimit = remaining
+        m.Params.MIPGap = target_gap
+
+        def progress(model, where):
+            if where == GRB.Callback.MIPSOL:
+                incumbent(model.cbGet(GRB.Callback.MIPSOL_OBJ), 'mip')
+                bound(model.cbGet(GRB.Callback.MIPSOL_OBJBND), 'mip')
+            elif where == GRB.Callback.MIP:
+                bound(model.cbGet(GRB.Callback.MIP_OBJBND), 'mip')
+
+        m.optimize(progress)
+        if m.SolCount and m.ObjVal < (state['objective'] if state['objective'] is not None else np.inf) + 1e-9:
+            state['start'] = {group: variable.X for group, variable in variables.items()}
+            incumbent(m.ObjVal, 'mip')
+        bound(m.ObjBound, 'mip', final=True)
+        if done():
+            status = 'target gap'
+        else:
+            status = 'time limit' if m.Status == GRB.TIME_LIMIT else gurobi_status(m.Status)
+    solution = None if state['start'] is None else {
+        group: np.asarray(values).reshape(variables[group].shape) for group, values in state['start'].items()}
+    emit('done', status=status, source=state['source'], objective=state['objective'], bound=state['bound'],
+         gap=_gap(state['objective'], state['bound']))
+    return {'status': status, 'objective': state['objective'], 'bound': state['bound'],
+            'gap': _gap(state['objective'], state['bound']), 'source': state['source'], 'solution': solution,
+            'events': events, 'seconds': time.perf_counter() - started}
+
+
+if __name__ == "__main__":
+    def show(record):
+        print('  %7.3f s %-9s %-16s objective %-12s bound %-12s gap %s' % (
+            record['time'], record['event'], record.get('source') or '',
+            '%.2f' % record['objective'] if record.get('objective') is not None else '-',
+            '%.2f' % record['bound'] if record.get('bound') is not None else '-',
+            '%.4f' % record['gap'] if record.get('gap') is not None else '-'))
+
+    # Cell instances with fixed charges and MOQs, streamed to stdout
+    for formulation in ('in18', 'in20'):
+        instance = with_order_charges(INSTANCES[formulation](), fixed=200.0, moq=60.0, seed=0)
+        print(formulation, 'cell instance, fixed charges and MOQs:')
+        result = solve_anytime(instance, formulation, time_limit=5.0, target_gap=0.01, on_event=show)
+
+    # MOQs only (semi-continuous orders)
+    instance = dict(INSTANCES['in18'](), minimum_order_quantities=[[60, 60, 60], [80, 80, 80]])
+    print('in18 cell instance, MOQs only:')
+    solve_anytime(instance, 'in18', time_limit=5.0, target_gap=0.01, on_event=show)
+
+    # A larger generated instance under a budget, streamed as JSON lines; heuristics alone vs none
+    instance = with_order_charges(generate_instance('in18', num_products=5, num_stages=4, num_retailers=2,
+                                                    num_demand_scenarios=2, num_disruption_scenarios=2, seed=0),
+                                  fixed=300.0, moq=40.0, seed=1)
+    with Telemetry() as telemetry:
+        result = solve_anytime(instance, 'in18', time_limit=5.0, target_gap=0.005, telemetry=telemetry)
+    for heuristics in (HEURISTICS, ()):
+        result = solve_anytime(instance, 'in18', time_limit=5.0, target_gap=0.005, heuristics=heuristics)
+        first = next(event for event in result['events'] if event['event'] == 'incumbent')
+        print('heuristics %-20s first incumbent %.2f at %.3f s (%s); final %.2f, gap %.4f, %s in %.2f s'
+              % (heuristics or 'none', first['objective'], first['time'], first['source'], result['objective'],
+                 result['gap'], result['status'], result['seconds']))
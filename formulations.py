@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Array form of the MTP.py formulations: parameters as NumPy arrays with
+# explicit axes, variable groups with their shapes, cost vectors and the
+# constraint groups as sparse coefficient blocks. Solver independent, so the
+# Gurobi builder and the sparse LP assembly share one definition of each model.
+
+import numpy as np
+import scipy.sparse as sp
+
+FORMULATIONS = ('in10', 'in11', 'in17', 'in18', 'in20', 'in4')
+STAGED = ('in10', 'in11')          # single supplier, disruption flag per stage
+WITH_DC = ('in20', 'in4')          # distribution center inventory and capacity
+
+# Bump whenever a formulation below changes, so cached solutions of the old models are not reused
+FORMULATION_VERSION = 1
+
+
+def scenario_table(scenarios, shape):
+    # Nested scenario lists -> dense array, NaN where a cell's table is ragged (In[17])
+    try:
+        table = np.asarray([scenarios['scenario' + str(k + 1)] for k in range(shape[0])], dtype=float)
+        if table.shape == tuple(shape):
+            return table
+    except ValueError:
+        pass
+    table = np.full(shape, np.nan)
+    for k in range(shape[0]):
+        scenario = scenarios['scenario' + str(k + 1)]
+        for index in np.ndindex(*shape[1:]):
+            value = scenario
+            for i in index:
+                if i >= len(value):
+                    break
+                value = value[i]
+            else:
+                table[(k,) + index] = value
+    return table
+
+
+def instance_arrays(instance, formulation):
+    # Parameters of a cell as NumPy arrays with explicit axes. An attached ScenarioStore
+    # (instance['scenario_store']) supplies the scenario tables as they are, without conversion.
+    num_products = instance['num_products']
+    num_stages = instance['num_stages']
+    arrays = {
+        'holding_costs': np.asarray(instance['holding_costs'], dtype=float),
+        'min_inventory_levels': np.asarray(instance.get('min_inventory_levels', np.zeros(num_products)), dtype=float),
+        # order_costs[p] (In[10]/In[11]) or order_costs[s, p]
+        'order_costs': np.asarray(instance['order_costs'], dtype=float),
+    }
+    store = instance.get('scenario_store')
+    if store is not None:
+        arrays.update(store.arrays())
+    else:
+        arrays['demand_scenario_probabilities'] = np.asarray(instance['demand_scenario_probabilities'], dtype=float)
+        arrays['disruption_scenario_probabilities'] = np.asarray(instance['disruption_scenario_probabilities'], dtype=float)
+        num_demand = len(instance['demand_scenarios'])
+        num_disruption = len(instance['disruption_scenarios'])
+        if formulation in STAGED:
+            # demand[ds, p, t], disruption[dp, t]
+            arrays['demand'] = scenario_table(instance['demand_scenarios'], (num_demand, num_products, num_stages))
+            arrays['disruption'] = scenario_table(instance['disruption_scenarios'], (num_disruption, num_stages))
+        else:
+            # demand[ds, r, p, t], disruption[dp, s]
+            arrays['demand'] = scenario_table(instance['demand_scenarios'],
+                                               (num_demand, instance['num_retailers'], num_products, num_stages))
+            arrays['disruption'] = scenario_table(instance['disruption_scenarios'], (num_disruption, instance['num_suppliers']))
+    if formulation in WITH_DC:
+        arrays['distribution_center_capacity'] = np.asarray(instance['distribution_center_capacity'], dtype=float)
+    if formulation == 'in4':
+        arrays['carbon_emission_factors'] = np.asarray(instance['carbon_emission_factors'], dtype=float)
+    return arrays
+
+
+def variable_shapes(arrays, formulation):
+    # Variable groups in the order the cells add them
+    num_demand, num_disruption = len(arrays['demand_scenario_probabilities']), len(arrays['disruption_scenario_probabilities'])
+    if formulation in STAGED:
+        _, num_products, num_stages = arrays['demand'].shape
+        return [
+            ('InitialOrders', (num_products,)),
+            ('AdditionalOrders', (num_products, num_stages, num_demand, num_disruption)),
+            ('InventoryLevels', (num_products, num_stages, num_demand, num_disruption)),
+        ]
+    _, num_retailers, num_products, num_stages = arrays['demand'].shape
+    num_suppliers = arrays['disruption'].shape[1]
+    shapes = []
+    if formulation in WITH_DC:
+        shapes.append(('DCInventory', (len(arrays['distribution_center_capacity']), num_products)))
+    shapes += [
+        ('InitialOrders', (num_products, num_suppliers)),
+        ('AdditionalOrders', (num_products, num_stages, num_suppliers, num_retailers, num_demand, num_disruption)),
+        ('InventoryLevels', (num_products, num_stages, num_retailers, num_demand, num_disruption)),
+    ]
+    return shapes
+
+
+def scenario_weights(arrays):
+    # weight[ds, dp] = demand_scenario_probabilities[ds] * disruption_scenario_probabilities[dp]
+    return np.outer(arrays['demand_scenario_probabilities'], arrays['disruption_scenario_probabilities'])
+
+
+def objective_vectors(arrays, formulation):
+    # Flat cost vector per variable group (total_cost of the cells)
+    weight = scenario_weights(arrays)
+    holding = arrays['holding_costs']
+    shapes = dict(variable_shapes(arrays, formulation))
+    if formulation in STAGED:
+        order = arrays['order_costs']  # [p]
+        return {
+            'InitialOrders': order.copy(),
+            'AdditionalOrders': np.broadcast_to(order[:, None, None, None] * weight[None, None],
+                                                shapes['AdditionalOrders']).ravel(),
+            'InventoryLevels': np.broadcast_to(holding[:, None, None, None] * weight[None, None],
+                                               shapes['InventoryLevels']).ravel(),
+        }
+    order = arrays['order_costs']  # [s, p]
+    costs = {
+        'InitialOrders': order.T.ravel(),
+        'AdditionalOrders': np.broadcast_to(order.T[:, None, :, None, None, None] * weight[None, None, None, None],
+                                            shapes['AdditionalOrders']).ravel(),
+        'InventoryLevels': np.broadcast_to(holding[:, None, None, None, None] * weight[None, None, None],
+                                           shapes['InventoryLevels']).ravel(),
+    }
+    if formulation in WITH_DC:
+        costs = dict(DCInventory=np.broadcast_to(holding[None, :], shapes['DCInventory']).ravel(), **costs)
+    return costs
+
+
+def carbon_vectors(arrays, formulation):
+    # Flat carbon_emissions vector per variable group (In[4])
+    weight = scenario_weights(arrays)
+    shapes = dict(variable_shapes(arrays, formulation))
+    factors = arrays['carbon_emission_factors']
+    return {
+        'DCInventory': np.broadcast_to(factors[None, :], shapes['DCInventory']).ravel(),
+        'AdditionalOrders': np.broadcast_to(factors[:, None, None, None, None, None] * weight[None, None, None, None],
+                                            shapes['AdditionalOrders']).ravel(),
+    }
+
+
+def _block(rows, cols, num_rows, num_cols, values=1.0):
+    values = np.broadcast_to(np.asarray(values, dtype=float), np.shape(rows))
+    return sp.csr_matrix((values, (rows, cols)), shape=(num_rows, num_cols))
+
+
+def _balance_rhs(arrays, formulation):
+    # Balance right-hand side over the full inventory index set, NaN where a ragged table has no demand.
+    # An optional arrays['initial_inventory'] ([p] or [p, r]) is starting stock netted off the first stage.
+    demand = arrays['demand']
+    if formulation in STAGED:
+        # (p, t, ds, dp): demand * (1 - disruption[t])
+        rhs = demand.transpose(1, 2, 0)[..., None] * (1 - arrays['disruption'].T[None, :, None, :])
+    else:
+        # (p, t, r, ds, dp): demand
+        num_disruption = arrays['disruption'].shape[0]
+        rhs = np.repeat(demand.transpose(2, 3, 1, 0)[..., None], num_disruption, axis=-1)
+    if arrays.get('initial_inventory') is not None:
+        rhs = rhs.copy()
+        initial = np.asarray(arrays['initial_inventory'], dtype=float)
+        rhs[:, 0] -= initial.reshape(initial.shape + (1,) * (rhs.ndim - 1 - initial.ndim))
+    return rhs.ravel()
+
+
+def _balance_block(arrays, formulation, shapes):
+    # Inventory balance rows, one per (p, t[, r], ds, dp) index with demand data
+    inventory_shape = shapes['InventoryLevels']
+    additional_shape = shapes['AdditionalOrders']
+    if formulation in STAGED:
+        p, t, ds, dp = np.indices(inventory_shape).reshape(len(inventory_shape), -1)
+        supplier_axes = [(p, t, ds, dp)]
+        initial_index = [p]
+    else:
+        p, t, r, ds, dp = np.indices(inventory_shape).reshape(len(inventory_shape), -1)
+        num_suppliers = additional_shape[2]
+        supplier_axes = [(p, t, s, r, ds, dp) for s in [np.full_like(p, k) for k in range(num_suppliers)]]
+        initial_index = [(p, np.full_like(p, k)) for k in range(num_suppliers)]
+    keep = ~np.isnan(_balance_rhs(arrays, formulation))
+    rows = np.cumsum(keep) - 1
+    num_rows = int(keep.sum())
+    own = np.arange(keep.size)
+
+    coefficients = {}
+    # - inventory_levels[p, t, ...]
+    inventory_rows, inventory_cols, inventory_vals = [rows[keep]], [own[keep]], [-np.ones(num_rows)]
+    # + inventory_levels[p, t-1, ...]
+    later = keep & (t > 0)
+    previous = own - int(np.prod(inventory_shape[2:]))
+    inventory_rows.append(rows[later])
+    inventory_cols.append(previous[later])
+    inventory_vals.append(np.ones(int(later.sum())))
+    coefficients['InventoryLevels'] = _block(np.concatenate(inventory_rows), np.concatenate(inventory_cols),
+                                             num_rows, own.size, np.concatenate(inventory_vals))
+    # + additional_orders[p, t, s, ...] for every supplier
+    additional_cols = np.concatenate([np.ravel_multi_index(index, additional_shape)[keep] for index in supplier_axes])
+    coefficients['AdditionalOrders'] = _block(np.tile(rows[keep], len(supplier_axes)), additional_cols,
+                                              num_rows, int(np.prod(additional_shape)))
+    # + initial_orders[p, s] in the first stage
+    first = keep & (t == 0)
+    initial_shape = shapes['InitialOrders']
+    initial_cols = np.concatenate([np.ravel_multi_index(index, initial_shape)[first] if isinstance(index, tuple)
+                                   else index[first] for index in initial_index])
+    coefficients['InitialOrders'] = _block(np.tile(rows[first], len(initial_index)), initial_cols,
+                                           num_rows, int(np.prod(initial_shape)))
+    return coefficients, keep
+
+
+def constraint_rhs(arrays, formulation):
+    # Right-hand side of every constraint group, without building the coefficient blocks
+    minimum = arrays['min_inventory_levels']
+    balance = _balance_rhs(arrays, formulation)
+    keep = ~np.isnan(balance)
+    rhs = {}
+    if formulation in WITH_DC:
+        rhs['CapacityDC'] = arrays['distribution_center_capacity'].copy()
+    if formulation == 'in11':
+        rhs['InitialOrderFloor'] = minimum.copy()
+    elif formulation not in STAGED:
+        # min_inventory_levels[p] * (1 - disruption[dp, s]), rows (p, s, dp)
+        rhs['InitialOrderFloor'] = (minimum[:, None, None] * (1 - arrays['disruption'].T[None])).ravel()
+    rhs['Balance'] = balance[keep]
+    if formulation != 'in10':
+        inventory_shape = dict(variable_shapes(arrays, formulation))['InventoryLevels']
+        rhs['MinInventory'] = minimum[np.unravel_index(np.flatnonzero(keep), inventory_shape)[0]]
+    return rhs
+
+
+def constraint_blocks(arrays, formulation):
+    # Constraint groups as (name, {variable group: sparse matrix}, sense, rhs), in cell order
+    shapes = dict(variable_shapes(arrays, formulation))
+    rhs = constraint_rhs(arrays, formulation)
+    blocks = []
+    if formulation in WITH_DC:
+        # Capacity constraints for distribution centers
+        num_dc, num_products = shapes['DCInventory']
+        rows = np.repeat(np.arange(num_dc), num_products)
+        blocks.append(('CapacityDC', {'DCInventory': _block(rows, np.arange(num_dc * num_products), num_dc, num_dc * num_products)},
+                       '<', rhs['CapacityDC']))
+    if formulation == 'in11':
+        num_products = shapes['InitialOrders'][0]
+        blocks.append(('InitialOrderFloor', {'InitialOrders': sp.identity(num_products, format='csr')}, '>', rhs['InitialOrderFloor']))
+    elif formulation not in STAGED:
+        # initial_orders[p, s] >= min_inventory_levels[p] * (1 - disruption[dp, s]), rows (p, s, dp)
+        num_products, num_suppliers = shapes['InitialOrders']
+        num_disruption = arrays['disruption'].shape[0]
+        rows = np.arange(rhs['InitialOrderFloor'].size)
+        blocks.append(('InitialOrderFloor',
+                       {'InitialOrders': _block(rows, rows // num_disruption, rows.size, num_products * num_suppliers)},
+                       '>', rhs['InitialOrderFloor']))
+    coefficients, keep = _balance_block(arrays, formulation, shapes)
+    blocks.append(('Balance', coefficients, '=', rhs['Balance']))
+    if formulation != 'in10':
+        # Minimum inventory level constraint on every kept balance index
+        cols = np.flatnonzero(keep)
+        size = int(np.prod(shapes['InventoryLevels']))
+        blocks.append(('MinInventory', {'InventoryLevels': _block(np.arange(cols.size), cols, cols.size, size)},
+                       '>', rhs['MinInventory']))
+    return blocks
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Instance data of the MTP.py cells, packed into plain dicts keyed by the
+# same parameter names the cells use, so the builders can be fed any of them.
+
+import random
+
+import numpy as np
+
+
+def in10_instance():
+    # Parameters
+    return {
+        'num_products': 3,
+        'num_stages': 3,
+        'order_costs': [10, 12, 15],
+        'holding_costs': [1, 2, 3],
+        # Demand scenarios
+        'demand_scenarios': {
+            'scenario1': [[100, 120, 130], [90, 110, 120], [80, 100, 110]],
+            'scenario2': [[110, 130, 140], [100, 120, 130], [90, 110, 120]],
+            'scenario3': [[120, 140, 150], [110, 130, 140], [100, 120, 130]],
+        },
+        'demand_scenario_probabilities': [0.3, 0.4, 0.3],
+        # Disruption scenarios (one flag per stage)
+        'disruption_scenarios': {
+            'scenario1': [0, 0, 0],
+            'scenario2': [0, 0, 1],
+            'scenario3': [1, 0, 0],
+            'scenario4': [1, 0, 1],
+        },
+        'disruption_scenario_probabilities': [0.2, 0.1, 0.3, 0.4],
+    }
+
+
+def in11_instance():
+    instance = in10_instance()
+    instance['min_inventory_levels'] = [30, 40, 50]  # Minimum inventory level requirements for each product
+    return instance
+
+
+def in17_instance():
+    return {
+        'num_products': 3,
+        'num_stages': 3,
+        'num_suppliers': 2,  # Main and backup supplier
+        'num_retailers': 2,
+        'order_costs': [[10, 12, 15], [11, 13, 16]],  # Order costs for main and backup suppliers
+        'holding_costs': [1, 2, 3],
+        'min_inventory_levels': [30, 40, 50],
+        # Adjusted demand scenarios (considering retailers)
+        'demand_scenarios': {
+            'scenario1': [[[100, 120, 130], [80, 100, 110]], [[90, 110, 120], [70, 90, 100]]],
+            'scenario2': [[[110, 130, 140], [90, 110, 120]], [[100, 120, 130], [80, 100, 110]]],
+            'scenario3': [[[120, 140, 150], [100, 120, 130]], [[110, 130, 140], [90, 110, 120]]],
+        },
+        'demand_scenario_probabilities': [0.3, 0.4, 0.3],
+        # Disruption scenarios for suppliers
+        'disruption_scenarios': {
+            'scenario1': [0, 0],  # No disruption
+            'scenario2': [1, 0],  # Main supplier disrupted
+            'scenario3': [0, 1],  # Backup supplier disrupted
+        },
+        'disruption_scenario_probabilities': [0.5, 0.3, 0.2],
+    }
+
+
+def in18_instance():
+    instance = in17_instance()
+    # Revised demand scenarios
+    instance['demand_scenarios'] = {
+        'scenario1': [
+            [[100, 110, 120], [90, 100, 110], [80, 90, 100]],  # Retailer 1
+            [[95, 105, 115], [85, 95, 105], [75, 85, 95]]      # Retailer 2
+        ],
+        'scenario2': [
+            [[110, 120, 130], [100, 110, 120], [90, 100, 110]],
+            [[105, 115, 125], [95, 105, 115], [85, 95, 105]]
+        ],
+        'scenario3': [
+            [[120, 130, 140], [110, 120, 130], [100, 110, 120]],
+            [[115, 125, 135], [105, 115, 125], [95, 105, 115]]
+        ],
+    }
+    return instance
+
+
+def in20_instance(seed=None):
+    rng = random.Random(seed)
+    num_suppliers = 2
+    num_distribution_centers = 2
+    return {
+        'num_products': 3,
+        'num_stages': 3,
+        'num_suppliers': num_suppliers,
+        'num_retailers': 2,
+        'num_distribution_centers': num_distribution_centers,
+        # Synthetic Data Generation
+        'order_costs': [[10 + rng.random(), 12 + rng.random(), 15 + rng.random()] for _ in range(num_suppliers)],
+        'holding_costs': [1, 2, 3],
+        'min_inventory_levels': [30, 40, 50],
+        'distribution_center_capacity': [500, 600],
+        'lead_times': [[rng.randint(1, 5) for _ in range(num_suppliers)] for _ in range(num_distribution_centers)],
+        'demand_scenarios': {
+            'scenario1': [
+                [[100, 110, 120], [90, 100, 110], [80, 90, 100]],
+                [[95, 105, 115], [85, 95, 105], [75, 85, 95]]
+            ],
+            'scenario2': [
+                [[110, 120, 130], [100, 110, 120], [90, 100, 110]],
+                [[105, 115, 125], [95, 105, 115], [85, 95, 105]]
+            ]
+        },
+        'demand_scenario_probabilities': [0.5, 0.5],
+        'disruption_scenarios': {
+            'scenario1': [0, 0],  # No disruption
+            'scenario2': [1, 0],  # Main supplier disrupted
+        },
+        'disruption_scenario_probabilities': [0.5, 0.5],
+    }
+
+
+def in4_instance(seed=None):
+    rng = random.Random(seed)
+    num_stages = 3
+    num_suppliers = 2
+    return {
+        'num_products': 3,
+        'num_stages': num_stages,
+        'num_suppliers': num_suppliers,
+        'num_retailers': 2,
+        'num_distribution_centers': 2,
+        'order_costs': [[10 + rng.random(), 12 + rng.random(), 15 + rng.random()] for _ in range(num_suppliers)],
+        'holding_costs': [1, 2, 3],
+        'carbon_emission_factors': [0.5, 0.7, 0.6],  # Carbon emission factor per product
+        'min_inventory_levels': [30, 40, 50],
+        'distribution_center_capacity': [500, 600],
+        # Dynamic Demand Scenarios
+        'demand_scenarios': {
+            'scenario1': [
+                [[100 + t*5, 110 + t*5, 120 + t*5] for t in range(num_stages)],
+                [[95 + t*5, 105 + t*5, 115 + t*5] for t in range(num_stages)]
+            ],
+            'scenario2': [
+                [[110 + t*5, 120 + t*5, 130 + t*5] for t in range(num_stages)],
+                [[105 + t*5, 115 + t*5, 125 + t*5] for t in range(num_stages)]
+            ]
+        },
+        'demand_scenario_probabilities': [0.5, 0.5],
+        'disruption_scenarios': {
+            'scenario1': [0, 0],
+            'scenario2': [1, 0],
+        },
+        'disruption_scenario_probabilities': [0.5, 0.5],
+    }
+
+
+INSTANCES = {
+    'in10': in10_instance,
+    'in11': in11_instance,
+    'in17': in17_instance,
+    'in18': in18_instance,
+    'in20': in20_instance,
+    'in4': in4_instance,
+}
+
+
+def generate_instance(formulation='in18', num_products=3, num_stages=3, num_suppliers=2, num_retailers=2,
+                      num_distribution_centers=2, num_demand_scenarios=3, num_disruption_scenarios=3, seed=None):
+    # Seeded synthetic instance of any size for a cell formulation, drawn with NumPy in bulk
+    rng = np.random.default_rng(seed)
+    staged = formulation in ('in10', 'in11')
+
+    # Demand: per-(retailer,) product base level, a trend over the stages and a level per scenario
+    base = rng.uniform(80, 120, size=(num_products,) if staged else (num_retailers, num_products))
+    trend = 1 + 0.05 * np.arange(num_stages)
+    level = np.sort(rng.uniform(0.9, 1.2, size=num_demand_scenarios))
+    demand = level.reshape((-1,) + (1,) * base.ndim + (1,)) * base[None, ..., None] * trend
+    demand = np.round(demand * rng.uniform(0.95, 1.05, size=demand.shape))
+
+    # Disruption flags per stage (In[10]/In[11]) or per supplier; the first scenario is undisrupted
+    disruption = (rng.random((num_disruption_scenarios, num_stages if staged else num_suppliers)) < 0.3).astype(int)
+    disruption[0] = 0
+
+    instance = {
+        'num_products': num_products,
+        'num_stages': num_stages,
+        'holding_costs': np.round(rng.uniform(1, 3, num_products), 2).tolist(),
+        'demand_scenarios': {'scenario' + str(k + 1): table.tolist() for k, table in enumerate(demand)},
+        'demand_scenario_probabilities': rng.dirichlet(np.full(num_demand_scenarios, 5.0)).tolist(),
+        'disruption_scenarios': {'scenario' + str(k + 1): flags.tolist() for k, flags in enumerate(disruption)},
+        'disruption_scenario_probabilities': rng.dirichlet(np.full(num_disruption_scenarios, 5.0)).tolist(),
+    }
+    order_costs = np.round(rng.uniform(10, 15, num_products), 2)
+    if staged:
+        instance['order_costs'] = order_costs.tolist()
+    else:
+        # Backup suppliers cost a little more than the main one
+        instance['num_suppliers'] = num_suppliers
+        instance['num_retailers'] = num_retailers
+        instance['order_costs'] = np.round(order_costs + rng.uniform(0, 2, (num_suppliers, 1)) * np.arange(num_suppliers)[:, None], 2).tolist()
+    if formulation != 'in10':
+        instance['min_inventory_levels'] = np.round(rng.uniform(20, 50, num_products)).tolist()
+    if formulation in ('in20', 'in4'):
+        instance['num_distribution_centers'] = num_distribution_centers
+        instance['distribution_center_capacity'] = np.round(rng.uniform(0.8, 1.2, num_distribution_centers) * 100 * num_products).tolist()
+        instance['lead_times'] = rng.integers(1, 6, size=(num_distribution_centers, num_suppliers)).tolist()
+    if formulation == 'in4':
+        instance['carbon_emission_factors'] = np.round(rng.uniform(0.4, 0.8, num_products), 2).tolist()
+    return instance
+
+
+def tile_products(instance, num_products):
+    # Grow an instance to num_products by cycling through its per-product data
+    def tile(values):
+        return [values[p % len(values)] for p in range(num_products)]
+
+    tiled = dict(instance)
+    base = instance['num_products']
+    tiled['num_products'] = num_products
+    for key in ('holding_costs', 'min_inventory_levels', 'carbon_emission_factors'):
+        if key in instance:
+            tiled[key] = tile(instance[key])
+    if 'num_suppliers' in instance:
+        tiled['order_costs'] = [tile(costs) for costs in instance['order_costs']]
+        tiled['demand_scenarios'] = {name: [[retailer[p % base] for p in range(num_products)] for retailer in scenario]
+                                     for name, scenario in instance['demand_scenarios'].items()}
+    else:
+        tiled['order_costs'] = tile(instance['order_costs'])
+        tiled['demand_scenarios'] = {name: tile(scenario) for name, scenario in instance['demand_scenarios'].items()}
+    return tiled
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Lead-time-aware variant of the In[20] formulation.
+#
+# In[20] draws lead_times[d][s] (supplier s -> distribution center d) but
+# lets orders arrive in the period they are placed. Here an order is an arc
+# (product, supplier, DC, order period) that arrives lead_times[d][s]
+# periods later; only arcs arriving inside the horizon exist, so the model
+# grows with the number of feasible arcs (at most P*S*D*T) rather than with
+# a dense order-period x arrival-period grid (P*S*D*T^2). Stock in transit
+# is costed at the holding rate for every period it spends in the pipeline
+# and can be recovered per stage with pipeline_inventory().
+#
+#   Orders[a, r, ds, dp]       arc a = (p, s, d, t) shipped towards retailer r
+#   InventoryLevels[p, t, r, ds, dp]
+#   inventory[t] = inventory[t-1] + arrivals[t] - demand[t]   (initial orders on hand at t = 0)
+
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from formulations import _block, constraint_rhs, instance_arrays, scenario_weights
+from instances import generate_instance, in20_instance
+from sparse_lp import SparseLP
+
+
+def lead_time_arcs(lead_times, num_products, num_stages):
+    # Feasible (product, supplier, DC, order period) arcs and their arrival periods, as int32 columns
+    lead_times = np.asarray(lead_times, dtype=np.int32)   # [d, s]
+    num_distribution_centers, num_suppliers = lead_times.shape
+    p, s, d, t = np.indices((num_products, num_suppliers, num_distribution_centers, num_stages), dtype=np.int32).reshape(4, -1)
+    arrival = t + lead_times[d, s]
+    feasible = arrival < num_stages
+    return {
+        'product': p[feasible], 'supplier': s[feasible], 'dc': d[feasible],
+        'order_period': t[feasible], 'arrival_period': arrival[feasible], 'lead_time': lead_times[d, s][feasible],
+    }
+
+
+def build_lead_time_lp(instance):
+    arrays = instance_arrays(instance, 'in20')
+    weight = scenario_weights(arrays)                                  # [ds, dp]
+    num_demand, num_disruption = weight.shape
+    _, num_retailers, num_products, num_stages = arrays['demand'].shape
+    num_suppliers = arrays['disruption'].shape[1]
+    num_dc = len(arrays['distribution_center_capacity'])
+    arcs = lead_time_arcs(instance['lead_times'], num_products, num_stages)
+    num_arcs = len(arcs['product'])
+    holding, order_costs = arrays['holding_costs'], arrays['order_costs']
+
+    shapes = [
+        ('DCInventory', (num_dc, num_products)),
+        ('InitialOrders', (num_products, num_suppliers)),
+        ('Orders', (num_arcs, num_retailers, num_demand, num_disruption)),
+        ('InventoryLevels', (num_products, num_stages, num_retailers, num_demand, num_disruption)),
+    ]
+    columns, offsets, num_vars = [], {}, 0
+    for name, shape in shapes:
+        columns.append((name, shape, num_vars))
+        offsets[name] = num_vars
+        num_vars += int(np.prod(shape))
+    sizes = dict(shapes)
+
+    # Objective: order cost plus holding for every period in transit, expected over scenarios
+    c = np.zeros(num_vars)
+    c[offsets['DCInventory']:offsets['InitialOrders']] = np.tile(holding, num_dc)
+    c[offsets['InitialOrders']:offsets['Orders']] = order_costs.T.ravel()
+    arc_cost = order_costs[arcs['supplier'], arcs['product']] + holding[arcs['product']] * arcs['lead_time']
+    c[offsets['Orders']:offsets['InventoryLevels']] = (arc_cost[:, None, None, None] * weight[None, None]).repeat(
+        num_retailers, axis=1).ravel() if num_arcs else np.zeros(0)
+    c[offsets['InventoryLevels']:] = (holding[:, None, None, None, None] * weight[None, None, None]).repeat(
+        num_stages, axis=1).repeat(num_retailers, axis=2).ravel()
+
+    # Capacity, initial-order floors and minimum inventory as in In[20]
+    rhs = constraint_rhs(arrays, 'in20')
+    blocks = []
+    rows = np.repeat(np.arange(num_dc), num_products)
+    blocks.append(('CapacityDC', {'DCInventory': _block(rows, np.arange(num_dc * num_products), num_dc, num_dc * num_products)},
+                   '<', rhs['CapacityDC']))
+    rows = np.arange(num_products * num_suppliers * num_disruption)
+    blocks.append(('InitialOrderFloor', {'InitialOrders': _block(rows, rows // num_disruption, rows.size, num_products * num_suppliers)},
+                   '>', rhs['InitialOrderFloor']))
+
+    # Balance, one row per (p, t, r, ds, dp): arrivals in t and the previous stock in, stock and demand out
+    inventory_shape = sizes['InventoryLevels']
+    num_rows = int(np.prod(inventory_shape))
+    p, t, r, ds, dp = np.indices(inventory_shape).reshape(5, -1)
+    own = np.arange(num_rows)
+    later = t > 0
+    previous = own - int(np.prod(inventory_shape[2:]))
+    inventory = _block(np.concatenate([own, own[later]]), np.concatenate([own, previous[later]]), num_rows, num_rows,
+                       np.concatenate([-np.ones(num_rows), np.ones(int(later.sum()))]))
+    first = np.flatnonzero(t == 0)
+    initial = _block(np.repeat(first, num_suppliers), (p[first, None] * num_suppliers + np.arange(num_suppliers)).ravel(),
+                     num_rows, num_products * num_suppliers)
+    # Orders[a, r, ds, dp] lands in row (product[a], arrival[a], r, ds, dp)
+    a, r, ds, dp = np.indices(sizes['Orders']).reshape(4, -1)
+    arrival_rows = np.ravel_multi_index((arcs['product'][a], arcs['arrival_period'][a], r, ds, dp), inventory_shape)
+    orders = _block(arrival_rows, np.arange(arrival_rows.size), num_rows, arrival_rows.size)
+    demand = arrays['demand'].transpose(2, 3, 1, 0)[..., None].repeat(num_disruption, axis=-1).ravel()
+    blocks.append(('Balance', {'InitialOrders': initial, 'Orders': orders, 'InventoryLevels': inventory}, '=', demand))
+    blocks.append(('MinInventory', {'InventoryLevels': sp.identity(num_rows, format='csr')}, '>',
+                   arrays['min_inventory_levels'][p]))
+
+    row_groups, matrices, senses, rhs_parts, start = [], [], [], [], 0
+    for name, coefficients, sense, block_rhs in blocks:
+        matrices.append(sp.hstack([coefficients.get(group, sp.csr_matrix((block_rhs.size, int(np.prod(shape)))))
+                                   for group, shape in shapes], format='csr'))
+        row_groups.append((name, start, start + block_rhs.size))
+        senses.append(np.full(block_rhs.size, sense))
+        rhs_parts.append(block_rhs)
+        start += block_rhs.size
+    lp = SparseLP(sp.vstack(matrices, format='csr'), np.concatenate(senses), np.concatenate(rhs_parts), c,
+                  columns=columns, rows=row_groups)
+    lp.arcs = arcs
+    return lp
+
+
+def pipeline_inventory(lp, solution):
+    # In-transit stock at the end of each stage, [p, t, r, ds, dp]: orders placed at or before t arriving after t
+    arcs = lp.arcs
+    orders = solution['Orders']                                        # [a, r, ds, dp]
+    shape = solution['InventoryLevels'].shape
+    pipeline = np.zeros(shape)
+    for t in range(shape[1]):
+        in_transit = (arcs['order_period'] <= t) & (arcs['arrival_period'] > t)
+        np.add.at(pipeline[:, t], arcs['product'][in_transit], orders[in_transit])
+    return pipeline
+
+
+def dense_size(instance):
+    # Order variables of a dense order-period x arrival-period grid, for comparison
+    num_stages = instance['num_stages']
+    lead_times = np.asarray(instance['lead_times'])
+    arrays = instance_arrays(instance, 'in20')
+    return (instance['num_products'] * lead_times.size * num_stages ** 2 * instance['num_retailers']
+            * arrays['demand'].shape[0] * arrays['disruption'].shape[0])
+
+
+if __name__ == "__main__":
+    from sparse_lp import build_sparse_lp, solve
+
+    # Zero lead times reproduce In[20] (every DC route is an equally priced copy of the cell's order)
+    instance = in20_instance(seed=0)
+    instant = dict(instance, lead_times=np.zeros_like(instance['lead_times']).tolist())
+    print('In[20] %.4f, zero lead times %.4f, lead times %s %.4f' % (
+        solve(build_sparse_lp(instance, 'in20'))['objective'], solve(build_lead_time_lp(instant))['objective'],
+        instance['lead_times'], solve(build_lead_time_lp(instance))['objective']))
+
+    for num_stages in (13, 26, 52, 104):
+        instance = generate_instance('in20', num_stages=num_stages, seed=0)
+        start = time.perf_counter()
+        lp = build_lead_time_lp(instance)
+        build_seconds = time.perf_counter() - start
+        result = solve(lp)
+        solution = lp.unpack(result['x'])
+        print('T=%3d: %6d arcs, %7d vars (dense grid: %8d order vars), %6d rows, build %.3f s, solve %.3f s, '
+              'objective %.1f, mean pipeline stock %.1f'
+              % (num_stages, len(lp.arcs['product']), lp.num_vars, dense_size(instance), lp.num_constrs, build_seconds,
+                 result['seconds'], result['objective'], pipeline_inventory(lp, solution).mean()))
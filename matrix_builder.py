@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Matrix-form builder for the MTP.py formulations.
+#
+# The loop cells add one constraint per (product, stage, retailer, demand
+# scenario, disruption scenario) tuple. Here every variable group is one MVar
+# shaped like its index set and every constraint group is emitted in bulk as a
+# sparse coefficient matrix, which is what makes production-size builds cheap.
+
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from gurobipy import GRB, Model, concatenate, quicksum
+
+from formulations import (FORMULATIONS, STAGED, WITH_DC, carbon_vectors, constraint_blocks, instance_arrays,
+                          objective_vectors, variable_shapes)
+from instances import INSTANCES, tile_products
+
+SENSES = {'<': GRB.LESS_EQUAL, '>': GRB.GREATER_EQUAL, '=': GRB.EQUAL}
+
+
+def build_matrix_model(instance, formulation='in18', arrays=None):
+    if arrays is None:
+        arrays = instance_arrays(instance, formulation)
+
+    # Model
+    m = Model()
+
+    # Variables
+    variables = {name: m.addMVar(shape, vtype=GRB.CONTINUOUS, name=name)
+                 for name, shape in variable_shapes(arrays, formulation)}
+    flat = {name: variable.reshape(-1) for name, variable in variables.items()}
+
+    # Objective: Minimize total cost
+    total_cost = sum(c @ flat[name] for name, c in objective_vectors(arrays, formulation).items())
+    if formulation == 'in4':
+        carbon_emissions = sum(c @ flat[name] for name, c in carbon_vectors(arrays, formulation).items())
+        m.ModelSense = GRB.MINIMIZE
+        m.setObjectiveN(total_cost, 0, priority=1)
+        m.setObjectiveN(carbon_emissions, 1, priority=0)
+    else:
+        m.setObjective(total_cost, GRB.MINIMIZE)
+
+    # Constraints, one sparse block per group
+    constraints = {}
+    for name, coefficients, sense, rhs in constraint_blocks(arrays, formulation):
+        groups = list(coefficients)
+        A = sp.hstack([coefficients[group] for group in groups], format='csr')
+        x = concatenate([flat[group] for group in groups])
+        constraints[name] = m.addMConstr(A, x, SENSES[sense], rhs, name=name)
+    return m, variables, constraints
+
+
+def build_loop_model(instance, formulation='in18'):
+    # The nested-loop construction of the cells, kept for comparison. Scenario data is read from
+    # the typed tables (demand[ds, (r,) p, t], disruption[dp, t or s]) instead of the string-keyed dicts.
+    num_products = instance['num_products']
+    num_stages = instance['num_stages']
+    order_costs = instance['order_costs']
+    holding_costs = instance['holding_costs']
+    min_inventory_levels = instance.get('min_inventory_levels')
+    arrays = instance_arrays(instance, formulation)
+    demand_table = arrays['demand']
+    disruption_table = arrays['disruption']
+    demand_scenario_probabilities = arrays['demand_scenario_probabilities']
+    disruption_scenario_probabilities = arrays['disruption_scenario_probabilities']
+    num_demand_scenarios = len(demand_scenario_probabilities)
+    num_disruption_scenarios = len(disruption_scenario_probabilities)
+
+    m = Model()
+    if formulation in STAGED:
+        initial_orders = m.addVars(num_products, vtype=GRB.CONTINUOUS, name="InitialOrders")
+        additional_orders = m.addVars(num_products, num_stages, num_demand_scenarios, num_disruption_scenarios, vtype=GRB.CONTINUOUS, name="AdditionalOrders")
+        inventory_levels = m.addVars(num_products, num_stages, num_demand_scenarios, num_disruption_scenarios, vtype=GRB.CONTINUOUS, name="InventoryLevels")
+
+        total_cost = quicksum(initial_orders[p] * order_costs[p] for p in range(num_products))
+        total_cost += quicksum(additional_orders[p, t, ds, dp] * order_costs[p] * demand_scenario_probabilities[ds] * disruption_scenario_probabilities[dp] for p in range(num_products) for t in range(num_stages) for ds in range(num_demand_scenarios) for dp in range(num_disruption_scenarios))
+        total_cost += quicksum(inventory_levels[p, t, ds, dp] * holding_costs[p] * demand_scenario_probabilities[ds] * disruption_scenario_probabilities[dp] for p in range(num_products) for t in range(num_stages) for ds in range(num_demand_scenarios) for dp in range(num_disruption_scenarios))
+        m.setObjective(total_cost, GRB.MINIMIZE)
+
+        for p in range(num_products):
+            if formulation == 'in11':
+                m.addConstr(initial_orders[p] >= min_inventory_levels[p])
+            for t in range(num_stages):
+                for ds in range(num_demand_scenarios):
+                    for dp in range(num_disruption_scenarios):
+                        demand = demand_table[ds, p, t]
+                        disruption = disruption_table[dp, t]
+                        if t == 0:
+                            m.addConstr(initial_orders[p] + additional_orders[p, t, ds, dp] - inventory_levels[p, t, ds, dp] == demand * (1 - disruption))
+                        else:
+                            m.addConstr(inventory_levels[p, t-1, ds, dp] + additional_orders[p, t, ds, dp] - inventory_levels[p, t, ds, dp] == demand * (1 - disruption))
+                        if formulation == 'in11':
+                            m.addConstr(inventory_levels[p, t, ds, dp] >= min_inventory_levels[p])
+        return m
+
+    num_suppliers = instance['num_suppliers']
+    num_retailers = instance['num_retailers']
+    if formulation in WITH_DC:
+        num_distribution_centers = instance['num_distribution_centers']
+        distribution_center_capacity = instance['distribution_center_capacity']
+        dc_inventory = m.addVars(num_distribution_centers, num_products, vtype=GRB.CONTINUOUS, name="DCInventory")
+    initial_orders = m.addVars(num_products, num_suppliers, vtype=GRB.CONTINUOUS, name="InitialOrders")
+    additional_orders = m.addVars(num_products, num_stages, num_suppliers, num_retailers, num_demand_scenarios, num_disruption_scenarios, vtype=GRB.CONTINUOUS, name="AdditionalOrders")
+    inventory_levels = m.addVars(num_products, num_stages, num_retailers, num_demand_scenarios, num_disruption_scenarios, vtype=GRB.CONTINUOUS, name="InventoryLevels")
+
+    total_cost = quicksum(initial_orders[p, s] * order_costs[s][p] for p in range(num_products) for s in range(num_suppliers))
+    total_cost += quicksum(additional_orders[p, t, s, r, ds, dp] * order_costs[s][p] * demand_scenario_probabilities[ds] * disruption_scenario_probabilities[dp] for p in range(num_products) for t in range(num_stages) for s in range(num_suppliers) for r in range(num_retailers) for ds in range(num_demand_scenarios) for dp in range(num_disruption_scenarios))
+    total_cost += quicksum(inventory_levels[p, t, r, ds, dp] * holding_costs[p] * demand_scenario_probabilities[ds] * disruption_scenario_probabilities[dp] for p in range(num_products) for t in range(num_stages) for r in range(num_retailers) for ds in range(num_demand_scenarios) for dp in range(num_disruption_scenarios))
+    if formulation in WITH_DC:
+        total_cost += quicksum(dc_inventory[d, p] * holding_costs[p] for d in range(num_distribution_centers) for p in range(num_products))
+    if formulation == 'in4':
+        carbon_emission_factors = instance['carbon_emission_factors']
+        carbon_emissions = quicksum(dc_inventory[d, p] * carbon_emission_factors[p] for d in range(num_distribution_centers) for p in range(num_products))
+        carbon_emissions += quicksum(additional_orders[p, t, s, r, ds, dp] * carbon_emission_factors[p] * demand_scenario_probabilities[ds] * disruption_scenario_probabilities[dp] for p in range(num_products) for t in range(num_stages) for s in range(num_suppliers) for r in range(num_retailers) for ds in range(num_demand_scenarios) for dp in range(num_disruption_scenarios))
+        m.ModelSense = GRB.MINIMIZE
+        m.setObjectiveN(total_cost, 0, priority=1)
+        m.setObjectiveN(carbon_emissions, 1, priority=0)
+    else:
+        m.setObjective(total_cost, GRB.MINIMIZE)
+
+    if formulation in WITH_DC:
+        for d in range(num_distribution_centers):
+            m.addConstr(quicksum(dc_inventory[d, p] for p in range(num_products)) <= distribution_center_capacity[d], f"CapacityDC_{d}")
+
+    for p in range(num_products):
+        for s in range(num_suppliers):
+            for dp in range(num_disruption_scenarios):
+                m.addConstr(initial_orders[p, s] >= min_inventory_levels[p] * (1 - disruption_table[dp, s]))
+
+        for t in range(num_stages):
+            for ds in range(num_demand_scenarios):
+                for r in range(num_retailers):
+                    demand = demand_table[ds, r, p, t]
+                    if np.isnan(demand):  # ragged In[17] table
+                        continue
+                    for dp in range(num_disruption_scenarios):
+                        if t == 0:
+                            m.addConstr(quicksum(initial_orders[p, s] for s in range(num_suppliers)) + quicksum(additional_orders[p, t, s, r, ds, dp] for s in range(num_suppliers)) - inventory_levels[p, t, r, ds, dp] == demand)
+                        else:
+                            m.addConstr(inventory_levels[p, t-1, r, ds, dp] + quicksum(additional_orders[p, t, s, r, ds, dp] for s in range(num_suppliers)) - inventory_levels[p, t, r, ds, dp] == demand)
+                        m.addConstr(inventory_levels[p, t, r, ds, dp] >= min_inventory_levels[p])
+    return m
+
+
+def _objectives(m):
+    if m.NumObj > 1:
+        values = []
+        for i in range(m.NumObj):
+            m.Params.ObjNumber = i
+            values.append(np.array(m.getAttr('ObjN', m.getVars())))
+        return values
+    return [np.array(m.getAttr('Obj', m.getVars()))]
+
+
+def same_model(m1, m2, tol=1e-9):
+    # Same columns, objectives and constraint rows (rows compared as a multiset)
+    m1.update()
+    m2.update()
+    if m1.getAttr('VarName', m1.getVars()) != m2.getAttr('VarName', m2.getVars()) or m1.ModelSense != m2.ModelSense:
+        return False
+    if not all(np.allclose(a, b, atol=tol) for a, b in zip(_objectives(m1), _objectives(m2))):
+        return False
+
+    def rows(m):
+        A = m.getA().tocsr()
+        A.sort_indices()
+        senses = m.getAttr('Sense', m.getConstrs())
+        rhs = m.getAttr('RHS', m.getConstrs())
+        return sorted((tuple(A.indices[A.indptr[i]:A.indptr[i + 1]]),
+                       tuple(np.round(A.data[A.indptr[i]:A.indptr[i + 1]], 9)), senses[i], round(rhs[i], 9))
+                      for i in range(A.shape[0]))
+
+    return rows(m1) == rows(m2)
+
+
+def compare_build_times(instance, formulation='in18', repeat=3, check=True):
+    # Best-of-repeat build time of the loop cells vs the matrix builder
+    def timed(build):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            m = build(instance, formulation)
+            if isinstance(m, tuple):
+                m = m[0]
+            m.update()
+            best = min(best, time.perf_counter() - start)
+        return best, m
+
+    loop_seconds, loop_model = timed(build_loop_model)
+    matrix_seconds, matrix_model = timed(build_matrix_model)
+    result = {
+        'formulation': formulation,
+        'num_vars': matrix_model.NumVars,
+        'num_constrs': matrix_model.NumConstrs,
+        'loop_seconds': loop_seconds,
+        'matrix_seconds': matrix_seconds,
+        'speedup': loop_seconds / matrix_seconds,
+    }
+    if check:
+        result['same_model'] = same_model(loop_model, matrix_model)
+    return result
+
+
+if __name__ == "__main__":
+    for formulation in FORMULATIONS:
+        print(compare_build_times(INSTANCES[formulation](), formulation))
+    # Production-like size: hundreds of SKUs
+    for num_products in (100, 300):
+        print(compare_build_times(tile_products(INSTANCES['in18'](), num_products), 'in18', repeat=1, check=False))
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Network-graph form of the LP models and a min-cost-flow fast path.
+#
+# A deterministic (single demand / disruption scenario) In[17]/In[18]/In[20]
+# model is a time-expanded flow network once reduce_lp() has turned the
+# floors and minimum inventories into bounds and dropped In[20]'s unused DC
+# stock: every Balance row (p, t, r) is a node, orders are arcs from a
+# ground node into it, inventory_levels[p, t, r] is the holding arc to
+# (p, t + 1, r), and demand leaves through the node's supply. network_from_lp()
+# detects this on any SparseLP: every column must have at most one +1 and
+# one -1 entry (an arc from its -1 row to its +1 row, missing ends attached
+# to the ground node); '<' / '>' rows get slack arcs to / from ground and
+# lower bounds are shifted into the node supplies. The result is a Network
+# with array-backed CSR adjacency (arcs sorted by tail).
+#
+# solve_network() dispatches to OR-Tools' min-cost-flow solver when the LP
+# is a network with integral supplies and capacities (costs are scaled to
+# integers) and OR-Tools is installed, and to the LP backend otherwise,
+# reporting why. OR-Tools' solver returns flows only, not node potentials,
+# so the network path has no duals or reduced costs (None);
+# result['duals_available'] says whether they were filled in. The cells' InitialOrders[p, s] enter the first balance row
+# of every retailer, so only single-retailer models are networks.
+
+import time
+
+import numpy as np
+
+from instances import INSTANCES
+from reduction import reduce_lp
+from scenario_store import ScenarioStore
+from sparse_lp import _result, build_sparse_lp, solve
+
+
+class Network:
+    # Nodes 0..num_nodes-1 (the last one is the ground node), supply = outflow - inflow.
+    # Arcs sorted by tail; indptr[n]:indptr[n + 1] are node n's outgoing arcs. column[a] is the LP column the
+    # arc carries (-1 for slack arcs); the LP value is lower[a] + flow[a].
+
+    def __init__(self, num_nodes, tail, head, cost, lower, capacity, column, supply, constant=0.0):
+        order = np.argsort(tail, kind='stable')
+        self.num_nodes = num_nodes
+        self.tail, self.head = tail[order], head[order]
+        self.cost, self.lower, self.capacity = cost[order], lower[order], capacity[order]
+        self.column = column[order]
+        self.supply = supply
+        self.constant = constant
+        self.indptr = np.searchsorted(self.tail, np.arange(num_nodes + 1))
+
+    @property
+    def num_arcs(self):
+        return len(self.tail)
+
+    def out_arcs(self, node):
+        return np.arange(self.indptr[node], self.indptr[node + 1])
+
+    def in_arcs(self, node):
+        return np.flatnonzero(self.head == node)
+
+
+def network_from_lp(lp):
+    # -> (Network, None), or (None, reason) when lp is not a pure network
+    A = lp.A.tocsc()
+    ground = lp.num_constrs
+    if np.any(np.abs(A.data) != 1):
+        return None, 'coefficients other than +1 / -1'
+    column_of = np.repeat(np.arange(lp.num_vars), np.diff(A.indptr))
+    plus, minus = A.data > 0, A.data < 0
+    if np.bincount(column_of[plus], minlength=lp.num_vars).max(initial=0) > 1:
+        return None, 'a column enters more than one row with +1'
+    if np.bincount(column_of[minus], minlength=lp.num_vars).max(initial=0) > 1:
+        return None, 'a column enters more than one row with -1'
+    if np.any(np.isinf(lp.lb)):
+        return None, 'free columns'
+    head = np.full(lp.num_vars, ground)
+    tail = np.full(lp.num_vars, ground)
+    head[column_of[plus]] = A.indices[plus]
+    tail[column_of[minus]] = A.indices[minus]
+
+    # Row i: inflow - outflow (sense) rhs_i; slack arcs turn '>' / '<' rows into equalities
+    greater, less = np.flatnonzero(lp.sense == '>'), np.flatnonzero(lp.sense == '<')
+    num_slacks = len(greater) + len(less)
+    tail = np.concatenate([tail, greater, np.full(len(less), ground)])
+    head = np.concatenate([head, np.full(len(greater), ground), less])
+    cost = np.concatenate([lp.c, np.zeros(num_slacks)])
+    lower = np.concatenate([lp.lb, np.zeros(num_slacks)])
+    capacity = np.concatenate([lp.ub - lp.lb, np.full(num_slacks, np.inf)])
+    column = np.concatenate([np.arange(lp.num_vars), np.full(num_slacks, -1)])
+
+    supply = np.append(-lp.rhs, lp.rhs.sum())
+    # Lower bounds: the tail already sends, the head already receives lower[a]
+    np.subtract.at(supply, tail, lower)
+    np.add.at(supply, head, lower)
+    return Network(ground + 1, tail, head, cost, lower, capacity, column, supply,
+                   lp.obj_constant + float(cost @ lower)), None
+
+
+def _integral(values, tolerance=1e-9):
+    finite = values[np.isfinite(values)]
+    return np.all(np.abs(finite - np.round(finite)) <= tolerance * np.maximum(1, np.abs(finite)))
+
+
+def solve_min_cost_flow(network, max_cost_digits=6):
+    # OR-Tools min-cost flow -> (status, flow) with the flow per arc; ImportError when OR-Tools is missing
+    from ortools.graph.python import min_cost_flow
+
+    if not (_integral(network.supply) and _integral(network.capacity)):
+        return 'fractional supplies or capacities', None
+    for digits in range(max_cost_digits + 1):
+        scaled = network.cost * 10 ** digits
+        if _integral(scaled):
+            break
+    else:
+        return 'costs need more than %d decimals' % max_cost_digits, None
+    unbounded = int(np.abs(network.supply).sum())
+    flow = min_cost_flow.SimpleMinCostFlow()
+    flow.add_arcs_with_capacity_and_unit_cost(
+        network.tail, network.head, np.where(np.isfinite(network.capacity), network.capacity, unbounded).astype(np.int64),
+        np.round(scaled).astype(np.int64))
+    flow.set_nodes_supplies(np.arange(network.num_nodes), np.round(network.supply).astype(np.int64))
+    status = flow.solve()
+    if status != flow.OPTIMAL:
+        return 'min-cost flow status %s' % status, None
+    return 'optimal', flow.flows(np.arange(network.num_arcs)).astype(float)
+
+
+def solve_network(lp, backend='highs'):
+    # Min-cost flow when lp (after reduction) is a network, the LP backend otherwise; result['path'] /
+    # result['reason'] say which was used and why, result['duals_available'] whether duals and reduced
+    # costs are set (False on the network path)
+    start = time.perf_counter()
+    reduction = reduce_lp(lp)
+    network, reason = network_from_lp(reduction.lp)
+    if network is not None:
+        try:
+            status, flow = solve_min_cost_flow(network)
+        except ImportError:
+            status, flow = 'OR-Tools is not installed', None
+        if flow is not None:
+            x = np.zeros(reduction.lp.num_vars)
+            arcs = network.column >= 0
+            x[network.column[arcs]] = network.lower[arcs] + flow[arcs]
+            result = reduction.expand(_result('min_cost_flow', 'optimal', None, x, None, None, 0.0))
+            return dict(result, path='network', reason=None, duals_available=False, num_nodes=network.num_nodes, num_arcs=network.num_arcs,
+                        seconds=time.perf_counter() - start)
+        reason = status
+    # The LP backend on the reduced LP, as the network path would have used
+    result = reduction.expand(solve(reduction.lp, backend))
+    return dict(result, path='lp', reason=reason, duals_available=result['duals'] is not None, seconds=time.perf_counter() - start)
+
+
+def single_scenario(instance, ds=0, dp=0):
+    # The deterministic instance of one (demand scenario, disruption scenario) pair
+    store = instance.get('scenario_store')
+    if store is not None:
+        return dict(instance, scenario_store=ScenarioStore(store.demand[ds:ds + 1], store.disruption[dp:dp + 1],
+                                                           np.ones(1), np.ones(1)))
+    # Cell dicts are keyed scenario1..scenarioN, so the kept scenario becomes scenario1
+    demand = instance['demand_scenarios']['scenario' + str(ds + 1)]
+    disruption = instance['disruption_scenarios']['scenario' + str(dp + 1)]
+    return dict(instance, demand_scenarios={'scenario1': demand}, disruption_scenarios={'scenario1': disruption},
+                demand_scenario_probabilities=[1.0], disruption_scenario_probabilities=[1.0])
+
+
+if __name__ == "__main__":
+    from instances import generate_instance
+
+    for formulation in ('in18', 'in20'):
+        lp = build_sparse_lp(single_scenario(INSTANCES[formulation](seed=0) if formulation == 'in20'
+                                             else INSTANCES[formulation]()), formulation)
+        result = solve_network(lp)
+        print('%s cell instance: path %s (%s), objective %.4f, LP %.4f' % (
+            formulation, result['path'], result['reason'], result['objective'], solve(lp)['objective']))
+
+    for formulation, num_products, num_retailers in (('in18', 5000, 1), ('in20', 5000, 1), ('in18', 1000, 4)):
+        instance = generate_instance(formulation, num_products=num_products, num_stages=12, num_retailers=num_retailers,
+                                     num_demand_scenarios=1, num_disruption_scenarios=1, seed=0)
+        start = time.perf_counter()
+        lp = build_sparse_lp(instance, formulation)
+        build_seconds = time.perf_counter() - start
+        fast = solve_network(lp)
+        reference = solve(lp)
+        print('%s %d products x %d retailers: %d vars, build %.2f s; %s path%s %.2f s (%s nodes, %s arcs), '
+              'HiGHS %.2f s, objective difference %.2e'
+              % (formulation, num_products, num_retailers, lp.num_vars, build_seconds, fast['path'],
+                 ' (%s)' % fast['reason'] if fast['reason'] else '', fast['seconds'], fast.get('num_nodes', '-'),
+                 fast.get('num_arcs', '-'), reference['seconds'], abs(fast['objective'] - reference['objective'])))
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Vectorized newsvendor / base-stock heuristic, with a dual bound and LP warm starts.
+#
+# For every product the initial order is a critical-fractile quantile of the
+# first-stage requirement (demand + min_inventory_levels over retailers and
+# scenarios), raised to the InitialOrderFloor rows; recourse is a base-stock
+# rule that tops inventory up to this stage's demand plus the minimum level,
+# from the cheapest supplier. One NumPy pass over (p, t, (r,) ds, dp) gives
+# a feasible solution of any cell formulation. The critical ratio is
+# premium / (premium + holding), premium being what a unit of recourse costs
+# over a unit ordered up front (0 in the cells, where both pay the same
+# order_costs, so the quantile is the smallest requirement).
+#
+# The same pass prices the Balance rows with a dual-feasible vector,
+#   y[p, t, (r,) ds, dp] = weight[ds, dp] * min(c[p], c[p] / R + t * holding[p]),
+# c[p] the cheapest order cost and R the number of retailers that share an
+# initial order, with the MinInventory / InitialOrderFloor duals set to the
+# resulting reduced costs. By weak duality its value is a lower bound on the
+# LP optimum, so the heuristic reports an optimality gap without an LP.
+# Both vectors can seed a Gurobi solve: PStart/DStart, or a VBasis/CBasis
+# read off the heuristic solution.
+
+import time
+
+import numpy as np
+
+from formulations import (STAGED, WITH_DC, _balance_rhs, constraint_blocks, constraint_rhs, instance_arrays, objective_vectors,
+                          variable_shapes)
+from instances import generate_instance
+
+WARM_STARTS = ('none', 'primal', 'primal-dual', 'basis')
+
+
+def weighted_quantile(values, weights, q):
+    # Per row of values [n, m] the smallest value whose weight share (weights [m]) reaches q
+    order = np.argsort(values, axis=1)
+    share = np.cumsum(weights[order], axis=1) / weights.sum()
+    index = np.minimum((share < q - 1e-12).sum(axis=1), values.shape[1] - 1)
+    return np.take_along_axis(values, order, axis=1)[np.arange(len(values)), index]
+
+
+def _layout(arrays, formulation):
+    shapes = dict(variable_shapes(arrays, formulation))
+    staged = formulation in STAGED
+    order_costs = arrays['order_costs']
+    cheapest = order_costs if staged else order_costs.min(axis=0)           # [p]
+    supplier = None if staged else order_costs.argmin(axis=0)               # [p]
+    minimum = np.zeros_like(arrays['min_inventory_levels']) if formulation == 'in10' else arrays['min_inventory_levels']
+    num_retailers = 1 if staged else arrays['demand'].shape[1]
+    weight = np.outer(arrays['demand_scenario_probabilities'], arrays['disruption_scenario_probabilities'])
+    return shapes, staged, cheapest, supplier, minimum, num_retailers, weight
+
+
+def _floors(arrays, formulation):
+    # Lower bounds the InitialOrderFloor rows put on InitialOrders, shaped like it
+    rhs = constraint_rhs(arrays, formulation)
+    if 'InitialOrderFloor' not in rhs:
+        return np.zeros(len(arrays['min_inventory_levels']))
+    if formulation in STAGED:
+        return rhs['InitialOrderFloor']
+    num_products, num_suppliers = arrays['order_costs'].shape[::-1]
+    return rhs['InitialOrderFloor'].reshape(num_products, num_suppliers, -1).max(axis=2)
+
+
+def base_stock(instance, formulation='in18', premium=0.0):
+    # -> {group: values shaped like the variable group}
+    arrays = instance_arrays(instance, formulation)
+    shapes, staged, cheapest, supplier, minimum, num_retailers, weight = _layout(arrays, formulation)
+    inventory_shape = shapes['InventoryLevels']
+    requirement = _balance_rhs(arrays, formulation).reshape(inventory_shape)   # [p, t, (r,) ds, dp], net demand
+    exists = ~np.isnan(requirement)
+    requirement = np.nan_to_num(requirement)
+    num_products, num_stages = inventory_shape[:2]
+    extra = (1,) * (len(inventory_shape) - 2)
+    level = minimum.reshape((num_products,) + extra)
+
+    # Initial orders: critical-fractile quantile of the stage-0 requirement, at least the floors
+    floors = _floors(arrays, formulation)
+    ratio = premium / (premium + arrays['holding_costs'])                      # [p]
+    need = (requirement[:, 0] + level).reshape(num_products, -1)
+    quantile = np.array([weighted_quantile(need[p:p + 1], np.tile(weight.ravel(), num_retailers), ratio[p])[0]
+                         for p in range(num_products)]) if premium else need.min(axis=1)
+    if staged:
+        initial = np.maximum(floors, quantile)
+        delivered = initial
+    else:
+        initial = floors.copy()
+        initial[np.arange(num_products), supplier] += np.maximum(quantile - floors.sum(axis=1), 0)
+        delivered = initial.sum(axis=1)
+
+    # Recourse: top up to demand + minimum every stage
+    inventory = np.zeros(inventory_shape)
+    orders = np.zeros(inventory_shape)
+    stock = np.broadcast_to(delivered.reshape((num_products,) + extra), requirement[:, 0].shape)
+    for t in range(num_stages):
+        orders[:, t] = np.maximum(requirement[:, t] + level - stock, 0) * exists[:, t]
+        inventory[:, t] = (stock + orders[:, t] - requirement[:, t]) * exists[:, t]
+        stock = inventory[:, t]
+
+    solution = {'InitialOrders': initial, 'InventoryLevels': inventory}
+    if staged:
+        solution['AdditionalOrders'] = orders
+    else:
+        additional = np.zeros(shapes['AdditionalOrders'])                     # [p, t, s, r, ds, dp]
+        additional[np.arange(num_products), :, supplier] = orders[np.arange(num_products)]
+        solution['AdditionalOrders'] = additional
+    if formulation in WITH_DC:
+        solution = dict(DCInventory=np.zeros(shapes['DCInventory']), **solution)
+    return solution
+
+
+def dual_prices(instance, formulation='in18'):
+    # Dual-feasible row prices per constraint group (Gurobi Pi convention) and their bound on the LP optimum;
+    # None for ragged demand tables, where the construction does not apply
+    arrays = instance_arrays(instance, formulation)
+    shapes, staged, cheapest, supplier, minimum, num_retailers, weight = _layout(arrays, formulation)
+    balance_rhs = _balance_rhs(arrays, formulation)
+    if np.isnan(balance_rhs).any():
+        return None, None
+    inventory_shape = shapes['InventoryLevels']
+    num_products, num_stages = inventory_shape[:2]
+    holding = arrays['holding_costs']
+    price = np.minimum(cheapest[:, None], cheapest[:, None] / num_retailers + np.arange(num_stages) * holding[:, None])
+    weights = weight.reshape((1, 1) + (1,) * (len(inventory_shape) - 4) + weight.shape)
+    extra = (1,) * (len(inventory_shape) - 2)
+    y = np.broadcast_to(price.reshape((num_products, num_stages) + extra) * weights, inventory_shape)  # [p, t, (r,) ds, dp]
+
+    # Reduced costs of InventoryLevels and InitialOrders under y go to their bound rows
+    following = np.concatenate([y[:, 1:], np.zeros_like(y[:, :1])], axis=1)
+    holding_cost = holding.reshape((num_products, 1) + extra) * weights
+    inventory_rc = holding_cost + y - following
+    rhs = constraint_rhs(arrays, formulation)
+    duals = {'Balance': y.ravel()}
+    if 'MinInventory' in rhs:
+        duals['MinInventory'] = inventory_rc.ravel()
+    stage_zero = y[:, 0].reshape(num_products, -1).sum(axis=1)                  # [p]
+    if staged:
+        initial_rc = arrays['order_costs'] - stage_zero
+        if 'InitialOrderFloor' in rhs:
+            duals['InitialOrderFloor'] = initial_rc
+    else:
+        initial_rc = arrays['order_costs'].T - stage_zero[:, None]                 # [p, s]
+        floor_rhs = rhs['InitialOrderFloor'].reshape(initial_rc.shape + (-1,))
+        floor = np.zeros_like(floor_rhs)
+        # all of it on the tightest floor row of each (p, s)
+        np.put_along_axis(floor, floor_rhs.argmax(axis=2)[..., None], initial_rc[..., None], axis=2)
+        duals['InitialOrderFloor'] = floor.ravel()
+    if formulation in WITH_DC:
+        duals = dict(CapacityDC=np.zeros(len(arrays['distribution_center_capacity'])), **duals)
+    bound = sum(float(duals[group] @ rhs[group]) for group in duals)
+    return duals, bound
+
+
+def objective(solution, instance, formulation):
+    costs = objective_vectors(instance_arrays(instance, formulation), formulation)
+    return float(sum(costs[group] @ values.ravel() for group, values in solution.items()))
+
+
+def slacks(solution, arrays, formulation):
+    # rhs - activity per constraint group, and the largest violation of the group senses
+    slack, violation = {}, 0.0
+    for group, coefficients, sense, rhs in constraint_blocks(arrays, formulation):
+        slack[group] = rhs - sum(block @ solution[name].ravel() for name, block in coefficients.items())
+        side = {'<': -slack[group], '>': slack[group], '=': np.abs(slack[group])}[sense]
+        violation = max(violation, float(side.max(initial=0)))
+    return slack, violation
+
+
+def heuristic(instance, formulation='in18', premium=0.0):
+    # Instant approximate answer: solution, its cost, the dual bound and the gap between them
+    start = time.perf_counter()
+    solution = base_stock(instance, formulation, premium)
+    cost = objective(solution, instance, formulation)
+    duals, bound = dual_prices(instance, formulation)
+    return {
+        'solution': solution, 'objective': cost, 'duals': duals, 'lower_bound': bound,
+        'gap': None if bound is None else (cost - bound) / max(1.0, abs(cost)),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def warm_start(variables, constraints, start, mode='primal-dual'):
+    # Seed a matrix-builder / PersistentModel model with a heuristic() result ('basis' also needs its slacks)
+    if mode == 'none':
+        return
+    if mode == 'basis':
+        # Positive variables and slack rows basic, the rest nonbasic at zero; tight rows fill the basis up to
+        # one basic entry per row so that Gurobi accepts it (degenerate basic slacks)
+        column_basis = {group: np.where(start['solution'][group].ravel() > 1e-9, 0, -1) for group in variables}
+        row_basis = {group: np.where(np.abs(start['slack'][group]) > 1e-9, 0, -1) for group in constraints}
+        missing = sum(basis.size for basis in row_basis.values()) - sum(
+            int((basis == 0).sum()) for basis in list(column_basis.values()) + list(row_basis.values()))
+        for basis in row_basis.values():
+            tight = np.flatnonzero(basis == -1)[:max(missing, 0)]
+            basis[tight] = 0
+            missing -= len(tight)
+        for group, variable in variables.items():
+            variable.VBasis = column_basis[group].reshape(variable.shape)
+        for group, constraint in constraints.items():
+            constraint.CBasis = row_basis[group]
+        return
+    for group, variable in variables.items():
+        variable.PStart = start['solution'][group]
+    if mode == 'primal-dual' and start['duals'] is not None:
+        for group, constraint in constraints.items():
+            constraint.DStart = start['duals'][group]
+
+
+def benchmark(instance, formulation='in18', modes=WARM_STARTS, method=-1, presolve=0):
+    # Iterations and wall time of a cold solve against each warm start, plus the heuristic's own gap.
+    # Presolve is off by default: Gurobi drops starts it cannot map through a presolved model
+    from gurobipy import GRB
+
+    from matrix_builder import build_matrix_model
+
+    start = heuristic(instance, formulation)
+    arrays = instance_arrays(instance, formulation)
+    start['slack'] = slacks(start['solution'], arrays, formulation)[0]
+    results = {'heuristic': {'objective': start['objective'], 'lower_bound': start['lower_bound'], 'gap': start['gap'],
+                             'seconds': start['seconds']}}
+    for mode in modes:
+        m, variables, constraints = build_matrix_model(instance, formulation, arrays)
+        m.Params.OutputFlag = 0
+        m.Params.Method = method
+        m.Params.Presolve = presolve
+        m.update()
+        begin = time.perf_counter()
+        warm_start(variables, constraints, start, mode)
+        m.optimize()
+        results[mode] = {'objective': m.ObjVal if m.Status == GRB.OPTIMAL else None,
+                         'iterations': int(m.IterCount), 'seconds': time.perf_counter() - begin}
+    return results
+
+
+if __name__ == "__main__":
+    from sparse_lp import build_sparse_lp, solve
+
+    # Heuristic against the LP on generated instances; the LP is only needed for the comparison
+    for formulation in ('in11', 'in18', 'in20'):
+        for num_products, num_retailers in ((100, 1), (1000, 1), (1000, 3)):
+            if formulation == 'in11' and num_retailers > 1:
+                continue
+            instance = generate_instance(formulation, num_products=num_products, num_retailers=num_retailers,
+                                         num_stages=6, num_demand_scenarios=4, num_disruption_scenarios=4, seed=0)
+            result = heuristic(instance, formulation)
+            violation = slacks(result['solution'], instance_arrays(instance, formulation), formulation)[1]
+            lp = solve(build_sparse_lp(instance, formulation))
+            print('%s %4d products x %d retailers: heuristic %.2f in %.4f s (violation %.1e), bound %.2f (gap %.2e); '
+                  'LP %.2f in %.2f s' % (formulation, num_products, num_retailers, result['objective'], result['seconds'],
+                                         violation, result['lower_bound'], result['gap'], lp['objective'], lp['seconds']))
+
+    # Warm starts (sizes within the size-limited Gurobi license used here)
+    for formulation, num_products, num_retailers in (('in11', 8, 1), ('in18', 4, 1), ('in18', 3, 2)):
+        instance = generate_instance(formulation, num_products=num_products, num_retailers=num_retailers, num_stages=6,
+                                     num_demand_scenarios=3, num_disruption_scenarios=3, seed=0)
+        for method, name in ((0, 'primal simplex'), (1, 'dual simplex')):
+            results = benchmark(instance, formulation, method=method)
+            print('%s x %d retailers, %s (heuristic gap %.2e): ' % (formulation, num_retailers, name, results['heuristic']['gap'])
+                  + ', '.join('%s %d it %.4f s' % (mode, results[mode]['iterations'], results[mode]['seconds'])
+                              for mode in WARM_STARTS))
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Cost / carbon Pareto frontier of the In[4] model.
+#
+# In[4] ranks the objectives lexicographically (setObjectiveN priorities),
+# which gives one end of the trade-off curve. Here the whole curve is traced
+# with either
+#   epsilon   min cost + delta * carbon  s.t.  carbon <= epsilon, over a grid of epsilon
+#   weighted  min (1 - w) * cost / cost range + w * carbon / carbon range, over a grid of w
+# between the two lexicographic anchor points. The grid is split into
+# contiguous blocks, one per worker of a ScenarioPool; a worker keeps one
+# model and walks its block in order, so every solve starts from the basis
+# of the neighbouring grid point. Segments where the curve bends sharply are
+# then refined with extra grid points, again spread over the workers.
+
+import os
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from instances import INSTANCES
+from scenario_pool import ScenarioPool
+from sparse_lp import SparseLP, build_sparse_lp, solve, solve_lexicographic
+
+METHODS = ('epsilon', 'weighted')
+
+
+def anchors(lp, backend='highs'):
+    # Lexicographic optima: cost first (In[4]'s priorities) and carbon first
+    (cost_name, cost), (carbon_name, carbon) = lp.objectives
+    cost_first = solve_lexicographic(lp, backend)
+    reordered = SparseLP(lp.A, lp.sense, lp.rhs, carbon, lp.lb, lp.ub, lp.columns, lp.rows,
+                         objectives=[(carbon_name, carbon), (cost_name, cost)])
+    carbon_first = solve_lexicographic(reordered, backend)
+    return ((float(cost @ cost_first['x']), float(carbon @ cost_first['x'])),
+            (float(cost @ carbon_first['x']), float(carbon @ carbon_first['x'])))
+
+
+class FrontierSolver:
+    # One worker's model, re-solved over a block of grid points; ranges normalise the two objectives
+
+    def __init__(self, lp, ranges, backend='gurobi', threads=1):
+        self.lp = lp
+        self.cost, self.carbon = lp.objectives[0][1], lp.objectives[1][1]
+        self.cost_range, self.carbon_range = ranges
+        self.delta = 1e-6 * self.cost_range / self.carbon_range  # keeps epsilon points non-dominated
+        self.backend = backend
+        if backend == 'gurobi':
+            from gurobipy import GRB
+
+            from sparse_lp import to_gurobi
+
+            self.m, self.x = to_gurobi(lp)
+            self.m.Params.OutputFlag = 0
+            self.m.Params.Threads = threads
+            self.epsilon_row = self.m.addMConstr(sp.csr_matrix(self.carbon), self.x, GRB.LESS_EQUAL,
+                                                 np.array([np.inf]), name='EpsilonCarbon')
+
+    def _solve(self, c, epsilon):
+        # -> (x, iterations)
+        if self.backend == 'gurobi':
+            from gurobipy import GRB
+
+            self.x.Obj = c
+            self.epsilon_row.RHS = np.array([epsilon])
+            self.m.optimize()
+            if self.m.Status != GRB.OPTIMAL:
+                return None, int(self.m.IterCount)
+            return self.x.X, int(self.m.IterCount)
+        lp = self.lp
+        if np.isfinite(epsilon):
+            stage = SparseLP(sp.vstack([lp.A, sp.csr_matrix(self.carbon)], format='csr'), np.append(lp.sense, '<'),
+                             np.append(lp.rhs, epsilon), c, lp.lb, lp.ub)
+        else:
+            stage = SparseLP(lp.A, lp.sense, lp.rhs, c, lp.lb, lp.ub)
+        result = solve(stage, self.backend)
+        return result['x'], 0
+
+    def _points(self, parameters, objective, epsilon):
+        points = []
+        for parameter in parameters:
+            x, iterations = self._solve(objective(parameter), epsilon(parameter))
+            if x is None:
+                points.append((parameter, np.nan, np.nan, iterations, None))
+            else:
+                points.append((parameter, float(self.cost @ x), float(self.carbon @ x), iterations, x))
+        return points
+
+    def epsilon(self, bounds):
+        return self._points(bounds, lambda _: self.cost + self.delta * self.carbon, lambda bound: bound)
+
+    def weighted(self, weights):
+        return self._points(weights, lambda w: (1 - w) * self.cost / self.cost_range + w * self.carbon / self.carbon_range,
+                            lambda _: np.inf)
+
+
+def non_dominated(cost, carbon, tolerance=1e-7):
+    # Indices of the non-dominated points, by increasing cost
+    order = np.lexsort((carbon, cost))
+    keep, best = [], np.inf
+    for i in order:
+        if np.isfinite(cost[i]) and carbon[i] < best - tolerance * max(1.0, abs(best) if np.isfinite(best) else 1.0):
+            keep.append(i)
+            best = carbon[i]
+    return np.array(keep, dtype=int)
+
+
+def _bends(cost, carbon, ranges, angle_tolerance, min_spacing):
+    # Indices i of consecutive frontier points (i, i + 1) whose segment should be split: one of its
+    # ends turns by more than angle_tolerance degrees and the segment is longer than min_spacing
+    x, y = cost / ranges[0], carbon / ranges[1]
+    dx, dy = np.diff(x), np.diff(y)
+    heading = np.degrees(np.arctan2(dy, dx))
+    turn = np.abs(np.diff(heading))
+    sharp = np.zeros(len(dx), dtype=bool)
+    sharp[:-1] |= turn > angle_tolerance
+    sharp[1:] |= turn > angle_tolerance
+    return np.flatnonzero(sharp & (np.hypot(dx, dy) > min_spacing))
+
+
+def _blocks(values, num_blocks):
+    return [block for block in np.array_split(np.asarray(values), num_blocks) if len(block)]
+
+
+def pareto_frontier(instance, formulation='in4', method='epsilon', num_points=20, processes=None, backend='gurobi',
+                    refine_rounds=3, angle_tolerance=5.0, min_spacing=1e-3, verbose=False):
+    if method not in METHODS:
+        raise ValueError('method must be one of %s' % (METHODS,))
+    start = time.perf_counter()
+    lp = build_sparse_lp(instance, formulation)
+    if len(lp.objectives) != 2:
+        raise ValueError('%s has %d objectives, the frontier needs two' % (formulation, len(lp.objectives)))
+    (cost_low, carbon_high), (cost_high, carbon_low) = anchors(lp, backend)
+    ranges = (max(cost_high - cost_low, 1e-9), max(carbon_high - carbon_low, 1e-9))
+
+    # Grid parameters in sweep order, each block walked by one worker from neighbour to neighbour
+    if method == 'epsilon':
+        grid = np.linspace(carbon_high, carbon_low, num_points)
+    else:
+        grid = np.linspace(0.0, 1.0, num_points)
+    num_workers = max(1, min(os.cpu_count() if processes is None else processes, num_points))
+    points = []
+    with ScenarioPool(FrontierSolver, [lp] * num_workers, processes, ranges=ranges, backend=backend) as pool:
+        pending = grid
+        for round_ in range(refine_rounds + 1):
+            blocks = _blocks(pending, num_workers)
+            results = pool.map(method, per_scenario=[(block,) for block in blocks] + [(np.empty(0),)] * (num_workers - len(blocks)))
+            points += [point for block in results for point in block]
+            if verbose:
+                print('round %d: %d solves' % (round_, len(pending)))
+            if round_ == refine_rounds:
+                break
+
+            # Refine where the current frontier bends
+            parameters = np.array([point[0] for point in points])
+            cost = np.array([point[1] for point in points])
+            carbon = np.array([point[2] for point in points])
+            front = non_dominated(cost, carbon)
+            order = front[np.argsort(parameters[front])]
+            split = _bends(cost[order], carbon[order], ranges, angle_tolerance, min_spacing)
+            pending = np.unique((parameters[order][split] + parameters[order][split + 1]) / 2)
+            pending = np.setdiff1d(pending, parameters)
+            if method == 'epsilon':
+                pending = pending[::-1]
+            if not len(pending):
+                break
+
+    parameters = np.array([point[0] for point in points])
+    cost = np.array([point[1] for point in points])
+    carbon = np.array([point[2] for point in points])
+    front = non_dominated(cost, carbon)
+    return {
+        'method': method,
+        'parameter': parameters[front],
+        'cost': cost[front],
+        'carbon': carbon[front],
+        # Per-point solutions as one (points x variables) float32 array, columns laid out as lp.columns
+        'x': np.array([points[i][4] for i in front], dtype=np.float32),
+        'iterations': np.array([points[i][3] for i in front]),
+        'anchors': ((cost_low, carbon_high), (cost_high, carbon_low)),
+        'num_solves': len(points),
+        'seconds': time.perf_counter() - start,
+        'lp': lp,
+    }
+
+
+def save_frontier(frontier, path):
+    # Compact .npz: frontier arrays plus the column layout needed to unpack x
+    lp = frontier['lp']
+    np.savez_compressed(path, parameter=frontier['parameter'], cost=frontier['cost'], carbon=frontier['carbon'],
+                        x=frontier['x'], iterations=frontier['iterations'],
+                        column_groups=np.array([name for name, _, _ in lp.columns]),
+                        column_shapes=np.array([str(shape) for _, shape, _ in lp.columns]),
+                        column_starts=np.array([start for _, _, start in lp.columns]))
+
+
+if __name__ == "__main__":
+    from instances import generate_instance
+
+    for name, instance in (('In[4]', INSTANCES['in4'](seed=0)),
+                           ('generated', generate_instance('in4', num_products=8, num_disruption_scenarios=4, seed=0))):
+        for method in METHODS:
+            for backend, processes in (('gurobi', 1), ('gurobi', 4), ('highs', 4)):
+                frontier = pareto_frontier(instance, 'in4', method, num_points=12, processes=processes, backend=backend)
+                print('%s %-8s %-6s processes=%d: %d non-dominated points from %d solves, %.2f s, mean iterations %.1f'
+                      % (name, method, backend, processes, len(frontier['cost']), frontier['num_solves'],
+                         frontier['seconds'], frontier['iterations'].mean()))
+        for cost, carbon in zip(frontier['cost'], frontier['carbon']):
+            print('    cost %10.2f  carbon %9.2f' % (cost, carbon))
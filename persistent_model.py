@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Long-lived model for repeated re-optimization.
+#
+# The Gurobi model of a formulation is built once with the matrix builder.
+# Forecast, cost, capacity and minimum-inventory changes are applied in
+# place: demand only rewrites the RHS of the Balance rows, costs only the
+# objective coefficients. The model keeps its last basis, so a re-solve is a
+# few warm-started simplex iterations instead of a Python rebuild.
+
+import time
+
+import numpy as np
+from gurobipy import GRB
+
+from formulations import STAGED, carbon_vectors, constraint_rhs, instance_arrays, objective_vectors, scenario_table
+from instances import INSTANCES
+from matrix_builder import build_loop_model, build_matrix_model
+from sparse_lp import gurobi_status
+
+
+class PersistentModel:
+
+    def __init__(self, instance, formulation='in18', threads=None):
+        self.instance = dict(instance)
+        self.formulation = formulation
+        self.arrays = instance_arrays(instance, formulation)
+        self.m, self.variables, self.constraints = build_matrix_model(instance, formulation)
+        # Apply the builder's pending objectives now, or they would overwrite the first in-place update
+        self.m.update()
+        self.m.Params.OutputFlag = 0
+        if threads is not None:
+            self.m.Params.Threads = threads
+        self.relaxed = set()
+
+    # RHS updates
+
+    def _set_rhs(self, *groups):
+        rhs = constraint_rhs(self.arrays, self.formulation)
+        for group in groups:
+            if group in self.constraints:
+                self.constraints[group].RHS = np.zeros_like(rhs[group]) if group in self.relaxed else rhs[group]
+
+    def relax_rows(self, *groups):
+        # Hold the RHS of these '>' row groups at 0 from now on (e.g. InitialOrderFloor once stock is carried in)
+        self.relaxed.update(groups)
+        self._set_rhs(*groups)
+
+    def update_demand(self, demand_scenarios):
+        # Cell-style dict or an array shaped like the demand table; scenario count and layout are fixed
+        if isinstance(demand_scenarios, dict):
+            self.instance['demand_scenarios'] = demand_scenarios
+            demand = scenario_table(demand_scenarios, self.arrays['demand'].shape)
+        else:
+            demand = np.asarray(demand_scenarios, dtype=float)
+        if demand.shape != self.arrays['demand'].shape or not np.array_equal(np.isnan(demand), np.isnan(self.arrays['demand'])):
+            raise ValueError('Demand table shape %s does not match the model %s' % (demand.shape, self.arrays['demand'].shape))
+        self.arrays['demand'] = demand
+        self._set_rhs('Balance')
+
+    def update_disruption(self, disruption_scenarios):
+        # Disruption flags enter the balance RHS (In[10]/In[11]) or the initial-order floors
+        if isinstance(disruption_scenarios, dict):
+            self.instance['disruption_scenarios'] = disruption_scenarios
+            disruption = scenario_table(disruption_scenarios, self.arrays['disruption'].shape)
+        else:
+            disruption = np.asarray(disruption_scenarios, dtype=float)
+        if disruption.shape != self.arrays['disruption'].shape:
+            raise ValueError('Disruption table shape %s does not match the model %s' % (disruption.shape, self.arrays['disruption'].shape))
+        self.arrays['disruption'] = disruption
+        self._set_rhs('Balance' if self.formulation in STAGED else 'InitialOrderFloor')
+
+    def update_initial_inventory(self, initial_inventory):
+        # Starting stock, [p] (In[10]/In[11]) or [p, r]; netted off the first-stage balance rows
+        self.arrays['initial_inventory'] = np.asarray(initial_inventory, dtype=float)
+        self._set_rhs('Balance')
+
+    def update_min_inventory(self, min_inventory_levels):
+        self.arrays['min_inventory_levels'] = np.asarray(min_inventory_levels, dtype=float)
+        self._set_rhs('InitialOrderFloor', 'MinInventory')
+
+    def update_capacity(self, distribution_center_capacity):
+        self.arrays['distribution_center_capacity'] = np.asarray(distribution_center_capacity, dtype=float)
+        self._set_rhs('CapacityDC')
+
+    # Objective updates
+
+    def _set_objective(self):
+        # Cost objective, and In[4]'s carbon objective, which is weighted by the scenario probabilities too
+        if self.m.NumObj <= 1:
+            for group, c in objective_vectors(self.arrays, self.formulation).items():
+                self.variables[group].Obj = c.reshape(self.variables[group].shape)
+            return
+        for number, vectors in enumerate((objective_vectors, carbon_vectors)):
+            self.m.Params.ObjNumber = number
+            for group, c in vectors(self.arrays, self.formulation).items():
+                self.variables[group].ObjN = c.reshape(self.variables[group].shape)
+
+    def update_costs(self, order_costs=None, holding_costs=None):
+        if order_costs is not None:
+            self.arrays['order_costs'] = np.asarray(order_costs, dtype=float)
+        if holding_costs is not None:
+            self.arrays['holding_costs'] = np.asarray(holding_costs, dtype=float)
+        self._set_objective()
+
+    def update_probabilities(self, demand_scenario_probabilities=None, disruption_scenario_probabilities=None):
+        if demand_scenario_probabilities is not None:
+            self.arrays['demand_scenario_probabilities'] = np.asarray(demand_scenario_probabilities, dtype=float)
+        if disruption_scenario_probabilities is not None:
+            self.arrays['disruption_scenario_probabilities'] = np.asarray(disruption_scenario_probabilities, dtype=float)
+        self._set_objective()
+
+    def solve(self, warm_start=True):
+        # warm_start=False discards the basis, for comparison
+        if not warm_start:
+            self.m.reset()
+        start = time.perf_counter()
+        self.m.optimize()
+        return {
+            'status': gurobi_status(self.m.Status),
+            'objective': self.m.ObjVal if self.m.Status == GRB.OPTIMAL else None,
+            'iterations': int(self.m.IterCount),
+            'seconds': time.perf_counter() - start,
+        }
+
+
+def benchmark_updates(instance, formulation='in18', num_updates=10, noise=0.1, seed=None):
+    # Re-solve after demand forecast changes: loop rebuild, matrix rebuild, in-place update
+    rng = np.random.default_rng(seed)
+    model = PersistentModel(instance, formulation)
+    model.solve()
+    base = model.arrays['demand'].copy()
+    timings = {'loop_rebuild': [], 'matrix_rebuild': [], 'incremental': []}
+    objectives = {key: [] for key in timings}
+    for _ in range(num_updates):
+        demand = np.round(base * rng.uniform(1 - noise, 1 + noise, size=base.shape))
+        updated = dict(instance)
+        updated['demand_scenarios'] = {'scenario' + str(k + 1): table.tolist() for k, table in enumerate(demand)}
+
+        for key, build in (('loop_rebuild', build_loop_model), ('matrix_rebuild', build_matrix_model)):
+            start = time.perf_counter()
+            m = build(updated, formulation)
+            m = m[0] if isinstance(m, tuple) else m
+            m.Params.OutputFlag = 0
+            m.optimize()
+            timings[key].append((time.perf_counter() - start, m.IterCount))
+            objectives[key].append(m.ObjVal)
+
+        start = time.perf_counter()
+        model.update_demand(demand)
+        result = model.solve()
+        timings['incremental'].append((time.perf_counter() - start, result['iterations']))
+        objectives['incremental'].append(result['objective'])
+
+    if not np.allclose(objectives['incremental'], objectives['matrix_rebuild']):
+        raise RuntimeError('Incremental re-solve disagrees with the rebuilt model')
+    return {key: {'mean_seconds': float(np.mean([s for s, _ in values])),
+                  'mean_iterations': float(np.mean([it for _, it in values]))}
+            for key, values in timings.items()}
+
+
+if __name__ == "__main__":
+    for formulation in ('in11', 'in18', 'in20'):
+        instance = INSTANCES[formulation](seed=0) if formulation == 'in20' else INSTANCES[formulation]()
+        print(formulation, benchmark_updates(instance, formulation, seed=0))
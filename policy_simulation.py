@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Vectorized Monte Carlo evaluation of a solved policy.
+#
+# The optimised first-stage decisions (initial_orders, DC inventory) are
+# replayed together with a recourse rule against many sampled demand /
+# disruption paths. Each chunk of paths is one NumPy pass over
+# (path, [retailer,] product) arrays per stage, so memory is bounded by the
+# chunk size; chunks are independent (own seed) and can be spread over
+# worker processes. Inventory that would go negative is a lost sale.
+#
+# Dynamics follow the cells: the initial orders are on hand in the first
+# stage (at every retailer in In[17]-In[4]), additional orders arrive in the
+# stage they are placed, and In[10]/In[11] disruption flags remove that
+# stage's demand. In In[17]-In[4] disruption only lowers the cells'
+# InitialOrderFloor, so every initial order is billed and delivered and
+# recourse goes to the cheapest supplier, as in the LP being replayed.
+# blocked_deliveries=True is the harsher opt-in reading: a disrupted
+# supplier's initial orders are still billed but never arrive, and recourse
+# goes to the cheapest supplier still available.
+#
+# A lost sale costs shortage_penalty per unit, [p] or scalar; the default is
+# SHORTAGE_MULTIPLIER times the product's dearest order cost, so a policy
+# cannot look cheaper than the LP optimum by simply not serving demand.
+
+import time
+
+import numpy as np
+
+from formulations import STAGED, WITH_DC, instance_arrays
+from instances import INSTANCES
+from scenario_pool import ScenarioPool
+from scenario_reduction import sample_paths
+
+PERCENTILES = (5, 25, 50, 75, 95, 99)
+SHORTAGE_MULTIPLIER = 10.0
+
+
+# Recourse rules: rule(t, inventory, demand, disruption) -> order quantity shaped like inventory,
+# [n, p] or [n, r, p]. demand / disruption are the chunk's full paths; a rule may only look at
+# stages <= t (the cells' recourse sees the current stage's demand before ordering).
+
+class NoRecourse:
+
+    def __call__(self, t, inventory, demand, disruption):
+        return np.zeros_like(inventory)
+
+
+class BaseStock:
+    # Order up to a level per [p] or [r, p] before demand is seen
+
+    def __init__(self, levels):
+        self.levels = np.asarray(levels, dtype=float)
+
+    def __call__(self, t, inventory, demand, disruption):
+        return np.maximum(self.levels - inventory, 0.0)
+
+
+class CoverDemand:
+    # Order what this stage's demand plus a safety stock (default min_inventory_levels) needs
+
+    def __init__(self, safety):
+        self.safety = np.asarray(safety, dtype=float)
+
+    def __call__(self, t, inventory, demand, disruption):
+        return np.maximum(demand[..., t] + self.safety - inventory, 0.0)
+
+
+class ScenarioRecourse:
+    # The optimised additional_orders of the in-sample scenario closest to the path so far:
+    # demand scenario by squared distance over stages <= t, disruption scenario by matching flags
+
+    def __init__(self, solution, arrays, formulation):
+        self.staged = formulation in STAGED
+        additional = np.asarray(solution['AdditionalOrders'])
+        # [ds, dp, t, (r,) p], summed over suppliers
+        self.orders = additional.transpose(2, 3, 1, 0) if self.staged else additional.sum(axis=2).transpose(3, 4, 1, 2, 0)
+        self.demand = arrays['demand']            # [ds, (r,) p, t]
+        self.disruption = arrays['disruption']    # [dp, t] or [dp, s]
+
+    def __call__(self, t, inventory, demand, disruption):
+        seen = demand[..., :t + 1].reshape(len(demand), -1, t + 1)
+        scenarios = np.nan_to_num(self.demand[..., :t + 1]).reshape(len(self.demand), -1, t + 1)
+        distance = ((seen[:, None] - scenarios[None]) ** 2).sum(axis=(2, 3))
+        ds = distance.argmin(axis=1)
+        flags = disruption[:, :t + 1] if self.staged else disruption
+        known = self.disruption[:, :t + 1] if self.staged else self.disruption
+        dp = np.abs(flags[:, None] - known[None]).sum(axis=2).argmin(axis=1)
+        return self.orders[ds, dp, t]
+
+
+class PolicySimulator:
+
+    def __init__(self, instance, formulation, first_stage, rule, noise=0.1, shortage_penalty=None,
+                 blocked_deliveries=False):
+        self.instance = instance
+        self.formulation = formulation
+        self.arrays = instance_arrays(instance, formulation)
+        self.staged = formulation in STAGED
+        self.first_stage = {group: np.asarray(values, dtype=float) for group, values in first_stage.items()}
+        self.rule = rule
+        self.noise = noise
+        if shortage_penalty is None:
+            order_costs = self.arrays['order_costs']
+            shortage_penalty = SHORTAGE_MULTIPLIER * (order_costs if self.staged else order_costs.max(axis=0))
+        self.shortage_penalty = np.asarray(shortage_penalty, dtype=float)
+        self.blocked_deliveries = blocked_deliveries
+
+    def run(self, num_paths, seed=None):
+        # One chunk: sample, simulate, return per-path costs and summed counters
+        arrays = self.arrays
+        demand, disruption = sample_paths(self.instance, self.formulation, num_paths, seed, self.noise)
+        demand = np.nan_to_num(demand)
+        num_stages = demand.shape[-1]
+        holding, minimum = arrays['holding_costs'], arrays['min_inventory_levels']
+        initial = self.first_stage['InitialOrders']
+
+        if self.staged:
+            order_costs = arrays['order_costs']                         # [p]
+            cost = np.full(num_paths, order_costs @ initial)
+            inventory = np.broadcast_to(initial, (num_paths, len(initial))).copy()
+            unit_cost = np.broadcast_to(order_costs, inventory.shape)
+            effective = demand * (1 - disruption[:, None, :])           # [n, p, t]
+        else:
+            order_costs = arrays['order_costs']                         # [s, p]
+            # Every initial order is billed; with blocked_deliveries a disrupted supplier's never arrive
+            cost = np.full(num_paths, float(np.sum(initial.T * order_costs)))
+            available = 1 - disruption if self.blocked_deliveries else np.ones_like(disruption)  # [n, s]
+            delivered = available[:, :, None] * initial.T[None]         # [n, s, p]
+            num_retailers = demand.shape[1]
+            inventory = np.repeat(delivered.sum(axis=1)[:, None, :], num_retailers, axis=1)  # [n, r, p]
+            # Recourse goes to the cheapest available supplier; inf when every supplier is down
+            masked = np.where(available[:, :, None] > 0, order_costs[None], np.inf)
+            unit_cost = masked.min(axis=1)[:, None, :]                   # [n, 1, p]
+            effective = demand
+            if self.formulation in WITH_DC:
+                cost += holding @ self.first_stage['DCInventory'].sum(axis=0)
+
+        total_demand = np.zeros(inventory.shape[-1])
+        lost = np.zeros(inventory.shape[-1])
+        stockout_path = np.zeros(num_paths, dtype=bool)
+        violation_path = np.zeros(num_paths, dtype=bool)
+        stockout_cells = violation_cells = 0
+        for t in range(num_stages):
+            orders = self.rule(t, inventory, demand, disruption)
+            supplied = np.isfinite(unit_cost)
+            orders = np.where(supplied, orders, 0.0)
+            cost += (np.where(supplied, unit_cost, 0.0) * orders).reshape(num_paths, -1).sum(axis=1)
+            inventory = inventory + orders - effective[..., t]
+            short = np.maximum(-inventory, 0.0)
+            inventory = np.maximum(inventory, 0.0)
+            cost += (inventory * holding).reshape(num_paths, -1).sum(axis=1)
+            cost += (self.shortage_penalty * short).reshape(num_paths, -1).sum(axis=1)
+
+            axes = tuple(range(short.ndim - 1))
+            total_demand += effective[..., t].sum(axis=axes)
+            lost += short.sum(axis=axes)
+            stocked_out = short > 1e-9
+            below = inventory < minimum - 1e-9
+            stockout_cells += int(stocked_out.sum())
+            violation_cells += int(below.sum())
+            stockout_path |= stocked_out.reshape(num_paths, -1).any(axis=1)
+            violation_path |= below.reshape(num_paths, -1).any(axis=1)
+
+        return {
+            'costs': cost,
+            'demand': total_demand,
+            'lost': lost,
+            'stockout_paths': int(stockout_path.sum()),
+            'violation_paths': int(violation_path.sum()),
+            'stockout_cells': stockout_cells,
+            'violation_cells': violation_cells,
+            'cells': num_paths * num_stages * int(np.prod(inventory.shape[1:])),
+        }
+
+
+class _Chunk:
+    # ScenarioPool payload: one chunk of paths with its own seed
+
+    def __init__(self, payload, simulator):
+        self.num_paths, self.seed = payload
+        self.simulator = simulator
+
+    def run(self):
+        return self.simulator.run(self.num_paths, self.seed)
+
+
+def summarize(chunks, seconds=None):
+    costs = np.concatenate([chunk['costs'] for chunk in chunks])
+    demand = sum(chunk['demand'] for chunk in chunks)
+    lost = sum(chunk['lost'] for chunk in chunks)
+    cells = sum(chunk['cells'] for chunk in chunks)
+    tail = costs[costs >= np.percentile(costs, 95)]
+    return {
+        'num_paths': len(costs),
+        'mean_cost': float(costs.mean()),
+        'std_cost': float(costs.std(ddof=1)) if len(costs) > 1 else 0.0,
+        'standard_error': float(costs.std(ddof=1) / np.sqrt(len(costs))) if len(costs) > 1 else 0.0,
+        'percentiles': dict(zip(PERCENTILES, np.percentile(costs, PERCENTILES).tolist())),
+        'cvar_95': float(tail.mean()),
+        'fill_rate': float(1 - lost.sum() / demand.sum()) if demand.sum() > 0 else 1.0,
+        'fill_rate_by_product': np.where(demand > 0, 1 - lost / np.where(demand > 0, demand, 1), 1.0),
+        'stockout_probability': sum(chunk['stockout_paths'] for chunk in chunks) / len(costs),
+        'stockout_frequency': sum(chunk['stockout_cells'] for chunk in chunks) / cells,
+        'min_inventory_violation_probability': sum(chunk['violation_paths'] for chunk in chunks) / len(costs),
+        'min_inventory_violation_frequency': sum(chunk['violation_cells'] for chunk in chunks) / cells,
+        'seconds': seconds,
+        'costs': costs,
+    }
+
+
+def simulate_policy(instance, formulation, first_stage, rule, num_paths=100000, chunk_size=50000, seed=None,
+                    processes=1, noise=0.1, shortage_penalty=None, blocked_deliveries=False):
+    # Chunks get independent child seeds, so results do not depend on processes
+    start = time.perf_counter()
+    simulator = PolicySimulator(instance, formulation, first_stage, rule, noise, shortage_penalty, blocked_deliveries)
+    sizes = [min(chunk_size, num_paths - offset) for offset in range(0, num_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    with ScenarioPool(_Chunk, list(zip(sizes, seeds)), processes, simulator=simulator) as pool:
+        chunks = pool.map('run')
+    return summarize(chunks, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    from sparse_lp import build_sparse_lp, solve
+
+    for formulation in ('in11', 'in18', 'in20'):
+        instance = INSTANCES[formulation](seed=0) if formulation == 'in20' else INSTANCES[formulation]()
+        lp = build_sparse_lp(instance, formulation)
+        optimum = solve(lp)
+        solution = lp.unpack(optimum['x'])
+        print('%s LP objective %.1f' % (formulation, optimum['objective']))
+        first_stage = {group: solution[group] for group in ('DCInventory', 'InitialOrders') if group in solution}
+        arrays = instance_arrays(instance, formulation)
+        rules = {
+            'scenario': ScenarioRecourse(solution, arrays, formulation),
+            'cover': CoverDemand(arrays['min_inventory_levels']),
+            'none': NoRecourse(),
+        }
+        for name, rule in rules.items():
+            # Same seed, same numbers for any number of processes
+            result = simulate_policy(instance, formulation, first_stage, rule, num_paths=1000000, seed=0, processes=None)
+            print('%s %-8s: mean %.1f (se %.2f) p95 %.1f fill %.4f stockout %.4f min-inv violations %.4f  %.2f s'
+                  % (formulation, name, result['mean_cost'], result['standard_error'],
+                     result['percentiles'][95], result['fill_rate'], result['stockout_probability'],
+                     result['min_inventory_violation_probability'], result['seconds']))
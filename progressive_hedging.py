@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Progressive hedging over the (demand scenario, disruption scenario) pairs.
+#
+# Each scenario keeps one small model of its own (first-stage rows, its
+# recourse rows) that is created once inside a ScenarioPool worker. Every
+# iteration only the linear penalty on initial_orders changes; the proximal
+# term is set once. Iterations stop when the scenarios agree on the first stage.
+
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from benders import FIRST_STAGE, RecourseSolver, split_stages
+from formulations import instance_arrays, scenario_weights
+from instances import INSTANCES
+from scenario_pool import ScenarioPool
+from sparse_lp import build_sparse_lp, solve
+
+
+def scenario_models(lp, probabilities):
+    # Payload per scenario: [x, y_k] over the master rows stacked on the scenario rows
+    master, subproblems = split_stages(lp)
+    num_first = master['c'].size
+    payloads = []
+    for probability, sub in zip(probabilities, subproblems):
+        A = sp.vstack([sp.hstack([master['A'], sp.csr_matrix((master['A'].shape[0], sub['q'].size))]),
+                       sp.hstack([sub['T'], sub['W']])], format='csr')
+        payloads.append({
+            'A': A, 'sense': np.concatenate([master['sense'], sub['sense']]), 'rhs': np.concatenate([master['rhs'], sub['h']]),
+            'c': master['c'], 'q': sub['q'], 'lb': np.concatenate([master['lb'], sub['lb']]),
+            'ub': np.concatenate([master['ub'], sub['ub']]), 'num_first': num_first, 'probability': probability,
+        })
+    return master, subproblems, payloads
+
+
+class ScenarioQP:
+    # min p * (c x + w x + rho/2 |x - xbar|^2) + q y over one scenario's rows.
+    # q already carries the scenario probability, as in the extensive form.
+
+    def __init__(self, payload, rho, threads=1):
+        from gurobipy import GRB, Model
+
+        self.payload = payload
+        self.rho = rho
+        self.m = Model()
+        self.m.Params.OutputFlag = 0
+        self.m.Params.Threads = threads
+        num_first = payload['num_first']
+        self.z = self.m.addMVar(payload['lb'].size, lb=payload['lb'], ub=payload['ub'],
+                                obj=np.concatenate([payload['probability'] * payload['c'], payload['q']]),
+                                vtype=GRB.CONTINUOUS, name='z')
+        self.x = self.z[:num_first]
+        self.m.addMConstr(payload['A'], self.z, payload['sense'], payload['rhs'])
+        self.proximal = False
+        self.optimal = GRB.OPTIMAL
+
+    def solve(self, xbar=None, w=None):
+        p = self.payload['probability']
+        if w is not None:
+            if not self.proximal:
+                # Quadratic part is fixed for the whole run, only the linear part is updated below
+                self.m.setObjective(self.x @ sp.diags(0.5 * p * self.rho) @ self.x
+                                    + np.concatenate([p * self.payload['c'], self.payload['q']]) @ self.z)
+                self.proximal = True
+            self.x.Obj = p * (self.payload['c'] + w - self.rho * xbar)
+        self.m.optimize()
+        if self.m.Status != self.optimal:
+            raise RuntimeError('Scenario model not solved to optimality (status %d)' % self.m.Status)
+        return self.x.X, self.m.IterCount + self.m.BarIterCount
+
+
+def solve_progressive_hedging(lp, probabilities, rho=1.0, processes=None, tolerance=1e-4, max_iterations=500,
+                              compare_extensive=False, verbose=False):
+    master, subproblems, payloads = scenario_models(lp, probabilities)
+    probabilities = np.asarray(probabilities, dtype=float)
+    rho = np.broadcast_to(np.asarray(rho, dtype=float), master['c'].shape).copy()
+    history = []
+    start = time.perf_counter()
+    with ScenarioPool(ScenarioQP, payloads, processes, rho=rho) as pool:
+        # Iteration 0: independent scenario solves
+        iteration_start = time.perf_counter()
+        x = np.array([xs for xs, _ in pool.map('solve')])
+        xbar = probabilities @ x
+        w = rho * (x - xbar)
+        for iteration in range(1, max_iterations + 1):
+            results = pool.map('solve', xbar, per_scenario=[(wk,) for wk in w])
+            x = np.array([xs for xs, _ in results])
+            xbar_new = probabilities @ x
+            w += rho * (x - xbar_new)
+            # Disagreement: expected distance of the scenario first stages from their average;
+            # movement: change of the average itself, which must settle too before stopping
+            scale = max(1.0, np.abs(xbar_new).sum())
+            disagreement = probabilities @ np.abs(x - xbar_new).sum(axis=1) / scale
+            movement = np.abs(xbar_new - xbar).sum() / scale
+            history.append({'iteration': iteration, 'seconds': time.perf_counter() - iteration_start,
+                            'disagreement': disagreement, 'movement': movement,
+                            'solver_iterations': int(sum(it for _, it in results))})
+            iteration_start = time.perf_counter()
+            xbar = xbar_new
+            if verbose:
+                print(history[-1])
+            if disagreement <= tolerance and movement <= tolerance:
+                break
+
+    # Expected cost of the consensus first stage, from the exact recourse values
+    objective = master['c'] @ xbar + sum(RecourseSolver(sub).cut(xbar)[0] for sub in subproblems)
+    first_stage = np.zeros(lp.num_vars)
+    first_stage[master['cols']] = xbar
+    result = {
+        'objective': objective,
+        'first_stage': {group: values for group, values in lp.unpack(first_stage).items() if group in FIRST_STAGE},
+        'iterations': len(history),
+        'seconds': time.perf_counter() - start,
+        'history': history,
+    }
+    if compare_extensive:
+        extensive = solve(lp)['objective']
+        result['extensive_objective'] = extensive
+        result['gap'] = (objective - extensive) / max(1.0, abs(extensive))
+    return result
+
+
+if __name__ == "__main__":
+    for formulation in ('in11', 'in18', 'in20'):
+        instance = INSTANCES[formulation](seed=0) if formulation == 'in20' else INSTANCES[formulation]()
+        lp = build_sparse_lp(instance, formulation)
+        probabilities = scenario_weights(instance_arrays(instance, formulation)).ravel()
+        result = solve_progressive_hedging(lp, probabilities, processes=2, compare_extensive=True)
+        print(formulation, 'iterations:', result['iterations'], 'objective:', result['objective'],
+              'extensive form:', result['extensive_objective'], 'gap: %.2e' % result['gap'],
+              'mean iteration seconds: %.4f' % np.mean([h['seconds'] for h in result['history']]))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Pre-reduction of a SparseLP before the solver model is built.
+#
+# The builders emit rows that need not exist: MinInventory adds
+# inventory_levels[...] >= min_inventory_levels[p] as one row per index and
+# InitialOrderFloor repeats initial_orders[p, s] >= ... once per disruption
+# scenario. reduce_lp() repeatedly
+#   - turns single-variable rows into column bounds (the tightest wins),
+#   - keeps one row of every set of parallel rows (same coefficients up to a
+#     positive factor): the tightest rhs for inequalities, one copy of an
+#     equality,
+#   - drops columns fixed by their bounds, and dominated columns (cost >= 0
+#     in every objective, entries only loosening their rows as the column
+#     decreases, e.g. In[20]'s DCInventory in CapacityDC) at their lower
+#     bound, moving their contribution into the rhs and the objective
+#     constant,
+#   - drops rows left empty.
+# Reduction.expand() maps a solve of the reduced LP back to full-size x,
+# duals and reduced costs: a row turned into a bound gets the reduced cost
+# of its column when that bound is active. The removed columns'
+# contribution is added back to the objective, and to every objective of a
+# solve_lexicographic() result (In[4] carbon; returned without duals).
+#
+# Optionally (prune_disrupted_orders) the AdditionalOrders of suppliers
+# that are disrupted in a scenario are fixed at zero first. The cells do not
+# impose this, so it changes the model and is opt-in.
+
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from formulations import STAGED, instance_arrays
+from instances import INSTANCES
+from sparse_lp import SparseLP, build_sparse_lp, solve
+
+
+def prune_disrupted_orders(lp, instance, formulation):
+    # Copy of lp with AdditionalOrders[p, t, s, r, ds, dp] fixed at 0 where supplier s is down in dp
+    if formulation in STAGED:
+        raise ValueError('In[10]/In[11] disruptions are per stage, not per supplier')
+    disruption = instance_arrays(instance, formulation)['disruption']        # [dp, s]
+    columns = lp.column_slice('AdditionalOrders')
+    shape = dict((name, shape) for name, shape, _ in lp.columns)['AdditionalOrders']
+    down = np.broadcast_to(disruption.T[None, None, :, None, None, :] > 0, shape).ravel()
+    ub = lp.ub.copy()
+    ub[columns] = np.where(down, 0.0, ub[columns])
+    return SparseLP(lp.A, lp.sense, lp.rhs, lp.c, lp.lb, ub, lp.columns, lp.rows, lp.objectives, lp.obj_constant)
+
+
+def _parallel_groups(A, rows):
+    # Groups of rows (indices into `rows`) with identical sparsity and coefficients up to a positive factor,
+    # as (group id per row, scale per row); rows are compared on a random projection first, then exactly
+    R = A[rows]
+    R.sort_indices()
+    scale = np.abs(R.data[R.indptr[:-1]])
+    Rn = (sp.diags(1 / scale) @ R).tocsr()
+    rng = np.random.default_rng(0)
+    keys = np.column_stack([Rn @ rng.uniform(1, 2, (A.shape[1], 2)), np.diff(R.indptr)])
+    _, group = np.unique(np.round(keys, 9), axis=0, return_inverse=True)
+    group = group.ravel()
+    # Split projection collisions on the exact coefficients
+    candidates = np.flatnonzero(np.bincount(group)[group] > 1)
+    exact, first_id = {}, group.max() + 1
+    for i in candidates:
+        row = slice(Rn.indptr[i], Rn.indptr[i + 1])
+        key = (Rn.indices[row].tobytes(), Rn.data[row].tobytes())
+        group[i] = exact.setdefault(key, first_id + len(exact))
+    return group, scale
+
+
+class Reduction:
+
+    def __init__(self, lp, lp_reduced, kept_columns, kept_rows, fixed, bound_rows, report):
+        self.original = lp
+        self.lp = lp_reduced
+        self.kept_columns = kept_columns
+        self.kept_rows = kept_rows
+        self.fixed = fixed            # full-size x with the values of the removed columns
+        self.bound_rows = bound_rows  # (rows, columns, bounds) of the rows turned into bounds
+        self.report = report
+
+    def expand(self, result):
+        # Reduced-LP solve result -> result of the original LP
+        lp = self.original
+        if result['status'] != 'optimal':
+            return dict(result)
+        x = self.fixed.copy()
+        x[self.kept_columns] = result['x']
+        objective = float(lp.c @ x) + lp.obj_constant
+        if 'objectives' in result:
+            # Lexicographic: each stage optimum plus that objective's share of the removed columns. The duals
+            # belong to the last stage (with its bound rows), not to lp.c
+            objectives = [(name, value + float(c @ self.fixed) + (lp.obj_constant if k == 0 else 0.0))
+                          for k, ((name, c), (_, value)) in enumerate(zip(lp.objectives, result['objectives']))]
+            return dict(result, x=x, objective=objectives[0][1], objectives=objectives, duals=None, reduced_costs=None)
+        if result.get('duals') is None:
+            return dict(result, x=x, objective=objective)
+        duals = np.zeros(lp.num_constrs)
+        duals[self.kept_rows] = result['duals']
+        reduced_costs = lp.c - lp.A.T @ duals
+        # A singleton row whose bound is active carries its column's reduced cost
+        rows, cols, bound = self.bound_rows
+        if len(rows):
+            a = np.asarray(lp.A[rows, cols]).ravel()
+            active = np.isclose(x[cols], bound, rtol=1e-9, atol=1e-9)
+            rows, cols, a = rows[active], cols[active], a[active]
+            cols, first = np.unique(cols, return_index=True)
+            duals[rows[first]] = reduced_costs[cols] / a[first]
+            reduced_costs = lp.c - lp.A.T @ duals
+        return dict(result, x=x, duals=duals, reduced_costs=reduced_costs, objective=objective)
+
+
+def reduce_lp(lp, max_rounds=10, tolerance=1e-9):
+    started = time.perf_counter()
+    A = lp.A.tocsr()
+    rhs = lp.rhs.copy()             # net of the removed columns' values
+    lb, ub = lp.lb.copy(), lp.ub.copy()
+    row_alive = np.ones(lp.num_constrs, dtype=bool)
+    col_alive = np.ones(lp.num_vars, dtype=bool)
+    fixed = np.zeros(lp.num_vars)
+    bound_rows, bound_cols, bound_values = [], [], []
+    counts = {'singleton_rows': 0, 'duplicate_rows': 0, 'empty_rows': 0, 'fixed_columns': 0, 'dominated_columns': 0}
+    # A column only counts as dominated when no objective rewards raising it
+    nonnegative = np.all([c >= 0 for _, c in lp.objectives], axis=0) & (lp.c >= 0)
+
+    for _ in range(max_rounds):
+        changed = False
+        live = sp.diags(row_alive.astype(float)) @ A @ sp.diags(col_alive.astype(float))
+        live.eliminate_zeros()
+        live = live.tocsr()
+        nnz = np.diff(live.indptr)
+
+        # Singleton rows -> bounds
+        single = np.flatnonzero(row_alive & (nnz == 1))
+        if len(single):
+            cols = live.indices[live.indptr[single]]
+            a = live.data[live.indptr[single]]
+            bound = rhs[single] / a
+            sense = lp.sense[single]
+            lower = (sense == '=') | ((sense == '>') & (a > 0)) | ((sense == '<') & (a < 0))
+            upper = (sense == '=') | ((sense == '<') & (a > 0)) | ((sense == '>') & (a < 0))
+            np.maximum.at(lb, cols[lower], bound[lower])
+            np.minimum.at(ub, cols[upper], bound[upper])
+            row_alive[single] = False
+            bound_rows.append(single)
+            bound_cols.append(cols)
+            bound_values.append(bound)
+            counts['singleton_rows'] += len(single)
+            changed = True
+        if np.any(lb > ub + tolerance * np.maximum(1, np.abs(lb))):
+            raise ValueError('Reduction found the LP infeasible: conflicting bounds')
+
+        # Parallel rows: keep the tightest
+        multi = np.flatnonzero(row_alive & (nnz > 1))
+        if len(multi) > 1:
+            group, scale = _parallel_groups(live, multi)
+            scaled = rhs[multi] / scale
+            sense = lp.sense[multi]
+            order = np.lexsort((scaled, sense, group))
+            drop = []
+            boundaries = np.flatnonzero(np.diff(np.append(-1, group[order])) != 0)
+            for begin, end in zip(boundaries, np.append(boundaries[1:], len(order))):
+                if end - begin < 2:
+                    continue
+                members = order[begin:end]
+                for kind in ('<', '>', '='):
+                    same = members[sense[members] == kind]
+                    if len(same) < 2:
+                        continue
+                    # sorted by rhs: '<' keeps the smallest, '>' the largest, '=' one copy when all agree
+                    if kind == '=':
+                        if np.ptp(scaled[same]) > tolerance * max(1.0, np.abs(scaled[same]).max()):
+                            raise ValueError('Reduction found the LP infeasible: parallel equalities differ')
+                        drop.append(same[1:])
+                    else:
+                        drop.append(same[1:] if kind == '<' else same[:-1])
+            if drop:
+                drop = multi[np.concatenate(drop)]
+                row_alive[drop] = False
+                counts['duplicate_rows'] += len(drop)
+                changed = True
+
+        # Columns fixed by their bounds, or dominated: lowering them costs nothing and only loosens their
+        # rows (positive entries in '<' rows, negative in '>' rows), so they sit at the lower bound
+        entries = live.tocoo()
+        loosening = ((lp.sense[entries.row] == '<') & (entries.data > 0)) | ((lp.sense[entries.row] == '>') & (entries.data < 0))
+        blocking = np.bincount(entries.col[~loosening], minlength=lp.num_vars)
+        fixed_now = col_alive & (ub - lb <= tolerance * np.maximum(1, np.abs(lb)))
+        dominated = col_alive & ~fixed_now & (blocking == 0) & nonnegative & np.isfinite(lb)
+        for mask, key in ((fixed_now, 'fixed_columns'), (dominated, 'dominated_columns')):
+            if mask.any():
+                fixed[mask] = lb[mask]
+                rhs -= A[:, mask] @ lb[mask]
+                col_alive[mask] = False
+                counts[key] += int(mask.sum())
+                changed = True
+
+        if not changed:
+            break
+
+    # Rows left empty must hold at the fixed values
+    live = (A @ sp.diags(col_alive.astype(float))).tocsr()
+    live.eliminate_zeros()
+    empty = row_alive & (np.diff(live.indptr) == 0)
+    violated = ((lp.sense == '<') & (rhs < -tolerance)) | ((lp.sense == '>') & (rhs > tolerance)) | \
+               ((lp.sense == '=') & (np.abs(rhs) > tolerance))
+    if np.any(empty & violated):
+        raise ValueError('Reduction found the LP infeasible: an emptied row cannot hold')
+    row_alive &= ~empty
+    counts['empty_rows'] = int(empty.sum())
+
+    kept_rows, kept_columns = np.flatnonzero(row_alive), np.flatnonzero(col_alive)
+    columns, start = [], 0
+    for name, shape, first in lp.columns:
+        count = int(col_alive[first:first + int(np.prod(shape))].sum())
+        if count:
+            columns.append((name, (count,), start))
+            start += count
+    rows, start = [], 0
+    for name, first, stop in lp.rows:
+        count = int(row_alive[first:stop].sum())
+        if count:
+            rows.append((name, start, start + count))
+            start += count
+    objectives = [(name, c[kept_columns]) for name, c in lp.objectives]
+    reduced = SparseLP(A[kept_rows][:, kept_columns], lp.sense[kept_rows], rhs[kept_rows], lp.c[kept_columns],
+                       lb[kept_columns], ub[kept_columns], columns, rows, objectives,
+                       lp.obj_constant + float(lp.c @ fixed))
+    report = dict(counts, num_vars=(lp.num_vars, reduced.num_vars), num_constrs=(lp.num_constrs, reduced.num_constrs),
+                  num_nonzeros=(lp.A.nnz, reduced.A.nnz), seconds=time.perf_counter() - started)
+    bound_rows = tuple(np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+                       for parts, dtype in ((bound_rows, int), (bound_cols, int), (bound_values, float)))
+    return Reduction(lp, reduced, kept_columns, kept_rows, fixed, bound_rows, report)
+
+
+def format_report(report):
+    return ('vars %d -> %d, constrs %d -> %d, nonzeros %d -> %d (%d singleton rows to bounds, %d duplicate rows, '
+            '%d empty rows, %d fixed and %d dominated columns dropped) in %.3f s'
+            % (report['num_vars'] + report['num_constrs'] + report['num_nonzeros']
+               + (report['singleton_rows'], report['duplicate_rows'], report['empty_rows'], report['fixed_columns'],
+                  report['dominated_columns'], report['seconds'])))
+
+
+if __name__ == "__main__":
+    from instances import generate_instance
+
+    for formulation in ('in11', 'in18', 'in20'):
+        instance = INSTANCES[formulation](seed=0) if formulation == 'in20' else INSTANCES[formulation]()
+        lp = build_sparse_lp(instance, formulation)
+        reduction = reduce_lp(lp)
+        full, reduced = solve(lp), reduction.expand(solve(reduction.lp))
+        print(formulation, format_report(reduction.report))
+        print('   objective %.4f (full %.4f), max dual difference %.2e'
+              % (reduced['objective'], full['objective'], np.abs(lp.c - lp.A.T @ reduced['duals'] - reduced['reduced_costs']).max()))
+
+    # At scale, with and without pruning the orders of disrupted suppliers
+    instance = generate_instance('in18', num_products=500, num_demand_scenarios=5, num_disruption_scenarios=5, seed=0)
+    lp = build_sparse_lp(instance, 'in18')
+    full = solve(lp)
+    for name, model in (('in18 500 products', lp), ('  + disrupted orders pruned', prune_disrupted_orders(lp, instance, 'in18'))):
+        reduction = reduce_lp(model)
+        result = solve(reduction.lp)
+        print(name, format_report(reduction.report))
+        print('   objective %.2f (full model %.2f), solve %.3f s (full model %.3f s)'
+              % (reduction.expand(result)['objective'], full['objective'], result['seconds'], full['seconds']))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Rolling-horizon planning with the In[10]/In[11] and In[17]/In[18] models.
+#
+# A long planning horizon (e.g. 52 weekly stages) is covered by solving a
+# W-stage window, committing its first period under the demand/disruption
+# scenario that is then realized, carrying the realized inventory_levels
+# forward as the next window's starting stock and shifting the window by one
+# stage. One PersistentModel is built for the window size and re-used: each
+# shift only rewrites the balance right-hand sides (and the stage disruption
+# flags of In[10]/In[11]), so every window re-solve starts from the previous
+# basis. Windows running past the horizon repeat its last stage. The
+# InitialOrderFloor rows only apply to the first window: later windows start
+# from the carried stock, and re-imposing the floor would buy the minimum
+# level from every supplier every week.
+
+import time
+
+import numpy as np
+
+from formulations import STAGED, WITH_DC, instance_arrays
+from instances import generate_instance
+from persistent_model import PersistentModel
+from scenario_store import ScenarioStore
+from solution_extract import extract_mvars
+
+
+def _window(table, start, window):
+    # Stages [start, start + window) of the last axis, padded with the last stage
+    stages = np.minimum(np.arange(start, start + window), table.shape[-1] - 1)
+    return table[..., stages]
+
+
+def sample_realization(arrays, num_stages, seed=None):
+    # Realized (demand scenario, disruption scenario) per stage, drawn by the scenario probabilities
+    rng = np.random.default_rng(seed)
+    demand = rng.choice(len(arrays['demand_scenario_probabilities']), size=num_stages, p=arrays['demand_scenario_probabilities'])
+    disruption = rng.choice(len(arrays['disruption_scenario_probabilities']), size=num_stages,
+                            p=arrays['disruption_scenario_probabilities'])
+    return list(zip(demand.tolist(), disruption.tolist()))
+
+
+def rolling_horizon(instance, formulation='in18', window=4, realization=None, seed=None, warm_start=True, threads=None,
+                    verbose=False):
+    # instance covers the whole horizon (num_stages stages). realization: [(ds, dp)] per stage, sampled if None.
+    if formulation in WITH_DC:
+        raise ValueError('Rolling horizon supports In[10]/In[11]/In[17]/In[18], not ' + formulation)
+    arrays = instance_arrays(instance, formulation)
+    num_stages = instance['num_stages']
+    if realization is None:
+        realization = sample_realization(arrays, num_stages, seed)
+    staged = formulation in STAGED
+
+    def window_store(start):
+        disruption = _window(arrays['disruption'], start, window) if staged else arrays['disruption']
+        return ScenarioStore(_window(arrays['demand'], start, window), disruption,
+                             arrays['demand_scenario_probabilities'], arrays['disruption_scenario_probabilities'])
+
+    window_instance = dict(instance, num_stages=window)
+    start = time.perf_counter()
+    model = PersistentModel(window_store(0).attach(window_instance), formulation, threads=threads)
+    build_seconds = time.perf_counter() - start
+
+    order_costs, holding_costs = arrays['order_costs'], arrays['holding_costs']
+    stock = np.zeros(arrays['demand'].shape[1:-1][::-1])  # [p] or [p, r]
+    steps = []
+    for t, (ds, dp) in enumerate(realization):
+        start = time.perf_counter()
+        if t == 1:
+            model.relax_rows('InitialOrderFloor')
+        if t > 0:
+            store = window_store(t)
+            model.update_demand(store.demand)
+            if staged:
+                model.update_disruption(store.disruption)
+        model.update_initial_inventory(stock)
+        result = model.solve(warm_start=warm_start)
+        if result['status'] != 'optimal':
+            raise RuntimeError('Window starting at stage %d: %s' % (t, result['status']))
+
+        # Commit the first period of the window under the realized scenario
+        values = extract_mvars(model.variables)
+        initial = values['InitialOrders']
+        if staged:
+            additional = values['AdditionalOrders'][:, 0, ds, dp]
+            stock = values['InventoryLevels'][:, 0, ds, dp]
+            orders = initial + additional
+            cost = order_costs @ orders + holding_costs @ stock
+        else:
+            additional = values['AdditionalOrders'][:, 0, :, :, ds, dp]  # [p, s, r]
+            stock = values['InventoryLevels'][:, 0, :, ds, dp]             # [p, r]
+            orders = initial + additional.sum(axis=2)                      # [p, s]
+            cost = np.sum(order_costs.T * orders) + holding_costs @ stock.sum(axis=1)
+        seconds = time.perf_counter() - start
+        steps.append({'stage': t, 'demand_scenario': ds, 'disruption_scenario': dp, 'cost': float(cost),
+                      'window_objective': result['objective'], 'iterations': result['iterations'], 'seconds': seconds,
+                      'orders': orders, 'inventory': stock.copy()})
+        if verbose:
+            print('stage %3d  cost %10.2f  iterations %4d  %.4f s' % (t, cost, result['iterations'], seconds))
+
+    return {
+        'total_cost': float(sum(step['cost'] for step in steps)),
+        'build_seconds': build_seconds,
+        'solve_seconds': float(sum(step['seconds'] for step in steps)),
+        'cumulative_seconds': build_seconds + np.cumsum([step['seconds'] for step in steps]),
+        'realization': realization,
+        'steps': steps,
+    }
+
+
+def compare_full_horizon(instance, formulation='in18', backend='highs'):
+    # Build and solve time of the monolithic full-horizon model, for comparison
+    from sparse_lp import build_sparse_lp, solve
+
+    start = time.perf_counter()
+    lp = build_sparse_lp(instance, formulation)
+    build_seconds = time.perf_counter() - start
+    result = solve(lp, backend)
+    return {'num_vars': lp.num_vars, 'num_constrs': lp.num_constrs, 'objective': result['objective'],
+            'build_seconds': build_seconds, 'solve_seconds': result['seconds']}
+
+
+if __name__ == "__main__":
+    for formulation in ('in11', 'in18'):
+        instance = generate_instance(formulation, num_stages=52, seed=0)
+        full = compare_full_horizon(instance, formulation)
+        print(formulation, 'full horizon: %d vars, %d constrs, build %.3f s, solve %.3f s'
+              % (full['num_vars'], full['num_constrs'], full['build_seconds'], full['solve_seconds']))
+        for warm_start in (True, False):
+            result = rolling_horizon(instance, formulation, window=4, seed=1, warm_start=warm_start)
+            steps = result['steps']
+            print('  rolling W=4 %s: total cost %.2f, build %.3f s, %d windows in %.3f s (%.4f s and %.1f iterations each)'
+                  % ('warm' if warm_start else 'cold', result['total_cost'], result['build_seconds'], len(steps),
+                     result['solve_seconds'], result['solve_seconds'] / len(steps),
+                     np.mean([step['iterations'] for step in steps])))
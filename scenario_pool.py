@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Long-lived worker processes that each own a fixed chunk of scenarios.
+#
+# Decomposition methods re-solve the same per-scenario models every
+# iteration, so the models are created once inside the worker that owns them
+# and only the changing data (first-stage values, penalty terms) is sent over.
+# An exception raised by a solver is sent back and re-raised by map(), as on
+# the in-process path; the worker stays up for later calls.
+
+import multiprocessing as mp
+import os
+import pickle
+
+
+def _picklable(error):
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return RuntimeError('%s: %s' % (type(error).__name__, error))
+
+
+def _serve(connection, make_solver, payloads, options):
+    # Replies (results, None), or (None, error) once any solver raised
+    try:
+        solvers, failure = {k: make_solver(payload, **options) for k, payload in payloads.items()}, None
+    except Exception as error:
+        solvers, failure = {}, _picklable(error)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        if failure is not None:
+            connection.send((None, failure))
+            continue
+        method, common, per_scenario = message
+        try:
+            results = {}
+            for k, solver in solvers.items():
+                args = common if per_scenario is None else common + tuple(per_scenario[k])
+                results[k] = getattr(solver, method)(*args)
+            connection.send((results, None))
+        except Exception as error:
+            connection.send((None, _picklable(error)))
+    connection.close()
+
+
+class _LocalWorker:
+    # Same protocol as a worker process, run in the calling process (processes=0)
+    def __init__(self, make_solver, payloads, options):
+        self.solvers = {k: make_solver(payload, **options) for k, payload in payloads.items()}
+
+    def call(self, method, common, per_scenario):
+        return {k: getattr(solver, method)(*(common if per_scenario is None else common + tuple(per_scenario[k])))
+                for k, solver in self.solvers.items()}
+
+
+class ScenarioPool:
+    # make_solver(payload, **options) is called once per scenario inside its worker;
+    # map(method, *common, per_scenario=...) calls solver.method on every scenario concurrently
+
+    def __init__(self, make_solver, payloads, processes=None, **options):
+        self.num_scenarios = len(payloads)
+        processes = os.cpu_count() if processes is None else processes
+        self.local = None
+        self.workers = []
+        if processes <= 1:
+            self.local = _LocalWorker(make_solver, dict(enumerate(payloads)), options)
+            return
+        processes = min(processes, self.num_scenarios)
+        for w in range(processes):
+            chunk = {k: payloads[k] for k in range(w, self.num_scenarios, processes)}
+            parent, child = mp.Pipe()
+            process = mp.Process(target=_serve, args=(child, make_solver, chunk, options), daemon=True)
+            process.start()
+            child.close()
+            self.workers.append((process, parent, sorted(chunk)))
+
+    def map(self, method, *common, per_scenario=None):
+        # Results in scenario order
+        if self.local is not None:
+            results = self.local.call(method, common, per_scenario)
+        else:
+            for _, connection, owned in self.workers:
+                own_args = None if per_scenario is None else {k: per_scenario[k] for k in owned}
+                connection.send((method, common, own_args))
+            # Every worker answers before the first error is raised, so the pipes stay in step
+            results, errors = {}, []
+            for _, connection, _ in self.workers:
+                chunk, error = connection.recv()
+                if error is None:
+                    results.update(chunk)
+                else:
+                    errors.append(error)
+            if errors:
+                raise errors[0]
+        return [results[k] for k in range(self.num_scenarios)]
+
+    def close(self):
+        for process, connection, _ in self.workers:
+            try:
+                connection.send(None)
+            except OSError:
+                pass    # the worker has already exited
+            connection.close()
+            process.join()
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Scenario reduction and sample average approximation (SAA) for the
+# MTP.py models.
+#
+# Sampled demand / disruption paths are reduced separately to small
+# probability-weighted sets (the models take the cartesian product of the
+# two), turned back into the demand_scenarios / disruption_scenarios dicts the
+# builders read, and each reduced model is scored out of sample on held-out
+# paths, so model size can be traded against accuracy explicitly.
+
+import time
+
+import numpy as np
+
+from benders import RecourseSolver, split_stages
+from formulations import instance_arrays
+from instances import INSTANCES
+from scenario_pool import ScenarioPool
+from sparse_lp import build_sparse_lp, solve
+
+
+def sample_paths(instance, formulation, num_samples, seed=None, noise=0.1):
+    # Demand paths: a cell scenario drawn by its probability, scaled by lognormal noise.
+    # Disruption paths: whole cell disruption rows drawn by their probabilities, so only the
+    # joint outage patterns of the cell occur.
+    rng = np.random.default_rng(seed)
+    arrays = instance_arrays(instance, formulation)
+    base = rng.choice(len(arrays['demand_scenario_probabilities']), size=num_samples,
+                      p=arrays['demand_scenario_probabilities'])
+    demand = np.round(arrays['demand'][base] * rng.lognormal(0.0, noise, size=(num_samples,) + arrays['demand'].shape[1:]))
+    rows = rng.choice(len(arrays['disruption_scenario_probabilities']), size=num_samples,
+                      p=arrays['disruption_scenario_probabilities'])
+    disruption = arrays['disruption'][rows].astype(float)
+    return demand, disruption
+
+
+def _distances(points, centers):
+    # Euclidean distances between rows of points and rows of centers (float32 tables)
+    points, centers = points.astype(np.float32), centers.astype(np.float32)
+    squared = (points ** 2).sum(1)[:, None] - 2 * points @ centers.T + (centers ** 2).sum(1)[None, :]
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def fast_forward_selection(points, weights=None, size=None, tolerance=None, num_candidates=1000, seed=None):
+    # Heitsch-Roemisch forward selection. Candidates are a random subset of at most
+    # num_candidates points so the distance table stays (N x candidates).
+    points = np.asarray(points, dtype=float).reshape(len(points), -1)
+    num_points = len(points)
+    weights = np.full(num_points, 1.0 / num_points) if weights is None else np.asarray(weights, dtype=float)
+    size = num_points if size is None else min(size, num_points)
+    rng = np.random.default_rng(seed)
+    candidates = np.arange(num_points) if num_points <= num_candidates else np.sort(rng.choice(num_points, num_candidates, replace=False))
+    distance = _distances(points, points[candidates])  # [point, candidate]
+
+    nearest = np.full(num_points, np.inf)
+    selected = []
+    available = np.ones(len(candidates), dtype=bool)
+    while len(selected) < size:
+        # Transport cost of the unselected points if candidate u were added
+        cost = weights @ np.minimum(nearest[:, None], distance)
+        cost[~available] = np.inf
+        u = int(np.argmin(cost))
+        available[u] = False
+        selected.append(candidates[u])
+        nearest = np.minimum(nearest, distance[:, u])
+        nearest[candidates[u]] = 0.0
+        if tolerance is not None and weights @ nearest <= tolerance:
+            break
+    return _redistribute(points, weights, np.array(selected))
+
+
+def k_medoids(points, weights=None, size=8, max_iterations=50, max_cluster_candidates=500, seed=None):
+    # Weighted k-medoids: k-means++ seeding, then alternate assignment and medoid update
+    points = np.asarray(points, dtype=float).reshape(len(points), -1)
+    num_points = len(points)
+    weights = np.full(num_points, 1.0 / num_points) if weights is None else np.asarray(weights, dtype=float)
+    size = min(size, num_points)
+    rng = np.random.default_rng(seed)
+
+    medoids = [int(rng.choice(num_points, p=weights / weights.sum()))]
+    nearest = _distances(points, points[medoids])[:, 0]
+    while len(medoids) < size:
+        p = weights * nearest ** 2
+        if p.sum() == 0:
+            break
+        medoids.append(int(rng.choice(num_points, p=p / p.sum())))
+        nearest = np.minimum(nearest, _distances(points, points[medoids[-1:]])[:, 0])
+    medoids = np.array(medoids)
+
+    for _ in range(max_iterations):
+        assignment = np.argmin(_distances(points, points[medoids]), axis=1)
+        updated = medoids.copy()
+        for k in range(len(medoids)):
+            members = np.flatnonzero(assignment == k)
+            if len(members) == 0:
+                continue
+            candidates = members if len(members) <= max_cluster_candidates else rng.choice(members, max_cluster_candidates, replace=False)
+            cost = weights[members] @ _distances(points[members], points[candidates])
+            updated[k] = candidates[int(np.argmin(cost))]
+        if np.array_equal(updated, medoids):
+            break
+        medoids = updated
+    return _redistribute(points, weights, medoids)
+
+
+def _redistribute(points, weights, kept):
+    # Each dropped point moves its probability to its nearest kept point
+    assignment = np.argmin(_distances(points, points[kept]), axis=1)
+    probabilities = np.bincount(assignment, weights=weights, minlength=len(kept))
+    distance = weights @ _distances(points, points[kept])[np.arange(len(points)), assignment]
+    return kept, probabilities / probabilities.sum(), distance
+
+
+def reduce_paths(paths, size=None, tolerance=None, method='fast_forward', seed=None):
+    # Identical paths (e.g. disruption flag patterns) are merged first, exactly
+    flat = np.asarray(paths, dtype=float).reshape(len(paths), -1)
+    unique, counts = np.unique(flat, axis=0, return_counts=True)
+    weights = counts / counts.sum()
+    if size is not None and size >= len(unique) and tolerance is None:
+        kept, probabilities, distance = np.arange(len(unique)), weights, 0.0
+    elif method == 'k_medoids':
+        # k-medoids works to a size; for a distance tolerance the size is doubled until it is met
+        target = size or (1 if tolerance is not None else len(unique))
+        while True:
+            kept, probabilities, distance = k_medoids(unique, weights, target, seed=seed)
+            if tolerance is None or distance <= tolerance or target >= len(unique):
+                break
+            target = min(2 * target, len(unique))
+    else:
+        kept, probabilities, distance = fast_forward_selection(unique, weights, size, tolerance, seed=seed)
+    representatives = unique[kept].reshape((len(kept),) + np.shape(paths)[1:])
+    return representatives, probabilities, distance
+
+
+def instance_with_scenarios(instance, demand, demand_probabilities, disruption, disruption_probabilities):
+    # Scenario arrays back into the scenario dicts of the cells
+    reduced = dict(instance)
+    reduced['demand_scenarios'] = {'scenario' + str(k + 1): np.asarray(table).tolist() for k, table in enumerate(demand)}
+    reduced['demand_scenario_probabilities'] = list(demand_probabilities)
+    reduced['disruption_scenarios'] = {'scenario' + str(k + 1): np.asarray(flags).astype(int).tolist()
+                                       for k, flags in enumerate(disruption)}
+    reduced['disruption_scenario_probabilities'] = list(disruption_probabilities)
+    return reduced
+
+
+def out_of_sample_cost(instance, formulation, first_stage, demand, disruption, processes=None, backend='highs',
+                       disruption_probabilities=None):
+    # Expected cost of fixed first-stage decisions over held-out paths: the cartesian product of the
+    # held-out demand paths (uniform) and disruption patterns (disruption_probabilities, uniform by default)
+    if disruption_probabilities is None:
+        disruption_probabilities = np.full(len(disruption), 1.0 / len(disruption))
+    demand_probabilities = np.full(len(demand), 1.0 / len(demand))
+    test = instance_with_scenarios(instance, demand, demand_probabilities, disruption, disruption_probabilities)
+    lp = build_sparse_lp(test, formulation)
+    master, subproblems = split_stages(lp)
+    x = np.concatenate([np.ravel(first_stage[group]) for group, _, _ in lp.columns if group in first_stage])
+    violation = master['A'] @ x - master['rhs']
+    violation = np.where(master['sense'] == '<', violation, np.where(master['sense'] == '>', -violation, np.abs(violation)))
+    with ScenarioPool(RecourseSolver, subproblems, processes, backend=backend) as pool:
+        recourse = np.array([value for value, _, _ in pool.map('cut', x)])
+    # Subproblem k is scenario (ds, dp) = divmod(k, num_disruption); its recourse cost carries that weight
+    weight = np.outer(demand_probabilities, disruption_probabilities).ravel()
+    per_scenario = master['c'] @ x + recourse / weight
+    mean = weight @ per_scenario
+    return {
+        'mean': mean,
+        # over the held-out demand paths, the independent samples
+        'standard_error': np.sqrt(weight @ (per_scenario - mean) ** 2 / (len(demand) - 1)) if len(demand) > 1 else 0.0,
+        'max_first_stage_violation': float(max(0.0, violation.max(initial=0.0))),
+    }
+
+
+def saa_pipeline(instance, formulation, demand, disruption, sizes=(2, 5, 10, 20), method='fast_forward',
+                 num_test=200, backend='highs', processes=None, seed=None):
+    # Hold out num_test (demand, disruption) paths, reduce the rest to each target size, solve and score out
+    # of sample; held-out disruption patterns are weighted by how often they occur
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(demand))
+    test_demand, train_demand = demand[order[:num_test]], demand[order[num_test:]]
+    train_disruption = disruption[order[num_test:]]
+    test_disruption, counts = np.unique(disruption[order[:num_test]].reshape(num_test, -1), axis=0, return_counts=True)
+    test_disruption = test_disruption.reshape((-1,) + disruption.shape[1:])
+    test_disruption_probabilities = counts / counts.sum()
+    rows = []
+    for size in sizes:
+        start = time.perf_counter()
+        demand_paths, demand_probabilities, demand_distance = reduce_paths(train_demand, size, method=method, seed=seed)
+        disruption_paths, disruption_probabilities, _ = reduce_paths(train_disruption, size, method=method, seed=seed)
+        reduce_seconds = time.perf_counter() - start
+        reduced = instance_with_scenarios(instance, demand_paths, demand_probabilities, disruption_paths, disruption_probabilities)
+        lp = build_sparse_lp(reduced, formulation)
+        result = solve(lp, backend)
+        first_stage = {group: values for group, values in lp.unpack(result['x']).items()
+                       if group in ('DCInventory', 'InitialOrders')}
+        evaluation = out_of_sample_cost(instance, formulation, first_stage, test_demand, test_disruption, processes, backend,
+                                        test_disruption_probabilities)
+        rows.append({
+            'size': size, 'demand_scenarios': len(demand_paths), 'disruption_scenarios': len(disruption_paths),
+            'num_vars': lp.num_vars, 'num_constrs': lp.num_constrs, 'demand_distance': demand_distance,
+            'in_sample': result['objective'], 'out_of_sample': evaluation['mean'],
+            'out_of_sample_se': evaluation['standard_error'],
+            'first_stage_violation': evaluation['max_first_stage_violation'],
+            'reduce_seconds': reduce_seconds, 'solve_seconds': result['seconds'],
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    for formulation in ('in11', 'in18'):
+        instance = INSTANCES[formulation]()
+        demand, disruption = sample_paths(instance, formulation, 20000, seed=0)
+        for method in ('fast_forward', 'k_medoids'):
+            for row in saa_pipeline(instance, formulation, demand, disruption, sizes=(2, 5, 10), method=method,
+                                    num_test=100, processes=0, seed=0):
+                print(formulation, method, row)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Array-backed scenario data store.
+#
+# Demand, disruption flags and scenario probabilities as typed NumPy tables
+# with explicit axes:
+#
+#   demand[scenario, retailer, product, stage]    float64, NaN where a table is ragged
+#   demand[scenario, product, stage]              In[10]/In[11]
+#   disruption[scenario, supplier]                int8 flags
+#   disruption[scenario, stage]                   In[10]/In[11]
+#
+# Tables load from long-format CSV or Parquet (one row per cell, index
+# columns plus a value column) and save as .npy files. Tables above a size
+# threshold are memory-mapped read-only when loaded back, and a disk-backed
+# store pickles as its directory, so worker processes map the same pages
+# instead of receiving a copy. Attached to an instance dict as
+# instance['scenario_store'], it is what instance_arrays and every builder read.
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from formulations import STAGED, instance_arrays
+from instances import INSTANCES
+
+TABLES = ('demand', 'disruption', 'demand_probabilities', 'disruption_probabilities')
+VALUE_COLUMNS = {'demand': 'demand', 'disruption': 'disrupted',
+                 'demand_probabilities': 'probability', 'disruption_probabilities': 'probability'}
+DTYPES = {'demand': np.float64, 'disruption': np.int8,
+          'demand_probabilities': np.float64, 'disruption_probabilities': np.float64}
+
+
+def table_axes(staged):
+    return {
+        'demand': ('scenario', 'product', 'stage') if staged else ('scenario', 'retailer', 'product', 'stage'),
+        'disruption': ('scenario', 'stage') if staged else ('scenario', 'supplier'),
+        'demand_probabilities': ('scenario',),
+        'disruption_probabilities': ('scenario',),
+    }
+
+
+def _from_long(indices, values, dtype):
+    # Long table (index columns, value column) -> dense array; cells not listed are NaN (or 0 for flags).
+    # The shape is the largest index + 1 along each axis.
+    indices = np.asarray(indices, dtype=np.int64).reshape(len(indices), -1)
+    shape = tuple(int(i) + 1 for i in indices.max(axis=1)) if indices.shape[1] else ()
+    table = np.full(shape, np.nan if np.issubdtype(dtype, np.floating) else 0, dtype=dtype)
+    table[tuple(indices)] = values
+    return table
+
+
+def _to_long(table):
+    # Dense array -> (index columns, value column); NaN cells are kept so the shape survives the round trip
+    return np.indices(table.shape).reshape(table.ndim, -1), np.asarray(table).reshape(-1)
+
+
+class ScenarioStore:
+
+    def __init__(self, demand, disruption, demand_probabilities, disruption_probabilities, directory=None):
+        self.demand = demand
+        self.disruption = disruption
+        self.demand_probabilities = demand_probabilities
+        self.disruption_probabilities = disruption_probabilities
+        self.directory = directory  # set when the tables are mapped from disk
+        self._check()
+
+    def _check(self):
+        if self.demand.ndim not in (3, 4) or self.disruption.ndim != 2:
+            raise ValueError('demand must have 3 or 4 axes and disruption 2, got %d and %d'
+                             % (self.demand.ndim, self.disruption.ndim))
+        if len(self.demand) != len(self.demand_probabilities):
+            raise ValueError('%d demand scenarios but %d probabilities' % (len(self.demand), len(self.demand_probabilities)))
+        if len(self.disruption) != len(self.disruption_probabilities):
+            raise ValueError('%d disruption scenarios but %d probabilities'
+                             % (len(self.disruption), len(self.disruption_probabilities)))
+
+    @property
+    def staged(self):
+        return self.demand.ndim == 3
+
+    @property
+    def axes(self):
+        return table_axes(self.staged)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in TABLES)
+
+    def arrays(self):
+        # The scenario entries of instance_arrays
+        return {
+            'demand': self.demand,
+            'disruption': self.disruption,
+            'demand_scenario_probabilities': self.demand_probabilities,
+            'disruption_scenario_probabilities': self.disruption_probabilities,
+        }
+
+    def attach(self, instance):
+        # Copy of instance reading its scenarios from this store; the nested dicts are dropped
+        attached = {key: value for key, value in instance.items() if key not in (
+            'demand_scenarios', 'disruption_scenarios', 'demand_scenario_probabilities', 'disruption_scenario_probabilities')}
+        attached['scenario_store'] = self
+        return attached
+
+    # Construction
+
+    @classmethod
+    def from_instance(cls, instance, formulation):
+        arrays = instance_arrays(instance, formulation)
+        return cls(arrays['demand'].astype(DTYPES['demand']), arrays['disruption'].astype(DTYPES['disruption']),
+                   arrays['demand_scenario_probabilities'], arrays['disruption_scenario_probabilities'])
+
+    @classmethod
+    def from_csv(cls, directory):
+        # <table>.csv with a header of the axis names plus the value column, e.g.
+        # demand.csv: scenario,retailer,product,stage,demand
+        tables = {}
+        for name in TABLES:
+            path = os.path.join(directory, name + '.csv')
+            with open(path) as f:
+                header = f.readline().strip().split(',')
+            data = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+            value = header.index(VALUE_COLUMNS[name])
+            index_columns = [i for i in range(len(header)) if i != value]
+            tables[name] = _from_long(data[:, index_columns].T, data[:, value], DTYPES[name])
+        return cls(**tables)
+
+    @classmethod
+    def from_parquet(cls, directory):
+        import pyarrow.parquet as pq
+
+        tables = {}
+        for name in TABLES:
+            table = pq.read_table(os.path.join(directory, name + '.parquet'))
+            value = VALUE_COLUMNS[name]
+            indices = [table.column(column).to_numpy() for column in table.column_names if column != value]
+            tables[name] = _from_long(indices, table.column(value).to_numpy(), DTYPES[name])
+        return cls(**tables)
+
+    @classmethod
+    def load(cls, directory, mmap_threshold=1 << 26):
+        # .npy tables written by save(); those larger than mmap_threshold bytes are mapped read-only
+        tables = {}
+        for name in TABLES:
+            path = os.path.join(directory, name + '.npy')
+            mmap = 'r' if os.path.getsize(path) > mmap_threshold else None
+            tables[name] = np.load(path, mmap_mode=mmap)
+        store = cls(**tables, directory=os.path.abspath(directory))
+        store.mmap_threshold = mmap_threshold
+        return store
+
+    # Writers
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in TABLES:
+            np.save(os.path.join(directory, name + '.npy'), np.asarray(getattr(self, name), dtype=DTYPES[name]))
+        with open(os.path.join(directory, 'axes.json'), 'w') as f:
+            json.dump(self.axes, f)
+
+    def to_csv(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in TABLES:
+            indices, values = _to_long(getattr(self, name))
+            header = ','.join(self.axes[name] + (VALUE_COLUMNS[name],))
+            fmt = ['%d'] * len(indices) + ['%.17g' if np.issubdtype(values.dtype, np.floating) else '%d']
+            np.savetxt(os.path.join(directory, name + '.csv'), np.column_stack(list(indices) + [values]),
+                       delimiter=',', header=header, comments='', fmt=fmt)
+
+    def to_parquet(self, directory):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(directory, exist_ok=True)
+        for name in TABLES:
+            indices, values = _to_long(getattr(self, name))
+            columns = [pa.array(index.astype(np.int32)) for index in indices] + [pa.array(values)]
+            pq.write_table(pa.Table.from_arrays(columns, names=list(self.axes[name]) + [VALUE_COLUMNS[name]]),
+                           os.path.join(directory, name + '.parquet'))
+
+    def __reduce__(self):
+        # A disk-backed store is sent to worker processes as its directory and re-mapped there
+        if self.directory is not None and any(isinstance(getattr(self, name), np.memmap) for name in TABLES):
+            return ScenarioStore.load, (self.directory, self.mmap_threshold)
+        return ScenarioStore, tuple(getattr(self, name) for name in TABLES)
+
+
+def nested_bytes(value):
+    # Rough memory of nested Python lists/dicts of numbers, for comparison with the arrays
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + nested_bytes(v) for k, v in value.items())
+    elif isinstance(value, list):
+        size += sum(nested_bytes(v) for v in value)
+    return size
+
+
+if __name__ == "__main__":
+    import pickle
+    import tempfile
+
+    from instances import generate_instance
+    from sparse_lp import build_sparse_lp, solve
+
+    # Round trips and identical models for every cell
+    with tempfile.TemporaryDirectory() as directory:
+        for formulation, make in INSTANCES.items():
+            instance = make()
+            store = ScenarioStore.from_instance(instance, formulation)
+            assert store.staged == (formulation in STAGED)
+            store.to_csv(os.path.join(directory, formulation, 'csv'))
+            store.to_parquet(os.path.join(directory, formulation, 'parquet'))
+            store.save(os.path.join(directory, formulation, 'npy'))
+            expected = solve(build_sparse_lp(instance, formulation))['objective']
+            for loaded in (ScenarioStore.from_csv(os.path.join(directory, formulation, 'csv')),
+                           ScenarioStore.from_parquet(os.path.join(directory, formulation, 'parquet')),
+                           ScenarioStore.load(os.path.join(directory, formulation, 'npy'), mmap_threshold=0)):
+                objective = solve(build_sparse_lp(loaded.attach(instance), formulation))['objective']
+                assert abs(objective - expected) < 1e-6 * max(1.0, abs(expected)), (formulation, objective, expected)
+            print(formulation, 'objective %.4f from dicts, CSV, Parquet and mapped .npy' % expected)
+
+        # Memory of the nested lists vs the typed tables, and a mapped store crossing a pickle
+        instance = generate_instance('in18', num_products=500, num_demand_scenarios=20, seed=0)
+        store = ScenarioStore.from_instance(instance, 'in18')
+        print('nested dicts %.1f MB, arrays %.1f MB' % (nested_bytes(instance['demand_scenarios']) / 1e6, store.nbytes / 1e6))
+        store.save(os.path.join(directory, 'large'))
+        mapped = ScenarioStore.load(os.path.join(directory, 'large'), mmap_threshold=0)
+        payload = pickle.dumps(mapped)
+        print('pickled mapped store: %d bytes, demand %s' % (len(payload), type(pickle.loads(payload).demand).__name__))
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Scenario-tree form of the In[18]/In[20] models.
+#
+# The cells give every (demand scenario, disruption scenario) pair its own
+# additional_orders / inventory_levels for every stage. Here scenarios that
+# share their demand history up to stage t share one tree node, and the
+# recourse variables exist once per node:
+#
+#   InitialOrders[p, s], DCInventory[d, p]     first stage (root)
+#   AdditionalOrders[n, p, s, r]               node n, ordered after its demand is known
+#   InventoryLevels[n, p, r]
+#   inventory[n] = inventory[parent(n)] + orders[n] - demand[n]   (initial orders at stage 0)
+#
+# so decisions cannot depend on demand that has not been seen yet
+# (non-anticipativity by construction). The disruption scenario only enters
+# the first-stage InitialOrderFloor rows (one per disruption scenario, as in
+# the cells), so the dp copies of the recourse collapse into one. Costs and
+# constraint groups are those of formulations.py, weighted by the node
+# probabilities. A tree comes from the instance's scenario tables (common
+# prefixes merged) or from stage-wise branching factors.
+
+import numpy as np
+import scipy.sparse as sp
+
+from formulations import WITH_DC, _block, constraint_rhs, instance_arrays
+from instances import generate_instance
+from sparse_lp import SparseLP
+
+
+class ScenarioTree:
+    # Nodes in stage order. parent[n] is -1 for stage-0 nodes; probability[n] is unconditional;
+    # demand[n, r, p] is the demand seen at node n.
+
+    def __init__(self, parent, stage, probability, demand):
+        self.parent = np.asarray(parent, dtype=np.int64)
+        self.stage = np.asarray(stage, dtype=np.int64)
+        self.probability = np.asarray(probability, dtype=float)
+        self.demand = np.asarray(demand, dtype=float)
+
+    @property
+    def num_nodes(self):
+        return len(self.parent)
+
+    @property
+    def num_stages(self):
+        return int(self.stage.max()) + 1
+
+    @property
+    def leaves(self):
+        return np.flatnonzero(self.stage == self.num_stages - 1)
+
+    def paths(self):
+        # [leaf, t] node of every stage on each root-to-leaf path
+        paths = np.empty((len(self.leaves), self.num_stages), dtype=np.int64)
+        node = self.leaves
+        for t in range(self.num_stages - 1, -1, -1):
+            paths[:, t] = node
+            node = self.parent[node]
+        return paths
+
+    @classmethod
+    def from_tables(cls, arrays):
+        # Merge the demand scenarios (demand[ds, r, p, t]) along common prefixes
+        demand = arrays['demand']
+        if np.isnan(demand).any():
+            raise ValueError('Scenario trees need full demand tables')
+        num_scenarios, _, _, num_stages = demand.shape
+        probabilities = arrays['demand_scenario_probabilities']
+        parent, stage, probability, node_demand = [], [], [], []
+        previous = np.full(num_scenarios, -1)
+        for t in range(num_stages):
+            history = demand[..., :t + 1].reshape(num_scenarios, -1)
+            _, first, inverse = np.unique(np.column_stack([previous, history]), axis=0, return_index=True,
+                                          return_inverse=True)
+            nodes = len(parent) + inverse.ravel()
+            parent += previous[first].tolist()
+            stage += [t] * len(first)
+            probability += np.bincount(inverse.ravel(), weights=probabilities).tolist()
+            node_demand += list(demand[first, ..., t])
+            previous = nodes
+        tree = cls(parent, stage, probability, node_demand)
+        tree.scenario_leaf = previous - (tree.num_nodes - len(tree.leaves))  # leaf of each demand scenario
+        return tree
+
+    @classmethod
+    def branching(cls, arrays, branching, noise=0.1, seed=None):
+        # branching[t] children per stage-(t-1) node (branching[0] stage-0 nodes), each with equal conditional
+        # probability and demand = expected stage demand * uniform(1 - noise, 1 + noise) per (r, p)
+        rng = np.random.default_rng(seed)
+        mean = np.tensordot(arrays['demand_scenario_probabilities'], arrays['demand'], axes=1)  # [r, p, t]
+        parent, stage, probability, demand = [], [], [], []
+        frontier, frontier_probability = np.array([-1]), np.array([1.0])
+        for t, children in enumerate(branching):
+            nodes = np.repeat(frontier, children)
+            node_probability = np.repeat(frontier_probability, children) / children
+            frontier = len(parent) + np.arange(len(nodes))
+            parent += nodes.tolist()
+            stage += [t] * len(nodes)
+            probability += node_probability.tolist()
+            demand += list(np.round(mean[..., t] * rng.uniform(1 - noise, 1 + noise, (len(nodes),) + mean.shape[:2])))
+            frontier_probability = node_probability
+        return cls(parent, stage, probability, demand)
+
+    def scenario_size(self, num_disruption):
+        # Recourse variables of the per-scenario form over the same leaves (one copy per leaf, stage and dp)
+        return len(self.leaves) * self.num_stages * num_disruption
+
+
+def build_tree_lp(instance, formulation, tree):
+    if formulation not in ('in17', 'in18') + WITH_DC:
+        raise ValueError('Scenario trees cover In[17]/In[18]/In[20]/In[4], not ' + formulation)
+    arrays = instance_arrays(instance, formulation)
+    num_nodes = tree.num_nodes
+    _, num_retailers, num_products = tree.demand.shape
+    num_suppliers = arrays['disruption'].shape[1]
+    holding, order_costs = arrays['holding_costs'], arrays['order_costs']   # [p], [s, p]
+    probability = tree.probability
+
+    shapes = []
+    if formulation in WITH_DC:
+        shapes.append(('DCInventory', (len(arrays['distribution_center_capacity']), num_products)))
+    shapes += [
+        ('InitialOrders', (num_products, num_suppliers)),
+        ('AdditionalOrders', (num_nodes, num_products, num_suppliers, num_retailers)),
+        ('InventoryLevels', (num_nodes, num_products, num_retailers)),
+    ]
+    columns, offsets, num_vars = [], {}, 0
+    for name, shape in shapes:
+        columns.append((name, shape, num_vars))
+        offsets[name] = num_vars
+        num_vars += int(np.prod(shape))
+    sizes = dict(shapes)
+
+    # Objective: first-stage costs plus probability-weighted node costs
+    c = np.zeros(num_vars)
+    if formulation in WITH_DC:
+        c[offsets['DCInventory']:offsets['InitialOrders']] = np.tile(holding, sizes['DCInventory'][0])
+    c[offsets['InitialOrders']:offsets['AdditionalOrders']] = order_costs.T.ravel()
+    c[offsets['AdditionalOrders']:offsets['InventoryLevels']] = np.broadcast_to(
+        probability[:, None, None, None] * order_costs.T[None, :, :, None], sizes['AdditionalOrders']).ravel()
+    c[offsets['InventoryLevels']:] = np.broadcast_to(probability[:, None, None] * holding[None, :, None],
+                                                     sizes['InventoryLevels']).ravel()
+    objectives = [('total_cost', c)]
+    if formulation == 'in4':
+        # Second objective as in carbon_vectors: DC stock plus probability-weighted node orders
+        factors = arrays['carbon_emission_factors']
+        carbon = np.zeros(num_vars)
+        carbon[offsets['DCInventory']:offsets['InitialOrders']] = np.tile(factors, sizes['DCInventory'][0])
+        carbon[offsets['AdditionalOrders']:offsets['InventoryLevels']] = np.broadcast_to(
+            probability[:, None, None, None] * factors[None, :, None, None], sizes['AdditionalOrders']).ravel()
+        objectives.append(('carbon_emissions', carbon))
+
+    # First-stage rows as in the cells
+    rhs = constraint_rhs(arrays, formulation)
+    blocks = []
+    if formulation in WITH_DC:
+        num_dc = sizes['DCInventory'][0]
+        rows = np.repeat(np.arange(num_dc), num_products)
+        blocks.append(('CapacityDC', {'DCInventory': _block(rows, np.arange(num_dc * num_products), num_dc, num_dc * num_products)},
+                       '<', rhs['CapacityDC']))
+    num_disruption = arrays['disruption'].shape[0]
+    rows = np.arange(num_products * num_suppliers * num_disruption)
+    blocks.append(('InitialOrderFloor', {'InitialOrders': _block(rows, rows // num_disruption, rows.size, num_products * num_suppliers)},
+                   '>', rhs['InitialOrderFloor']))
+
+    # Balance, one row per (n, p, r)
+    inventory_shape = sizes['InventoryLevels']
+    num_rows = int(np.prod(inventory_shape))
+    n, p, r = np.indices(inventory_shape).reshape(3, -1)
+    own = np.arange(num_rows)
+    later = tree.parent[n] >= 0
+    previous = np.ravel_multi_index((np.maximum(tree.parent[n], 0), p, r), inventory_shape)
+    inventory = _block(np.concatenate([own, own[later]]), np.concatenate([own, previous[later]]), num_rows, num_rows,
+                       np.concatenate([-np.ones(num_rows), np.ones(int(later.sum()))]))
+    s = np.arange(num_suppliers)
+    additional = _block(np.repeat(own, num_suppliers),
+                        np.ravel_multi_index((n[:, None], p[:, None], s[None], r[:, None]), sizes['AdditionalOrders']).ravel(),
+                        num_rows, int(np.prod(sizes['AdditionalOrders'])))
+    first = np.flatnonzero(~later)
+    initial = _block(np.repeat(first, num_suppliers), (p[first, None] * num_suppliers + s).ravel(),
+                     num_rows, num_products * num_suppliers)
+    demand = tree.demand.transpose(0, 2, 1).ravel()                           # [n, p, r]
+    blocks.append(('Balance', {'InitialOrders': initial, 'AdditionalOrders': additional, 'InventoryLevels': inventory},
+                   '=', demand))
+    blocks.append(('MinInventory', {'InventoryLevels': sp.identity(num_rows, format='csr')}, '>',
+                   arrays['min_inventory_levels'][p]))
+
+    row_groups, matrices, senses, rhs_parts, start = [], [], [], [], 0
+    for name, coefficients, sense, block_rhs in blocks:
+        matrices.append(sp.hstack([coefficients.get(group, sp.csr_matrix((block_rhs.size, int(np.prod(shape)))))
+                                   for group, shape in shapes], format='csr'))
+        row_groups.append((name, start, start + block_rhs.size))
+        senses.append(np.full(block_rhs.size, sense))
+        rhs_parts.append(block_rhs)
+        start += block_rhs.size
+    lp = SparseLP(sp.vstack(matrices, format='csr'), np.concatenate(senses), np.concatenate(rhs_parts), c,
+                  columns=columns, rows=row_groups, objectives=objectives)
+    lp.tree = tree
+    return lp
+
+
+def scenario_view(tree, node_values):
+    # Node-indexed values [n, ...] -> per-scenario view [leaf, t, ...] along the root-to-leaf paths
+    return np.asarray(node_values)[tree.paths()]
+
+
+if __name__ == "__main__":
+    import time
+
+    from sparse_lp import build_sparse_lp, solve, solve_lexicographic
+
+    # Without shared prefixes the tree reproduces the cell model exactly
+    for formulation in ('in18', 'in20'):
+        instance = generate_instance(formulation, num_products=5, num_stages=4, num_demand_scenarios=4,
+                                     num_disruption_scenarios=3, seed=0)
+        cells = build_sparse_lp(instance, formulation)
+        tree = ScenarioTree.from_tables(instance_arrays(instance, formulation))
+        lp = build_tree_lp(instance, formulation, tree)
+        print('%s: cells %.4f (%d vars), tree %.4f (%d vars, %d nodes)' % (
+            formulation, solve(cells)['objective'], cells.num_vars, solve(lp)['objective'], lp.num_vars, tree.num_nodes))
+
+    # In[4]: the node-weighted carbon objective gives the cells' lexicographic optimum
+    instance = generate_instance('in4', num_products=5, num_stages=4, num_demand_scenarios=4,
+                                 num_disruption_scenarios=3, seed=0)
+    tree = ScenarioTree.from_tables(instance_arrays(instance, 'in4'))
+    print('in4: cells %s, tree %s' % tuple(
+        ', '.join('%s %.4f' % objective for objective in solve_lexicographic(lp)['objectives'])
+        for lp in (build_sparse_lp(instance, 'in4'), build_tree_lp(instance, 'in4', tree))))
+
+    # Scenarios agreeing on the first two stages share one node per stage there. (With these costs the
+    # optimal recourse is myopic, so anticipation gains nothing and both objectives agree.)
+    instance = generate_instance('in18', num_products=5, num_stages=4, num_demand_scenarios=4, seed=1)
+    arrays = instance_arrays(instance, 'in18')
+    demand = arrays['demand'].copy()
+    demand[..., :2] = demand[:1, ..., :2]
+    instance['demand_scenarios'] = {'scenario' + str(k + 1): table.tolist() for k, table in enumerate(demand)}
+    tree = ScenarioTree.from_tables(instance_arrays(instance, 'in18'))
+    print('shared prefix: cells %.4f, tree %.4f (nodes per stage %s)' % (
+        solve(build_sparse_lp(instance, 'in18'))['objective'], solve(build_tree_lp(instance, 'in18', tree))['objective'],
+        np.bincount(tree.stage).tolist()))
+
+    # Branching trees against the per-scenario size over the same leaves
+    instance = generate_instance('in18', num_products=3, num_stages=6, num_disruption_scenarios=3, seed=0)
+    arrays = instance_arrays(instance, 'in18')
+    for branching in ((3, 3, 3, 1, 1, 1), (2, 2, 2, 2, 2, 2), (4, 4, 4, 4, 1, 1)):
+        tree = ScenarioTree.branching(arrays, branching, seed=0)
+        start = time.perf_counter()
+        lp = build_tree_lp(instance, 'in18', tree)
+        result = solve(lp)
+        print('branching %s: %d leaves, %d nodes vs %d scenario-stage copies; %d vars, objective %.2f, %.3f s'
+              % (branching, len(tree.leaves), tree.num_nodes, tree.scenario_size(arrays['disruption'].shape[0]),
+                 lp.num_vars, result['objective'], time.perf_counter() - start))
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Shadow prices, reduced costs and sensitivity ranges of the LP models.
+#
+# After one solve every constraint group's duals (Pi), slacks and RHS ranges
+# (SARHSLow / SARHSUp), and every variable group's values, reduced costs and
+# objective ranges (SAObjLow / SAObjUp), come out in one attribute call per
+# group, scattered into arrays shaped like the group's index set, e.g.
+# Balance[p, t, r, ds, dp] (NaN where a ragged demand table has no row).
+# What-if changes of right-hand-side data (capacity, min inventory, demand)
+# or of objective data (costs, scenario probabilities) are then estimated
+# as objective + duals . delta_rhs or + delta_c . x. An estimate is flagged
+# valid when the 100% rule holds: the changes, as fractions of each row's
+# (or cost's) allowed range, add up to at most one, so the basis stays
+# optimal and the estimate is exact.
+#
+# Signs follow Gurobi: for a minimisation, Pi <= 0 on '<' rows and >= 0 on
+# '>' rows, and Pi is d objective / d rhs. The value of one more unit of DC
+# capacity is therefore -Pi of its CapacityDC row.
+
+import numpy as np
+
+from formulations import STAGED, _balance_rhs, constraint_rhs, instance_arrays, objective_vectors, variable_shapes
+from instances import INSTANCES
+
+ROW_INDEX_NAMES = {
+    'staged': {
+        'InitialOrderFloor': ('p',),
+        'Balance': ('p', 't', 'ds', 'dp'),
+        'MinInventory': ('p', 't', 'ds', 'dp'),
+    },
+    'network': {
+        'CapacityDC': ('d',),
+        'InitialOrderFloor': ('p', 's', 'dp'),
+        'Balance': ('p', 't', 'r', 'ds', 'dp'),
+        'MinInventory': ('p', 't', 'r', 'ds', 'dp'),
+    },
+}
+
+
+def row_index_names(formulation):
+    return ROW_INDEX_NAMES['staged' if formulation in STAGED else 'network']
+
+
+def row_layout(arrays, formulation):
+    # group -> (index shape, flat positions of the model's rows in it); Balance / MinInventory rows exist
+    # only where the demand table has data
+    shapes = dict(variable_shapes(arrays, formulation))
+    rhs = constraint_rhs(arrays, formulation)
+    inventory_shape = shapes['InventoryLevels']
+    kept = np.flatnonzero(~np.isnan(_balance_rhs(arrays, formulation)))
+    layout = {}
+    for group, values in rhs.items():
+        if group in ('Balance', 'MinInventory'):
+            layout[group] = (inventory_shape, kept)
+        elif group == 'InitialOrderFloor' and formulation not in STAGED:
+            layout[group] = (shapes['InitialOrders'] + (arrays['disruption'].shape[0],), np.arange(values.size))
+        else:
+            layout[group] = (values.shape, np.arange(values.size))
+    return layout
+
+
+def scatter(values, shape, positions, fill=np.nan):
+    out = np.full(int(np.prod(shape)), fill, dtype=float)
+    out[positions] = values
+    return out.reshape(shape)
+
+
+def _model_rows(constraints, attribute):
+    return {group: np.asarray(getattr(constraint, attribute), dtype=float) for group, constraint in constraints.items()}
+
+
+def extract_sensitivity(m, variables, constraints, arrays, formulation, ranges=True):
+    # Matrix-builder / PersistentModel model after optimize(); ranges=False skips the SA attributes
+    layout = row_layout(arrays, formulation)
+    row_attributes = {'dual': 'Pi', 'slack': 'Slack', 'rhs': 'RHS'}
+    column_attributes = {'value': 'X', 'reduced_cost': 'RC'}
+    if ranges:
+        row_attributes.update(rhs_low='SARHSLow', rhs_up='SARHSUp')
+        column_attributes.update(obj_low='SAObjLow', obj_up='SAObjUp')
+    rows = {group: {} for group in constraints}
+    for key, attribute in row_attributes.items():
+        for group, values in _model_rows(constraints, attribute).items():
+            shape, positions = layout[group]
+            rows[group][key] = scatter(values, shape, positions)
+    columns = {group: {key: np.asarray(getattr(variable, attribute), dtype=float)
+                       for key, attribute in column_attributes.items()} for group, variable in variables.items()}
+    return {'formulation': formulation, 'objective': m.ObjVal, 'rows': rows, 'columns': columns}
+
+
+def from_lp(lp, result, arrays, formulation):
+    # The same arrays from a SparseLP solve result (HiGHS and friends report no ranges)
+    layout = row_layout(arrays, formulation)
+    slack = lp.rhs - lp.A @ result['x']
+    rows = {}
+    for group, start, end in lp.rows:
+        if group not in layout:
+            continue
+        shape, positions = layout[group]
+        rows[group] = {'dual': scatter(result['duals'][start:end], shape, positions),
+                       'slack': scatter(slack[start:end], shape, positions),
+                       'rhs': scatter(lp.rhs[start:end], shape, positions)}
+    values, reduced_costs = lp.unpack(result['x']), lp.unpack(result['reduced_costs'])
+    columns = {group: {'value': values[group], 'reduced_cost': reduced_costs[group]} for group in values}
+    return {'formulation': formulation, 'objective': result['objective'], 'rows': rows, 'columns': columns}
+
+
+def sensitivity(instance, formulation='in18', threads=None):
+    # Build, solve and extract. In[4] is analysed on its cost objective (the priority-1 objective).
+    from gurobipy import GRB
+
+    from matrix_builder import build_matrix_model
+
+    arrays = instance_arrays(instance, formulation)
+    m, variables, constraints = build_matrix_model(instance, formulation, arrays)
+    if m.NumObj > 1:
+        m.setObjective(sum(c @ variables[group].reshape(-1) for group, c in objective_vectors(arrays, formulation).items()),
+                       GRB.MINIMIZE)
+    m.Params.OutputFlag = 0
+    if threads is not None:
+        m.Params.Threads = threads
+    m.optimize()
+    if m.Status != GRB.OPTIMAL:
+        raise RuntimeError('%s: status %d' % (formulation, m.Status))
+    return extract_sensitivity(m, variables, constraints, arrays, formulation)
+
+
+def rhs_marginals(sens, arrays, formulation):
+    # d objective / d parameter for the right-hand-side data, shaped like the parameters
+    rows, staged = sens['rows'], formulation in STAGED
+    marginals = {}
+    if 'CapacityDC' in rows:
+        marginals['distribution_center_capacity'] = rows['CapacityDC']['dual']
+    minimum = np.zeros_like(np.asarray(arrays['min_inventory_levels'], dtype=float))
+    if 'MinInventory' in rows:
+        dual = rows['MinInventory']['dual']
+        minimum += np.nansum(dual.reshape(len(dual), -1), axis=1)
+    if 'InitialOrderFloor' in rows:
+        dual = rows['InitialOrderFloor']['dual']
+        minimum += dual if staged else np.einsum('psd,ds->p', dual, 1 - arrays['disruption'])
+    marginals['min_inventory_levels'] = minimum
+    balance = np.nan_to_num(rows['Balance']['dual'])
+    if staged:
+        # rhs[p, t, ds, dp] = demand[ds, p, t] * (1 - disruption[dp, t])
+        marginals['demand'] = np.einsum('ptsd,dt->spt', balance, 1 - arrays['disruption'])
+    else:
+        marginals['demand'] = balance.sum(axis=-1).transpose(3, 2, 0, 1)
+    return marginals
+
+
+def _fraction(delta, value, low, up):
+    # Share of the allowed range each change uses (inf when outside it)
+    allowed = np.where(delta > 0, up - value, value - low)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.where(delta == 0, 0.0, np.abs(delta) / allowed)
+    return float(np.nansum(fraction))
+
+
+def estimate(sens, arrays, formulation, **overrides):
+    # Linear objective estimate for new parameter values, e.g. estimate(sens, arrays, 'in20',
+    # distribution_center_capacity=[400, 400]); no re-solve. Overrides are full arrays.
+    updated = dict(arrays)
+    updated.update({name: np.asarray(value, dtype=float) for name, value in overrides.items()})
+    layout = row_layout(arrays, formulation)
+    objective = sens['objective']
+    rhs_fraction = cost_fraction = 0.0
+    new_rhs = constraint_rhs(updated, formulation)
+    for group, row in sens['rows'].items():
+        shape, positions = layout[group]
+        delta = np.nan_to_num(scatter(new_rhs[group], shape, positions) - row['rhs'])
+        if not delta.any():
+            continue
+        objective += float(np.nansum(row['dual'] * delta))
+        if 'rhs_low' in row:
+            rhs_fraction += _fraction(delta, row['rhs'], row['rhs_low'], row['rhs_up'])
+        else:
+            rhs_fraction = np.inf
+    old_c, new_c = objective_vectors(arrays, formulation), objective_vectors(updated, formulation)
+    for group, c in new_c.items():
+        column = sens['columns'][group]
+        delta = (c - old_c[group]).reshape(column['value'].shape)
+        if not delta.any():
+            continue
+        objective += float(np.sum(delta * column['value']))
+        if 'obj_low' in column:
+            cost_fraction += _fraction(delta, old_c[group].reshape(delta.shape), column['obj_low'], column['obj_up'])
+        else:
+            cost_fraction = np.inf
+    # The 100% rule covers one kind of change at a time
+    valid = rhs_fraction <= 1 and cost_fraction <= 1 and not (rhs_fraction > 0 and cost_fraction > 0)
+    return {'objective': objective, 'valid': bool(valid), 'rhs_fraction': rhs_fraction, 'cost_fraction': cost_fraction}
+
+
+if __name__ == "__main__":
+    import time
+
+    from persistent_model import PersistentModel
+
+    for formulation in ('in11', 'in18', 'in20'):
+        instance = INSTANCES[formulation](seed=0) if formulation == 'in20' else INSTANCES[formulation]()
+        arrays = instance_arrays(instance, formulation)
+        start = time.perf_counter()
+        sens = sensitivity(instance, formulation)
+        extract_seconds = time.perf_counter() - start
+        marginals = rhs_marginals(sens, arrays, formulation)
+        print(formulation, 'objective %.2f, analysis %.3f s' % (sens['objective'], extract_seconds))
+        print('  rows:', {group: row['dual'].shape for group, row in sens['rows'].items()})
+        print('  d objective / d min_inventory_levels:', np.round(marginals['min_inventory_levels'], 3))
+        if 'distribution_center_capacity' in marginals:
+            print('  d objective / d distribution_center_capacity:', marginals['distribution_center_capacity'])
+
+        # Estimates against full re-solves
+        model = PersistentModel(instance, formulation)
+        cases = {
+            'min inventory +1': {'min_inventory_levels': arrays['min_inventory_levels'] + 1},
+            'min inventory +50%': {'min_inventory_levels': arrays['min_inventory_levels'] * 1.5},
+            'holding -5%': {'holding_costs': arrays['holding_costs'] * 0.95},
+        }
+        if 'distribution_center_capacity' in marginals:
+            cases['DC capacity 400'] = {'distribution_center_capacity': np.full_like(arrays['distribution_center_capacity'], 400)}
+        for name, overrides in cases.items():
+            guess = estimate(sens, arrays, formulation, **overrides)
+            for parameter, value in overrides.items():
+                if parameter == 'min_inventory_levels':
+                    model.update_min_inventory(value)
+                elif parameter == 'distribution_center_capacity':
+                    model.update_capacity(value)
+                else:
+                    model.update_costs(**{parameter: value})
+            actual = model.solve()['objective']
+            print('  %-20s estimate %10.2f (guaranteed by the ranges: %-5s) re-solve %10.2f'
+                  % (name, guess['objective'], guess['valid'], actual))
+            model = PersistentModel(instance, formulation)
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Local optimization service.
+#
+# A long-running asyncio server takes JSON problem specs over TCP (one JSON
+# object per line) and answers with one JSON line per request:
+#
+#   {"id": 7, "formulation": "in20", "cell": {"seed": 0}}                  a cell instance
+#   {"id": 8, "formulation": "in18", "generate": {"num_products": 20}}     generate_instance(...)
+#   {"id": 9, "formulation": "in18", "instance": {...}, "backend": "gurobi", "params": {"Method": 1},
+#    "solution": true}                                                       explicit data, values per group
+#   {"op": "metrics"}
+#
+# Models are built and solved in a pool of worker processes that each start
+# one Gurobi environment up front (license check and log setup once per
+# worker, not per request) with a fixed solver thread count, so processes x
+# threads bounds the cores in use. Requests with the same instance_key as
+# one already in flight wait for that solve instead of starting another;
+# at most max_queue distinct solves are queued or running, further requests
+# are rejected. Every response carries its queue time and latency; the
+# metrics op reports counts, queue depth and latency percentiles.
+#
+#   python service.py serve --port 8765 --processes 4 --threads 1
+#   python service.py load-test --requests 400 --concurrency 1 8 32
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from instances import INSTANCES, generate_instance
+from solution_cache import instance_key
+from sparse_lp import build_sparse_lp, solve, solve_lexicographic
+
+_ENV = None
+_BACKEND_OPTIONS = {}
+
+
+def _init_worker(threads):
+    # One warm Gurobi environment per worker process
+    global _ENV
+    try:
+        import gurobipy
+    except ImportError:
+        return
+    _ENV = gurobipy.Env(empty=True)
+    _ENV.setParam('OutputFlag', 0)
+    _ENV.setParam('Threads', threads)
+    _ENV.start()
+    _BACKEND_OPTIONS['gurobi'] = {'env': _ENV}
+
+
+def _ping():
+    return os.getpid()
+
+
+def spec_instance(spec):
+    if 'instance' in spec:
+        return spec['instance']
+    if 'generate' in spec:
+        return generate_instance(spec['formulation'], **spec['generate'])
+    make = INSTANCES[spec['formulation']]
+    options = spec.get('cell', {})
+    return make(**options) if options else make()
+
+
+def run_spec(spec):
+    # Worker side: build, solve, report timings (wall-clock start so the server can compute queue time)
+    started = time.time()
+    formulation = spec['formulation']
+    backend = spec.get('backend', 'gurobi' if _ENV is not None else 'highs')
+    options = dict(_BACKEND_OPTIONS.get(backend, {}), **spec.get('params', {}))
+    start = time.perf_counter()
+    lp = build_sparse_lp(spec_instance(spec), formulation)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    result = (solve_lexicographic if len(lp.objectives) > 1 else solve)(lp, backend, **options)
+    response = {
+        'status': result['status'] if isinstance(result['status'], str) else 'status %s' % result['status'],
+        'objective': result['objective'],
+        'num_vars': lp.num_vars,
+        'num_constrs': lp.num_constrs,
+        'backend': backend,
+        'worker': os.getpid(),
+        'started': started,
+        'build_seconds': build_seconds,
+        'solve_seconds': time.perf_counter() - start,
+    }
+    if spec.get('solution') and result['x'] is not None:
+        response['solution'] = {group: values.tolist() for group, values in lp.unpack(result['x']).items()}
+    return response
+
+
+class OptimizationService:
+
+    def __init__(self, processes=None, threads=1, max_queue=64, telemetry=None):
+        self.processes = processes or max(1, (os.cpu_count() or 1) // threads)
+        self.threads = threads
+        self.max_queue = max_queue
+        self.telemetry = telemetry
+        self.executor = ProcessPoolExecutor(self.processes, initializer=_init_worker, initargs=(threads,))
+        self.in_flight = {}
+        self.pending = 0
+        self.counts = {'requests': 0, 'solves': 0, 'coalesced': 0, 'rejected': 0, 'errors': 0}
+        self.max_pending = 0
+        self.latency = deque(maxlen=10000)
+        self.queue_time = deque(maxlen=10000)
+        self.server = None
+
+    async def warm_up(self):
+        # Start every worker (and its environment) before the first request
+        loop = asyncio.get_running_loop()
+        return sorted(set(await asyncio.gather(*[loop.run_in_executor(self.executor, _ping)
+                                                  for _ in range(self.processes)])))
+
+    async def _solve(self, key, spec):
+        # The slot in self.pending is reserved by submit()
+        self.counts['solves'] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, run_spec, spec)
+        except Exception as error:
+            self.counts['errors'] += 1
+            return {'status': 'error', 'error': '%s: %s' % (type(error).__name__, error)}
+        finally:
+            self.pending -= 1
+            del self.in_flight[key]
+
+    async def submit(self, spec):
+        received = time.time()
+        self.counts['requests'] += 1
+        spec = {k: v for k, v in spec.items() if k != 'id'}
+        key = instance_key(spec, spec.get('formulation'), spec.get('backend'))
+        coalesced = key in self.in_flight
+        if coalesced:
+            self.counts['coalesced'] += 1
+        elif self.pending >= self.max_queue:
+            self.counts['rejected'] += 1
+            return {'status': 'rejected', 'reason': 'queue full (%d)' % self.max_queue}
+        else:
+            # Reserve the slot before yielding, so a burst read in one go cannot overrun max_queue
+            self.pending += 1
+            self.max_pending = max(self.max_pending, self.pending)
+            self.in_flight[key] = asyncio.ensure_future(self._solve(key, spec))
+        result = dict(await asyncio.shield(self.in_flight[key]) if coalesced else await self.in_flight[key])
+        result['coalesced'] = coalesced
+        result['queue_seconds'] = max(0.0, result.pop('started', received) - received)
+        result['latency_seconds'] = time.time() - received
+        self.latency.append(result['latency_seconds'])
+        self.queue_time.append(result['queue_seconds'])
+        if self.telemetry is not None:
+            self.telemetry.emit('request', formulation=spec.get('formulation'), status=result['status'],
+                                coalesced=coalesced, queue_seconds=result['queue_seconds'],
+                                latency_seconds=result['latency_seconds'])
+        return result
+
+    def metrics(self):
+        latency, queue_time = np.array(self.latency), np.array(self.queue_time)
+        percentiles = (50, 95, 99)
+
+        def summary(values):
+            return dict(zip(['p%d' % q for q in percentiles], np.percentile(values, percentiles).tolist())) if len(values) else {}
+
+        return dict(self.counts, pending=self.pending, max_pending=self.max_pending, processes=self.processes,
+                    threads=self.threads, latency_seconds=summary(latency), queue_seconds=summary(queue_time))
+
+    async def _handle(self, reader, writer):
+        lock = asyncio.Lock()
+
+        async def send(response):
+            async with lock:
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+
+        async def answer(spec):
+            try:
+                response = self.metrics() if spec.get('op') == 'metrics' else await self.submit(spec)
+            except Exception as error:
+                response = {'status': 'error', 'error': '%s: %s' % (type(error).__name__, error)}
+            if 'id' in spec:
+                response['id'] = spec['id']
+            await send(response)
+
+        tasks = set()
+        while line := await reader.readline():
+            try:
+                spec = json.loads(line)
+            except json.JSONDecodeError as error:
+                await send({'status': 'error', 'error': 'invalid JSON: %s' % error})
+                continue
+            if not isinstance(spec, dict):
+                await send({'status': 'error', 'error': 'request must be a JSON object, not %s' % type(spec).__name__})
+                continue
+            task = asyncio.ensure_future(answer(spec))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        writer.close()
+
+    async def start(self, host='127.0.0.1', port=8765):
+        await self.warm_up()
+        self.server = await asyncio.start_server(self._handle, host, port, limit=1 << 26)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown()
+
+
+class ServiceClient:
+    # One connection; concurrent requests are matched to their responses by id
+
+    def __init__(self, host='127.0.0.1', port=8765):
+        self.host, self.port = host, port
+        self.ids = itertools.count()
+        self.waiting = {}
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=1 << 26)
+        self.listener = asyncio.ensure_future(self._listen())
+        return self
+
+    async def _listen(self):
+        while line := await self.reader.readline():
+            response = json.loads(line)
+            future = self.waiting.pop(response.get('id'), None)
+            if future is not None:
+                future.set_result(response)
+
+    async def request(self, spec):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[request_id] = future
+        self.writer.write(json.dumps(dict(spec, id=request_id)).encode() + b'\n')
+        await self.writer.drain()
+        return await future
+
+    async def metrics(self):
+        return await self.request({'op': 'metrics'})
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.listener.cancel()
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+async def load_test(host, port, specs, num_requests, concurrency):
+    # num_requests requests cycling through specs, at most `concurrency` outstanding
+    async with ServiceClient(host, port) as client:
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(spec):
+            async with gate:
+                start = time.perf_counter()
+                response = await client.request(spec)
+                return time.perf_counter() - start, response
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[one(specs[k % len(specs)]) for k in range(num_requests)])
+        seconds = time.perf_counter() - start
+        metrics = await client.metrics()
+    latency = np.array([latency for latency, _ in results])
+    statuses = [response['status'] for _, response in results]
+    return {
+        'concurrency': concurrency,
+        'requests': num_requests,
+        'throughput': num_requests / seconds,
+        'latency_p50': float(np.percentile(latency, 50)),
+        'latency_p95': float(np.percentile(latency, 95)),
+        'queue_p50': float(np.median([response.get('queue_seconds', 0.0) for _, response in results])),
+        'coalesced': sum(response.get('coalesced', False) for _, response in results),
+        'ok': statuses.count('optimal'),
+        'rejected': statuses.count('rejected'),
+        'metrics': metrics,
+    }
+
+
+def cold_run_seconds(spec):
+    # The status quo: a fresh interpreter imports, builds and solves one spec
+    code = 'import json, service; service._init_worker(1); service.run_spec(json.loads(%r))' % json.dumps(spec)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+async def _serve(args):
+    service = OptimizationService(args.processes, args.threads, args.max_queue)
+    host, port = await service.start(args.host, args.port)
+    print('serving on %s:%d with %d workers x %d threads' % (host, port, service.processes, service.threads))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.close()
+
+
+async def _load_test(args):
+    specs = [{'formulation': formulation, 'generate': {'num_products': 3 + k % 5, 'seed': k}}
+             for k, formulation in zip(range(args.distinct), itertools.cycle(('in11', 'in18', 'in20')))]
+    service = None
+    host, port = args.host, args.port
+    if port is None:
+        service = OptimizationService(args.processes, args.threads, args.max_queue)
+        host, port = await service.start(host, 0)
+    print('cold script per request: %.3f s' % cold_run_seconds(specs[0]))
+    for concurrency in args.concurrency:
+        result = await load_test(host, port, specs, args.requests, concurrency)
+        print('concurrency %3d: %7.1f requests/s, latency p50 %.4f s p95 %.4f s, queue p50 %.4f s, '
+              '%d coalesced, %d rejected, %d optimal'
+              % (concurrency, result['throughput'], result['latency_p50'], result['latency_p95'], result['queue_p50'],
+                 result['coalesced'], result['rejected'], result['ok']))
+    if service is not None:
+        print('server metrics:', json.dumps(service.metrics()))
+        await service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('serve', 'load-test'):
+        command = commands.add_parser(name)
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--port', type=int, default=8765 if name == 'serve' else None,
+                             help='load-test: server to target; default starts one in-process')
+        command.add_argument('--processes', type=int, default=None)
+        command.add_argument('--threads', type=int, default=1)
+        command.add_argument('--max-queue', type=int, default=64)
+        if name == 'load-test':
+            command.add_argument('--requests', type=int, default=200)
+            command.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+            command.add_argument('--distinct', type=int, default=12, help='distinct specs the requests cycle through')
+    args = parser.parse_args()
+    asyncio.run(_serve(args) if args.command == 'serve' else _load_test(args))
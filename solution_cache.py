@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Content-addressed on-disk cache of solved models.
+#
+# Entries are keyed by a SHA-256 of the canonical JSON of every model input
+# plus the formulation name and FORMULATION_VERSION, and stored as one .npz
+# file each (objective, primal vector, duals and reduced costs where the
+# backend returns them). Writes go through a temporary file and an atomic
+# rename; eviction (least recently used first, bounded by bytes and entry
+# count) and the shared hit/miss counters run under a lock file, so several
+# processes can use one cache directory.
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from formulations import FORMULATION_VERSION
+from instances import INSTANCES
+from sparse_lp import build_sparse_lp, solve
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _array_digest(array):
+    # Numeric tables are hashed as dtype + shape + raw bytes (as float64, so list and array forms agree)
+    array = np.ascontiguousarray(array, dtype=np.float64)
+    digest = hashlib.sha256(array.dtype.str.encode() + repr(array.shape).encode() + array.tobytes()).hexdigest()
+    return {'__array__': digest}
+
+
+def _canonical(value):
+    if hasattr(value, 'arrays'):  # attached ScenarioStore
+        return _canonical(value.arrays())
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, np.ndarray) and value.dtype.kind in 'biuf':
+        return _array_digest(value)
+    if isinstance(value, (list, tuple, np.ndarray)):
+        try:
+            return _array_digest(np.asarray(value, dtype=np.float64))
+        except (ValueError, TypeError):  # ragged or non-numeric
+            return [_canonical(v) for v in value]
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    return value
+
+
+def instance_key(instance, formulation, backend, **options):
+    # Same inputs -> same key, independent of dict order and of list vs array containers.
+    # backend is required: results of different solvers are never interchangeable.
+    payload = {'formulation': formulation, 'version': FORMULATION_VERSION, 'backend': backend,
+               'instance': _canonical(instance), 'options': _canonical(options)}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+class SolutionCache:
+
+    def __init__(self, directory, max_bytes=1 << 30, max_entries=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self.lock_path = os.path.join(directory, '.lock')
+        self.stats_path = os.path.join(directory, 'stats.json')
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def _count(self, **increments):
+        with self._locked():
+            stats = self._read_stats()
+            for name, value in increments.items():
+                stats[name] = stats.get(name, 0) + value
+            with open(self.stats_path, 'w') as f:
+                json.dump(stats, f)
+
+    def _read_stats(self):
+        try:
+            with open(self.stats_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                entry = {name: data[name] for name in data.files}
+            os.utime(path)  # recency for LRU eviction
+        except (OSError, ValueError):
+            # Missing, or removed by another process's eviction in between
+            self._count(misses=1)
+            return None
+        self._count(hits=1)
+        result = {name: (value.item() if value.ndim == 0 else value) for name, value in entry.items()}
+        result['cached'] = True
+        return result
+
+    def put(self, key, result):
+        arrays = {name: np.asarray(result[name]) for name in ('objective', 'x', 'duals', 'reduced_costs', 'status')
+                  if result.get(name) is not None}
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temporary, self._path(key))
+        self._count(puts=1)
+        self.evict()
+
+    def evict(self):
+        # Least recently used entries go first until both bounds hold
+        with self._locked():
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith('.npz'):
+                    try:
+                        info = os.stat(os.path.join(self.directory, name))
+                    except OSError:
+                        continue
+                    entries.append((info.st_mtime, info.st_size, name))
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            evicted = 0
+            while entries and (total > self.max_bytes or (self.max_entries is not None and len(entries) > self.max_entries)):
+                _, size, name = entries.pop(0)
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                total -= size
+                evicted += 1
+            if evicted:
+                stats = self._read_stats()
+                stats['evictions'] = stats.get('evictions', 0) + evicted
+                with open(self.stats_path, 'w') as f:
+                    json.dump(stats, f)
+
+    def stats(self):
+        with self._locked():
+            stats = self._read_stats()
+            sizes = [os.path.getsize(os.path.join(self.directory, name))
+                     for name in os.listdir(self.directory) if name.endswith('.npz')]
+        hits, misses = stats.get('hits', 0), stats.get('misses', 0)
+        stats.update({
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'entries': len(sizes),
+            'bytes': sum(sizes),
+        })
+        return stats
+
+    def clear(self):
+        with self._locked():
+            for name in os.listdir(self.directory):
+                if name.endswith('.npz') or name == 'stats.json':
+                    os.remove(os.path.join(self.directory, name))
+
+
+def cached_solve(cache, instance, formulation='in18', backend='highs'):
+    # A hit skips both the model build and the solve
+    key = instance_key(instance, formulation, backend)
+    result = cache.get(key)
+    if result is not None:
+        return result
+    result = solve(build_sparse_lp(instance, formulation), backend)
+    if result['status'] == 'optimal':
+        cache.put(key, result)
+    result['cached'] = False
+    return result
+
+
+if __name__ == "__main__":
+    cache = SolutionCache(os.path.join(tempfile.gettempdir(), 'mtp_solution_cache'), max_entries=100)
+    for formulation in ('in11', 'in18', 'in20'):
+        instance = INSTANCES[formulation](seed=0) if formulation == 'in20' else INSTANCES[formulation]()
+        for _ in range(2):
+            start = time.perf_counter()
+            result = cached_solve(cache, instance, formulation)
+            print(formulation, 'cached' if result['cached'] else 'solved', result['objective'],
+                  '%.4f s' % (time.perf_counter() - start))
+    print(cache.stats())
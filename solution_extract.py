@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Bulk solution extraction.
+#
+# Instead of one v.varName / v.x lookup and one formatted print per variable,
+# all values come out in a single call per variable group as NumPy arrays
+# shaped like the index sets, e.g. InventoryLevels[p, t, r, ds, dp]. They can
+# be written as .npz/.npy or Parquet (long format, index columns plus value)
+# and reduced to expected / aggregated views. Printing is opt-in (debug).
+
+import os
+
+import numpy as np
+
+from formulations import STAGED, instance_arrays, scenario_weights
+from instances import INSTANCES
+
+INDEX_NAMES = {
+    'staged': {
+        'InitialOrders': ('p',),
+        'AdditionalOrders': ('p', 't', 'ds', 'dp'),
+        'InventoryLevels': ('p', 't', 'ds', 'dp'),
+    },
+    'network': {
+        'DCInventory': ('d', 'p'),
+        'InitialOrders': ('p', 's'),
+        'AdditionalOrders': ('p', 't', 's', 'r', 'ds', 'dp'),
+        'InventoryLevels': ('p', 't', 'r', 'ds', 'dp'),
+    },
+}
+
+
+def index_names(formulation):
+    return INDEX_NAMES['staged' if formulation in STAGED else 'network']
+
+
+def extract_mvars(variables):
+    # {group: MVar} of the matrix builder / PersistentModel -> {group: values}
+    return {group: np.asarray(variable.X) for group, variable in variables.items()}
+
+
+def extract_model(m, shapes):
+    # Any gurobipy model whose variables were added group by group (the loop cells included):
+    # one getAttr call, then split and reshape
+    values = np.asarray(m.getAttr('X', m.getVars()))
+    solution, start = {}, 0
+    for group, shape in shapes:
+        size = int(np.prod(shape))
+        solution[group] = values[start:start + size].reshape(shape)
+        start += size
+    return solution
+
+
+def extract_lp(lp, result):
+    # SparseLP solve result -> {group: values}
+    return lp.unpack(result['x'])
+
+
+def save_npz(solution, path, compressed=True):
+    (np.savez_compressed if compressed else np.savez)(path, **solution)
+
+
+def save_npy(solution, directory):
+    # One .npy per group, loadable with np.load(..., mmap_mode='r')
+    os.makedirs(directory, exist_ok=True)
+    for group, values in solution.items():
+        np.save(os.path.join(directory, group + '.npy'), values)
+
+
+def to_arrow(values, names):
+    # Long-format table: one int32 column per index plus a value column, built from arrays only
+    import pyarrow as pa
+
+    indices = np.indices(values.shape, dtype=np.int32).reshape(values.ndim, -1)
+    columns = [pa.array(index) for index in indices] + [pa.array(np.ravel(values))]
+    return pa.Table.from_arrays(columns, names=list(names) + ['value'])
+
+
+def save_parquet(solution, directory, formulation):
+    import pyarrow.parquet as pq
+
+    os.makedirs(directory, exist_ok=True)
+    names = index_names(formulation)
+    for group, values in solution.items():
+        pq.write_table(to_arrow(values, names[group]), os.path.join(directory, group + '.parquet'))
+
+
+def expected(values, weight):
+    # Expectation over the trailing (ds, dp) scenario axes
+    return np.tensordot(values, weight, axes=([-2, -1], [0, 1]))
+
+
+def aggregate(values, names, by, weight=None, nonzero=False):
+    # Keep the axes in `by`, take the expectation over (ds, dp) if weighted, sum over the rest.
+    # nonzero=True counts positive entries instead of summing values.
+    if weight is not None and names[-2:] == ('ds', 'dp'):
+        values, names = expected(values, weight), names[:-2]
+    if nonzero:
+        values = (values > 0).astype(float)
+    axes = tuple(i for i, name in enumerate(names) if name not in by)
+    return values.sum(axis=axes) if axes else values
+
+
+def expected_inventory(solution, instance, formulation, by=('p', 't')):
+    # e.g. expected inventory per product and stage
+    weight = scenario_weights(instance_arrays(instance, formulation))
+    return aggregate(solution['InventoryLevels'], index_names(formulation)['InventoryLevels'], by, weight)
+
+
+def select(values, names, **index):
+    # Filtered view, e.g. select(values, names, p=0, ds=1)
+    return values[tuple(index.get(name, slice(None)) for name in names)]
+
+
+def print_solution(solution, debug=False, limit=None):
+    # The per-variable listing of the cells, only when debugging
+    if not debug:
+        return
+    printed = 0
+    for group, values in solution.items():
+        for index in np.ndindex(*values.shape):
+            print(f"{group}[{','.join(map(str, index))}]: {values[index]}")
+            printed += 1
+            if limit is not None and printed >= limit:
+                return
+
+
+if __name__ == "__main__":
+    from sparse_lp import build_sparse_lp, solve
+
+    for formulation in ('in11', 'in18'):
+        instance = INSTANCES[formulation]()
+        lp = build_sparse_lp(instance, formulation)
+        solution = extract_lp(lp, solve(lp))
+        print(formulation, {group: values.shape for group, values in solution.items()})
+        print('Expected inventory per product/stage:')
+        print(expected_inventory(solution, instance, formulation))
+        print_solution(solution, debug=False)
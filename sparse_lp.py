@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Solver-agnostic sparse LP for the MTP.py formulations.
+#
+# SparseLP holds one CSR constraint matrix with row senses and right-hand
+# sides, column bounds and cost vectors, assembled with NumPy/SciPy only. The
+# same object can be solved with HiGHS (scipy.optimize, no license needed),
+# with Gurobi when gurobipy is available, or written out as MPS/LP files.
+
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+
+from formulations import FORMULATIONS, carbon_vectors, constraint_blocks, instance_arrays, objective_vectors, variable_shapes
+from instances import INSTANCES
+
+
+class SparseLP:
+    # min c @ x  s.t.  A @ x (sense) rhs,  lb <= x <= ub
+    #
+    # columns: [(group name, shape, first column)], in column order
+    # rows:    [(group name, first row, stop row)], in row order
+    # objectives: extra named cost vectors in priority order (In[4] carbon)
+
+    def __init__(self, A, sense, rhs, c, lb=None, ub=None, columns=None, rows=None, objectives=None, obj_constant=0.0):
+        self.A = sp.csr_matrix(A)
+        self.sense = np.asarray(sense, dtype='<U1')
+        self.rhs = np.asarray(rhs, dtype=float)
+        self.c = np.asarray(c, dtype=float)
+        num_vars = self.A.shape[1]
+        self.lb = np.zeros(num_vars) if lb is None else np.asarray(lb, dtype=float)
+        self.ub = np.full(num_vars, np.inf) if ub is None else np.asarray(ub, dtype=float)
+        self.columns = columns or [('x', (num_vars,), 0)]
+        self.rows = rows or [('c', 0, self.A.shape[0])]
+        self.objectives = objectives or [('objective', self.c)]
+        self.obj_constant = obj_constant
+
+    @property
+    def num_vars(self):
+        return self.A.shape[1]
+
+    @property
+    def num_constrs(self):
+        return self.A.shape[0]
+
+    def column_slice(self, name):
+        for group, shape, start in self.columns:
+            if group == name:
+                return slice(start, start + int(np.prod(shape)))
+        raise KeyError(name)
+
+    def row_slice(self, name):
+        for group, start, stop in self.rows:
+            if group == name:
+                return slice(start, stop)
+        raise KeyError(name)
+
+    def unpack(self, x):
+        # Flat primal vector -> {group: array shaped like its index set}
+        return {group: np.asarray(x[start:start + int(np.prod(shape))]).reshape(shape)
+                for group, shape, start in self.columns}
+
+    def var_names(self):
+        # Names in the style of gurobipy addVars/addMVar: InitialOrders[0,1]
+        names = []
+        for group, shape, _ in self.columns:
+            names += [group + '[' + ','.join(map(str, index)) + ']' for index in np.ndindex(*shape)]
+        return names
+
+    def row_names(self):
+        names = []
+        for group, start, stop in self.rows:
+            names += [group + '[' + str(i) + ']' for i in range(stop - start)]
+        return names
+
+
+def build_sparse_lp(instance, formulation='in18'):
+    arrays = instance_arrays(instance, formulation)
+
+    # Column layout: variable groups in cell order
+    columns, offsets, num_vars = [], {}, 0
+    for name, shape in variable_shapes(arrays, formulation):
+        columns.append((name, shape, num_vars))
+        offsets[name] = num_vars
+        num_vars += int(np.prod(shape))
+
+    def flat_vector(vectors):
+        c = np.zeros(num_vars)
+        for name, values in vectors.items():
+            c[offsets[name]:offsets[name] + values.size] = values
+        return c
+
+    # Row layout: one block of rows per constraint group
+    rows, data, row_index, col_index, senses, rhs = [], [], [], [], [], []
+    num_rows = 0
+    for name, coefficients, sense, block_rhs in constraint_blocks(arrays, formulation):
+        for group, block in coefficients.items():
+            block = block.tocoo()
+            data.append(block.data)
+            row_index.append(block.row + num_rows)
+            col_index.append(block.col + offsets[group])
+        rows.append((name, num_rows, num_rows + block_rhs.size))
+        senses.append(np.full(block_rhs.size, sense))
+        rhs.append(block_rhs)
+        num_rows += block_rhs.size
+    A = sp.csr_matrix((np.concatenate(data), (np.concatenate(row_index), np.concatenate(col_index))),
+                      shape=(num_rows, num_vars))
+
+    objectives = [('total_cost', flat_vector(objective_vectors(arrays, formulation)))]
+    if formulation == 'in4':
+        objectives.append(('carbon_emissions', flat_vector(carbon_vectors(arrays, formulation))))
+    return SparseLP(A, np.concatenate(senses), np.concatenate(rhs), objectives[0][1],
+                    columns=columns, rows=rows, objectives=objectives)
+
+
+def _result(backend, status, objective, x, duals, reduced_costs, seconds):
+    return {'backend': backend, 'status': status, 'objective': objective, 'x': x,
+            'duals': duals, 'reduced_costs': reduced_costs, 'seconds': seconds}
+
+
+def solve_highs(lp, time_limit=None):
+    # HiGHS through scipy.optimize.linprog; duals follow Gurobi's Pi sign convention
+    start = time.perf_counter()
+    upper, lower, equal = lp.sense == '<', lp.sense == '>', lp.sense == '='
+    inequality = upper | lower
+    flip = np.where(lower, -1.0, 1.0)
+    A_ub = sp.diags(flip[inequality]) @ lp.A[inequality]
+    options = {} if time_limit is None else {'time_limit': time_limit}
+    res = linprog(lp.c, A_ub=A_ub if inequality.any() else None, b_ub=(flip * lp.rhs)[inequality] if inequality.any() else None,
+                  A_eq=lp.A[equal] if equal.any() else None, b_eq=lp.rhs[equal] if equal.any() else None,
+                  bounds=np.column_stack([lp.lb, lp.ub]), method='highs', options=options)
+    seconds = time.perf_counter() - start
+    if res.status != 0:
+        return _result('highs', res.message, None, None, None, None, seconds)
+    duals = np.zeros(lp.num_constrs)
+    if inequality.any():
+        duals[inequality] = flip[inequality] * res.ineqlin.marginals
+    if equal.any():
+        duals[equal] = res.eqlin.marginals
+    reduced_costs = res.lower.marginals + res.upper.marginals
+    return _result('highs', 'optimal', res.fun + lp.obj_constant, res.x, duals, reduced_costs, seconds)
+
+
+def to_gurobi(lp, env=None):
+    # gurobipy.Model with one MVar per column group, constraints added group by group
+    from gurobipy import GRB, Model, concatenate
+
+    # Rows are added group by group, so the groups must tile A's rows exactly
+    stops = [0] + [stop for _, _, stop in lp.rows]
+    if [start for _, start, _ in lp.rows] != stops[:-1] or np.any(np.diff(stops) < 0) or stops[-1] != lp.num_constrs:
+        raise ValueError('lp.rows %s do not cover rows 0..%d of A contiguously'
+                         % ([(start, stop) for _, start, stop in lp.rows], lp.num_constrs))
+
+    m = Model(env=env) if env is not None else Model()
+    groups = []
+    for name, shape, start in lp.columns:
+        columns = slice(start, start + int(np.prod(shape)))
+        group = m.addMVar(shape, lb=lp.lb[columns].reshape(shape), ub=lp.ub[columns].reshape(shape),
+                          obj=lp.c[columns].reshape(shape), vtype=GRB.CONTINUOUS, name=name)
+        groups.append(group.reshape(-1))
+    x = concatenate(groups)
+    m.ObjCon = lp.obj_constant
+    m.ModelSense = GRB.MINIMIZE
+    for name, start, stop in lp.rows:
+        m.addMConstr(lp.A[start:stop], x, lp.sense[start:stop], lp.rhs[start:stop], name=name)
+    m.update()
+    return m, x
+
+
+def gurobi_status(code):
+    # Gurobi status code -> the status string of _result: 'optimal', or the lower-case status name
+    from gurobipy import GRB
+
+    if code == GRB.OPTIMAL:
+        return 'optimal'
+    names = {getattr(GRB.Status, name): name.lower() for name in dir(GRB.Status) if name.isupper()}
+    return names.get(code, 'status %s' % code)
+
+
+def solve_gurobi(lp, env=None, **params):
+    from gurobipy import GRB
+
+    start = time.perf_counter()
+    m, x = to_gurobi(lp, env)
+    m.Params.OutputFlag = 0
+    for key, value in params.items():
+        m.setParam(key, value)
+    m.optimize()
+    seconds = time.perf_counter() - start
+    if m.Status != GRB.OPTIMAL:
+        return _result('gurobi', gurobi_status(m.Status), None, None, None, None, seconds)
+    return _result('gurobi', 'optimal', m.ObjVal, x.X, np.array(m.getAttr('Pi', m.getConstrs())), x.RC, seconds)
+
+
+BACKENDS = {'highs': solve_highs, 'gurobi': solve_gurobi}
+
+
+def solve(lp, backend='highs', **options):
+    return BACKENDS[backend](lp, **options)
+
+
+def solve_lexicographic(lp, backend='highs', tolerance=1e-6, **options):
+    # Objectives in priority order; each solve keeps the earlier ones at their optimum
+    A, sense, rhs, rows, values = lp.A, lp.sense, lp.rhs, list(lp.rows), []
+    for name, c in lp.objectives:
+        stage = SparseLP(A, sense, rhs, c, lp.lb, lp.ub, lp.columns, rows)
+        result = solve(stage, backend, **options)
+        if result['status'] != 'optimal':
+            return result
+        values.append((name, result['objective']))
+        rows.append((name + '_bound', A.shape[0], A.shape[0] + 1))
+        A = sp.vstack([A, sp.csr_matrix(c)], format='csr')
+        sense = np.append(sense, '<')
+        rhs = np.append(rhs, result['objective'] + tolerance * max(1.0, abs(result['objective'])))
+    result['objectives'] = values
+    result['objective'] = values[0][1]
+    return result
+
+
+def write_mps(lp, path):
+    # Free-format MPS with the group-style names of var_names()/row_names()
+    var_names, row_names = lp.var_names(), lp.row_names()
+    mps_sense = {'<': 'L', '>': 'G', '=': 'E'}
+    A = lp.A.tocsc()
+    with open(path, 'w') as f:
+        f.write('NAME supply_chain_resilience\nROWS\n N obj\n')
+        f.writelines(' %s %s\n' % (mps_sense[s], name) for s, name in zip(lp.sense, row_names))
+        f.write('COLUMNS\n')
+        for j, name in enumerate(var_names):
+            if lp.c[j]:
+                f.write(' %s obj %r\n' % (name, float(lp.c[j])))
+            for k in range(A.indptr[j], A.indptr[j + 1]):
+                f.write(' %s %s %r\n' % (name, row_names[A.indices[k]], float(A.data[k])))
+        f.write('RHS\n')
+        f.writelines(' rhs %s %r\n' % (row_names[i], float(lp.rhs[i])) for i in np.flatnonzero(lp.rhs))
+        if lp.obj_constant:
+            f.write(' rhs obj %r\n' % -lp.obj_constant)
+        f.write('BOUNDS\n')
+        for j, name in enumerate(var_names):
+            lb, ub = lp.lb[j], lp.ub[j]
+            if lb == ub:
+                f.write(' FX bnd %s %r\n' % (name, float(lb)))
+                continue
+            if lb != 0:
+                f.write(' MI bnd %s\n' % name if lb == -np.inf else ' LO bnd %s %r\n' % (name, float(lb)))
+            if ub != np.inf:
+                f.write(' UP bnd %s %r\n' % (name, float(ub)))
+        f.write('ENDATA\n')
+
+
+def write_lp(lp, path):
+    # CPLEX LP format
+    var_names, row_names = lp.var_names(), lp.row_names()
+    lp_sense = {'<': '<=', '>': '>=', '=': '='}
+
+    def terms(indices, values):
+        return ' '.join('%s %r %s' % ('-' if v < 0 else '+', abs(float(v)), var_names[j]) for j, v in zip(indices, values))
+
+    with open(path, 'w') as f:
+        nonzero = np.flatnonzero(lp.c)
+        f.write('Minimize\n obj: %s%s\nSubject To\n' % (terms(nonzero, lp.c[nonzero]),
+                                                       ' + %r' % lp.obj_constant if lp.obj_constant else ''))
+        A = lp.A
+        for i, name in enumerate(row_names):
+            row = slice(A.indptr[i], A.indptr[i + 1])
+            f.write(' %s: %s %s %r\n' % (name, terms(A.indices[row], A.data[row]), lp_sense[lp.sense[i]], float(lp.rhs[i])))
+        f.write('Bounds\n')
+        for j, name in enumerate(var_names):
+            lb, ub = lp.lb[j], lp.ub[j]
+            if lb == 0 and ub == np.inf:
+                continue
+            f.write(' %s <= %s <= %s\n' % ('-inf' if lb == -np.inf else repr(float(lb)), name,
+                                          'inf' if ub == np.inf else repr(float(ub))))
+        f.write('End\n')
+
+
+if __name__ == "__main__":
+    for formulation in FORMULATIONS:
+        lp = build_sparse_lp(INSTANCES[formulation](), formulation)
+        highs = solve(lp, 'highs')
+        print(formulation, lp.num_vars, 'vars', lp.num_constrs, 'constrs', 'HiGHS:', highs['objective'])
+        try:
+            gurobi = solve(lp, 'gurobi')
+        except ImportError:
+            continue
+        print(formulation, 'Gurobi:', gurobi['objective'], 'difference:', abs(gurobi['objective'] - highs['objective']))
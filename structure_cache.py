@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Compiled model-structure cache keyed by shape signature.
+#
+# Everything about a cell model except its numbers is fixed by the index
+# dimensions: the column layout (variable groups, shapes, offsets, hence the
+# variable names), the row layout and senses, and the coefficient pattern,
+# whose entries are all +1 / -1. Only the right-hand sides, bounds and costs
+# change from run to run. compile_structure() builds the constraint matrix
+# once per shape signature (formulation, FORMULATION_VERSION, variable
+# shapes and, for ragged demand tables, the pattern of stages with data);
+# StructureCache keeps it on disk as one directory of .npy files
+#
+#   <directory>/<signature>/indptr.npy, indices.npy   int32 CSR pattern
+#                           data.npy                   int8 coefficients
+#                           sense.npy                  '<' / '>' / '=' per row, as SparseLP takes it
+#                           layout.json                column and row groups
+#
+# loaded back memory-mapped, so a later run only computes the numeric
+# vectors (constraint_rhs, objective_vectors) and wraps them around the
+# mapped pattern in a SparseLP. Entries are written to a temporary
+# directory and renamed into place, so concurrent processes never see a
+# partial entry.
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from formulations import (FORMULATION_VERSION, _balance_rhs, carbon_vectors, constraint_blocks, constraint_rhs,
+                          instance_arrays, objective_vectors, variable_shapes)
+from instances import generate_instance
+from sparse_lp import SparseLP, build_sparse_lp, solve
+
+FILES = ('indptr', 'indices', 'data', 'sense')
+
+
+def shape_signature(arrays, formulation):
+    # Same signature -> same structure
+    payload = {'formulation': formulation, 'version': FORMULATION_VERSION,
+               'shapes': [[name, list(shape)] for name, shape in variable_shapes(arrays, formulation)]}
+    missing = np.isnan(_balance_rhs(arrays, formulation))
+    if missing.any():
+        payload['missing'] = hashlib.sha256(np.packbits(missing).tobytes()).hexdigest()
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class Structure:
+    # Shape-dependent part of a SparseLP: CSR pattern, senses and the column / row layout
+
+    def __init__(self, indptr, indices, data, sense, columns, rows, signature):
+        self.indptr, self.indices, self.data, self.sense = indptr, indices, data, sense
+        self.columns = columns      # [(name, shape, start)]
+        self.rows = rows            # [(name, start, stop)]
+        self.signature = signature
+
+    @property
+    def num_vars(self):
+        name, shape, start = self.columns[-1]
+        return start + int(np.prod(shape))
+
+    @property
+    def num_constrs(self):
+        return len(self.indptr) - 1
+
+    def matrix(self):
+        return sp.csr_matrix((self.data.astype(np.float64), self.indices, self.indptr),
+                             shape=(self.num_constrs, self.num_vars), copy=False)
+
+    def fill(self, arrays, formulation):
+        # SparseLP of this shape with the numeric data of arrays
+        rhs = constraint_rhs(arrays, formulation)
+        offsets = {name: start for name, shape, start in self.columns}
+
+        def flat_vector(vectors):
+            c = np.zeros(self.num_vars)
+            for name, values in vectors.items():
+                c[offsets[name]:offsets[name] + values.size] = values
+            return c
+
+        objectives = [('total_cost', flat_vector(objective_vectors(arrays, formulation)))]
+        if formulation == 'in4':
+            objectives.append(('carbon_emissions', flat_vector(carbon_vectors(arrays, formulation))))
+        return SparseLP(self.matrix(), self.sense, np.concatenate([rhs[name] for name, start, stop in self.rows]),
+                        objectives[0][1], columns=self.columns, rows=self.rows, objectives=objectives)
+
+
+def compile_structure(arrays, formulation):
+    # The Python build of the coefficient pattern, done once per signature
+    columns, offsets, num_vars = [], {}, 0
+    for name, shape in variable_shapes(arrays, formulation):
+        columns.append((name, tuple(shape), num_vars))
+        offsets[name] = num_vars
+        num_vars += int(np.prod(shape))
+    rows, data, row_index, col_index, senses = [], [], [], [], []
+    num_rows = 0
+    for name, coefficients, sense, block_rhs in constraint_blocks(arrays, formulation):
+        for group, block in coefficients.items():
+            block = block.tocoo()
+            data.append(block.data)
+            row_index.append(block.row + num_rows)
+            col_index.append(block.col + offsets[group])
+        rows.append((name, num_rows, num_rows + block_rhs.size))
+        senses.append(np.full(block_rhs.size, sense))
+        num_rows += block_rhs.size
+    A = sp.csr_matrix((np.concatenate(data), (np.concatenate(row_index), np.concatenate(col_index))),
+                      shape=(num_rows, num_vars))
+    return Structure(A.indptr.astype(np.int32), A.indices.astype(np.int32), A.data.astype(np.int8),
+                     np.concatenate(senses), columns, rows, shape_signature(arrays, formulation))
+
+
+class StructureCache:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, signature):
+        return os.path.join(self.directory, signature)
+
+    def get(self, signature):
+        path = self._path(signature)
+        try:
+            with open(os.path.join(path, 'layout.json')) as f:
+                layout = json.load(f)
+            arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in FILES}
+        except (OSError, ValueError):
+            return None
+        columns = [(name, tuple(shape), start) for name, shape, start in layout['columns']]
+        rows = [tuple(row) for row in layout['rows']]
+        return Structure(arrays['indptr'], arrays['indices'], arrays['data'], arrays['sense'], columns, rows, signature)
+
+    def put(self, structure):
+        temporary = tempfile.mkdtemp(dir=self.directory, suffix='.tmp')
+        for name in FILES:
+            np.save(os.path.join(temporary, name + '.npy'), getattr(structure, name))
+        with open(os.path.join(temporary, 'layout.json'), 'w') as f:
+            json.dump({'columns': structure.columns, 'rows': structure.rows}, f)
+        try:
+            os.rename(temporary, self._path(structure.signature))
+        except OSError:
+            # Another process stored the same signature first
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    def structure(self, arrays, formulation):
+        signature = shape_signature(arrays, formulation)
+        structure = self.get(signature)
+        if structure is not None:
+            self.hits += 1
+            return structure
+        self.misses += 1
+        structure = compile_structure(arrays, formulation)
+        self.put(structure)
+        return structure
+
+    def build(self, instance, formulation='in18'):
+        # Drop-in for build_sparse_lp(): the pattern from the cache, the numbers from the instance
+        arrays = instance_arrays(instance, formulation)
+        return self.structure(arrays, formulation).fill(arrays, formulation)
+
+    def clear(self):
+        for entry in os.listdir(self.directory):
+            shutil.rmtree(self._path(entry), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp()
+    cache = StructureCache(directory)
+
+    # Every cell formulation: the cached build is the same LP as build_sparse_lp()
+    from instances import INSTANCES
+    for formulation, make in INSTANCES.items():
+        instance = make()
+        reference, cached = build_sparse_lp(instance, formulation), cache.build(instance, formulation)
+        same = ((reference.A != cached.A).nnz == 0 and np.array_equal(reference.sense, cached.sense)
+                and np.array_equal(reference.rhs, cached.rhs) and np.array_equal(reference.c, cached.c)
+                and reference.columns == cached.columns and reference.rows == cached.rows)
+        print('%s: identical LP %s' % (formulation, same))
+
+    # Startup to first solve on a large shape: new numbers every run, same dimensions
+    for formulation in ('in18', 'in20'):
+        timings = {'build_sparse_lp': [], 'cache (compile)': [], 'cache (hit)': []}
+        for run in range(3):
+            instance = generate_instance(formulation, num_products=2000, num_stages=12, num_retailers=3,
+                                         num_demand_scenarios=5, num_disruption_scenarios=4, seed=run)
+            start = time.perf_counter()
+            lp = build_sparse_lp(instance, formulation)
+            timings['build_sparse_lp'].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            cached = cache.build(instance, formulation)
+            timings['cache (compile)' if run == 0 else 'cache (hit)'].append(time.perf_counter() - start)
+            assert np.array_equal(lp.rhs, cached.rhs) and np.array_equal(lp.c, cached.c)
+        print('%s %d vars, %d rows, %d nonzeros: %s' % (
+            formulation, lp.num_vars, lp.num_constrs, lp.A.nnz,
+            ', '.join('%s %.3f s' % (name, np.mean(values)) for name, values in timings.items())))
+    print('cache hits %d, misses %d, %.1f MB on disk' % (cache.hits, cache.misses, sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names) / 1e6))
+
+    # Same objective as the Python build on a solvable size
+    instance = generate_instance('in18', num_products=200, num_stages=6, seed=0)
+    print('objective build_sparse_lp %.6f, cached %.6f' % (
+        solve(build_sparse_lp(instance, 'in18'))['objective'], solve(cache.build(instance, 'in18'))['objective']))
+    shutil.rmtree(directory)
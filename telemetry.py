@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Phase-level timing and solver telemetry.
+#
+# A Telemetry object times named phases (data preparation, model build,
+# presolve, simplex/barrier, extraction), records the model size after each
+# one, samples solver progress from a Gurobi callback at a fixed wall-clock
+# interval and writes every event as one JSON line. The build phase can also
+# be profiled with cProfile. A disabled Telemetry hands out a no-op phase
+# context and no callback, so instrumented code pays next to nothing.
+#
+#   telemetry = Telemetry('run.jsonl', interval=0.5, profile='build.prof')
+#   run_instrumented(in20_instance(seed=0), 'in20', telemetry)
+
+import cProfile
+import json
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+from gurobipy import GRB
+
+from formulations import instance_arrays, variable_shapes
+from instances import INSTANCES
+from matrix_builder import build_loop_model, build_matrix_model
+from solution_extract import extract_model, extract_mvars
+
+_NULL = nullcontext()
+_PROGRESS = (GRB.Callback.SIMPLEX, GRB.Callback.BARRIER, GRB.Callback.MIP)
+
+
+def model_size(m):
+    m.update()
+    return {'num_vars': m.NumVars, 'num_constrs': m.NumConstrs, 'num_nonzeros': m.NumNZs}
+
+
+class Telemetry:
+
+    def __init__(self, path=None, enabled=True, interval=1.0, profile=None, run=None):
+        # path=None writes to stdout; profile is the .prof file for the build phase
+        self.enabled = enabled
+        self.interval = interval
+        self.profile = profile
+        self.run = run
+        self.events = []
+        self._file = open(path, 'a') if enabled and path is not None else None
+        self._start = time.perf_counter()
+
+    def emit(self, event, **fields):
+        if not self.enabled:
+            return
+        record = {'event': event, 'time': time.perf_counter() - self._start}
+        if self.run is not None:
+            record['run'] = self.run
+        record.update(fields)
+        self.events.append(record)
+        print(json.dumps(record), file=self._file or sys.stdout, flush=self._file is None)
+
+    def phase(self, name, model=None, profile=False):
+        # model: a gurobipy model, or a callable returning one, whose size is recorded when the phase ends
+        if not self.enabled:
+            return _NULL
+        return self._phase(name, model, profile and self.profile is not None)
+
+    @contextmanager
+    def _phase(self, name, model, profile):
+        profiler = cProfile.Profile() if profile else None
+        start = time.perf_counter()
+        error = None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        except BaseException as exception:
+            error = type(exception).__name__
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(self.profile)
+            fields = {'phase': name, 'seconds': time.perf_counter() - start}
+            if error is not None:
+                # The model may not exist; the body's exception propagates unchanged
+                fields['error'] = error
+            else:
+                if callable(model):
+                    model = model()
+                if model is not None:
+                    fields.update(model_size(model))
+            if profiler is not None:
+                fields['profile'] = self.profile
+            self.emit('phase', **fields)
+
+    def callback(self):
+        # Gurobi callback sampling progress every `interval` seconds, or None when disabled
+        if not self.enabled:
+            return None
+        state = {'last': -self.interval, 'presolve_end': None}
+
+        def progress(model, where):
+            if where not in _PROGRESS:
+                return
+            runtime = model.cbGet(GRB.Callback.RUNTIME)
+            if state['presolve_end'] is None:
+                state['presolve_end'] = runtime
+                self.emit('phase', phase='presolve', seconds=runtime)
+            if runtime - state['last'] < self.interval:
+                return
+            if where == GRB.Callback.SIMPLEX:
+                state['last'] = runtime
+                self.emit('progress', algorithm='simplex', runtime=runtime,
+                          iterations=model.cbGet(GRB.Callback.SPX_ITRCNT),
+                          objective=model.cbGet(GRB.Callback.SPX_OBJVAL),
+                          primal_infeasibility=model.cbGet(GRB.Callback.SPX_PRIMINF),
+                          dual_infeasibility=model.cbGet(GRB.Callback.SPX_DUALINF))
+            elif where == GRB.Callback.BARRIER:
+                state['last'] = runtime
+                primal, dual = model.cbGet(GRB.Callback.BARRIER_PRIMOBJ), model.cbGet(GRB.Callback.BARRIER_DUALOBJ)
+                self.emit('progress', algorithm='barrier', runtime=runtime,
+                          iterations=model.cbGet(GRB.Callback.BARRIER_ITRCNT),
+                          objective=primal, bound=dual, gap=abs(primal - dual) / max(abs(primal), 1e-10))
+            elif where == GRB.Callback.MIP:
+                state['last'] = runtime
+                best, bound = model.cbGet(GRB.Callback.MIP_OBJBST), model.cbGet(GRB.Callback.MIP_OBJBND)
+                self.emit('progress', algorithm='mip', runtime=runtime,
+                          nodes=model.cbGet(GRB.Callback.MIP_NODCNT),
+                          iterations=model.cbGet(GRB.Callback.MIP_ITRCNT),
+                          objective=best, bound=bound,
+                          gap=abs(best - bound) / max(abs(best), 1e-10) if best < GRB.INFINITY else None)
+
+        progress.state = state
+        return progress
+
+    def optimize(self, m):
+        # m.optimize() split into presolve and solve phases, with a final summary event
+        callback = self.callback()
+        if callback is None:
+            m.optimize()
+            return
+        m.optimize(callback)
+        presolve = callback.state['presolve_end'] or 0.0
+        self.emit('phase', phase='solve', seconds=m.Runtime - presolve, status=m.Status,
+                  iterations=m.IterCount, barrier_iterations=m.BarIterCount)
+        self.emit('solution', status=m.Status, objective=m.ObjVal if m.SolCount else None, runtime=m.Runtime)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_instrumented(instance, formulation='in18', telemetry=None, builder='matrix', **params):
+    # One fully instrumented build-solve-extract run; telemetry=None runs it uninstrumented
+    telemetry = telemetry or Telemetry(enabled=False)
+    telemetry.emit('start', formulation=formulation, builder=builder)
+    with telemetry.phase('prepare'):
+        arrays = instance_arrays(instance, formulation)
+    if builder == 'matrix':
+        with telemetry.phase('build', model=lambda: m, profile=True):
+            m, variables, _ = build_matrix_model(instance, formulation, arrays)
+    else:
+        with telemetry.phase('build', model=lambda: m, profile=True):
+            m = build_loop_model(instance, formulation)
+    m.Params.OutputFlag = 0
+    for name, value in params.items():
+        m.setParam(name, value)
+    telemetry.optimize(m)
+    with telemetry.phase('extract'):
+        if builder == 'matrix':
+            solution = extract_mvars(variables)
+        else:
+            solution = extract_model(m, variable_shapes(arrays, formulation))
+    return m, solution
+
+
+if __name__ == "__main__":
+    import os
+
+    from instances import generate_instance
+
+    with Telemetry(interval=0.01) as telemetry:
+        for formulation in ('in18', 'in20'):
+            run_instrumented(INSTANCES[formulation](), formulation, telemetry)
+        run_instrumented(generate_instance('in20', num_products=10, seed=0), 'in20', telemetry, builder='loop', Method=2)
+
+    # Overhead: uninstrumented vs instrumented runs
+    instance = generate_instance('in20', num_products=10, seed=0)
+    for enabled in (False, True):
+        start = time.perf_counter()
+        for _ in range(20):
+            with Telemetry(os.devnull, enabled=enabled) as telemetry:
+                run_instrumented(instance, 'in20', telemetry)
+        print('telemetry', 'on' if enabled else 'off', '%.4f s per run' % ((time.perf_counter() - start) / 20))